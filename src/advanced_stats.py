@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import spearmanr
+from rank_correlation import rank_columns, spearman_matrix
 import os
 
 FILE_PATH = "Master_QURAL_Analysis.xlsx"
@@ -18,14 +18,13 @@ def calculate_thesis_metrics():
     
     pivot_df = df.pivot_table(index="Original_Story", columns="Model", values="Total_Score", aggfunc="mean").dropna()
     
+    avg_ranks, _, _ = rank_columns(pivot_df[models].values)
+    spearman = spearman_matrix(avg_ranks)
+    k = len(models)
+
     consistency_scores = {}
-    for model in models:
-        correlations = []
-        for other_model in models:
-            if model != other_model:
-                corr, _ = spearmanr(pivot_df[model], pivot_df[other_model])
-                correlations.append(corr)
-        avg_corr = np.mean(correlations)
+    for i, model in enumerate(models):
+        avg_corr = (spearman[i].sum() - 1.0) / (k - 1)
         consistency_scores[model] = max(0, avg_corr) 
         print(f"   {model} Average Rank Correlation: {avg_corr:.4f}")
 
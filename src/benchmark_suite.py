@@ -0,0 +1,343 @@
+# src/benchmark_suite.py
+"""
+Benchmark suite for the analytics stack on synthetic masters (synthetic_master.py).
+
+Times the agreement statistics, pivoting, rank correlations, text metrics,
+the merge step and the chart scripts over a grid of stories x models, appends
+every measurement to outputs/benchmarks/Benchmark_History.csv and compares the
+run with the previous run on the same host:
+
+    regression = slower than the previous run by more than REGRESSION_TOLERANCE
+                 (and by at least REGRESSION_MIN_SECONDS)
+
+A benchmark that takes longer than TIME_BUDGET at one size is skipped at the
+larger sizes of the same run. Grid points over MAX_ROWS (stories x models) are
+not generated at all; benchmarks that need Excel files on disk (merge, charts)
+are limited to EXCEL_MAX_ROWS rows, and pairwise_metrics to frames that carry
+text (synthetic_master.TEXT_MAX_ROWS). The in-memory statistics run up to
+MAX_ROWS, e.g. 10^6 stories x 10 models.
+
+Every selected benchmark has to be able to run: missing packages or data (nltk
+punkt / wordnet for the text metrics, seaborn for visualize) stop the suite
+before anything is timed, and a benchmark that raises aborts the run, so the
+history only ever holds real measurements. Leave a benchmark out with --only.
+
+Usage:
+    python src/benchmark_suite.py --quick
+    python src/benchmark_suite.py                         # default grid
+    python src/benchmark_suite.py --stories 1000,1000000 --models 5 --only build_pivot,icc_2_1
+    python src/benchmark_suite.py --fail-on-regression    # exit 1 on regressions (CI)
+"""
+import contextlib
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import matplotlib
+matplotlib.use("Agg")
+
+from synthetic_master import CRITERIA, generate_master
+
+OUT_DIR = Path("outputs/benchmarks")
+HISTORY = OUT_DIR / "Benchmark_History.csv"
+
+STORIES = (1_000, 10_000, 100_000)
+MODELS = (5, 20, 50)
+QUICK_GRID = ((1_000,), (5,))
+MAX_ROWS = 10_000_000       # stories x models per synthetic master (~2 GiB per 5M rows)
+EXCEL_MAX_ROWS = 100_000    # merge / chart benchmarks write the master to Excel first
+TIME_BUDGET = 60.0          # seconds; slower benchmarks are not run at larger sizes
+REPEAT = 3                  # best of REPEAT for benchmarks under REPEAT_UNDER seconds
+REPEAT_UNDER = 1.0
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_MIN_SECONDS = 0.05
+TEXT_MODELS = 2             # pairwise_metrics compares the first two models' evidence text
+
+RESULT_COLUMNS = ["Run", "Host", "Commit", "Python", "Numpy", "Pandas", "CPUs", "Benchmark",
+                  "Stories", "Models", "Rows", "Seconds_Best", "Seconds_Mean", "Repeats", "Status"]
+
+
+# ---------------- benchmarks: setup(df, tmp) -> zero-argument callable to time ----------------
+
+def bench_krippendorff_alpha(df, tmp):
+    from compute_agreement_metrics import build_pivot, krippendorff_alpha_ordinal
+    values = build_pivot(df, "Acceptance Criteria_Score").values
+    return lambda: krippendorff_alpha_ordinal(values, 0, 2)
+
+
+def bench_icc_2_1(df, tmp):
+    from compute_agreement_metrics import build_pivot, icc_2_1
+    values = build_pivot(df, "Total_Score").values
+    return lambda: icc_2_1(values)
+
+
+def bench_build_pivot(df, tmp):
+    from compute_agreement_metrics import build_pivot
+    return lambda: build_pivot(df, "Total_Score")
+
+
+def bench_rank_correlation(df, tmp):
+    from compute_agreement_metrics import build_pivot
+    from rank_correlation import rank_correlation_cube
+    cols = ["Total_Score", "Tier_1_Score", "Tier_2_Score"] + [f"{c}_Score" for c in CRITERIA]
+    pivots = {col: build_pivot(df, col) for col in cols}
+    models = sorted(df["Model"].unique())
+    return lambda: rank_correlation_cube(pivots, models)
+
+
+def bench_pairwise_metrics(df, tmp):
+    if "Testable_Text" not in df.columns:
+        raise SkipBenchmark("no text columns at this size")
+    from compute_text_similarity_metrics import build_evidence_text, pairwise_metrics
+    models = sorted(df["Model"].unique())[:TEXT_MODELS]
+    pair = df[df["Model"].isin(models)].copy()
+    pair["Evidence_Text"] = pair.apply(build_evidence_text, axis=1)
+    texts = pair.pivot_table(index="Original_Story", columns="Model", values="Evidence_Text", aggfunc="first")
+    refs, cands = texts[models[0]].tolist(), texts[models[1]].tolist()
+    return lambda: pairwise_metrics(refs, cands, backend="hashed")
+
+
+def _excel_master(df, tmp):
+    if len(df) > EXCEL_MAX_ROWS:
+        raise SkipBenchmark(f"more than EXCEL_MAX_ROWS={EXCEL_MAX_ROWS} rows")
+    path = Path(tmp) / "Master_QURAL_Analysis.xlsx"
+    if not path.exists():
+        df.to_excel(path, index=False)
+    return path
+
+
+def bench_merge_all_excels(df, tmp):
+    import merge_results
+    if len(df) > EXCEL_MAX_ROWS:
+        raise SkipBenchmark(f"more than EXCEL_MAX_ROWS={EXCEL_MAX_ROWS} rows")
+    out_dir = Path(tmp) / "outputs_with_text"
+    for model, g in df.groupby("Model"):
+        (out_dir / model).mkdir(parents=True, exist_ok=True)
+        g.to_excel(out_dir / model / "Detailed_Synthetic.xlsx", index=False)
+    merge_results.OUTPUT_DIR = str(out_dir)
+    merge_results.FINAL_FILE = str(Path(tmp) / "Merged_Master.xlsx")
+    return lambda: _quiet(merge_results.merge_all_excels)
+
+
+def bench_visualize(df, tmp):
+    import visualize
+    visualize.FILE_NAME = str(_excel_master(df, tmp))
+    return lambda: _in_dir(tmp, visualize.create_charts)
+
+
+def bench_make_element_charts(df, tmp):
+    import make_element_charts
+    make_element_charts.MASTER = str(_excel_master(df, tmp))
+    make_element_charts.OUT_DIR = Path(tmp)
+    return lambda: _quiet(make_element_charts.main)
+
+
+BENCHMARKS = {
+    "krippendorff_alpha_ordinal": bench_krippendorff_alpha,
+    "icc_2_1": bench_icc_2_1,
+    "build_pivot": bench_build_pivot,
+    "rank_correlation_cube": bench_rank_correlation,
+    "pairwise_metrics": bench_pairwise_metrics,
+    "merge_all_excels": bench_merge_all_excels,
+    "visualize": bench_visualize,
+    "make_element_charts": bench_make_element_charts,
+}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def _check_text_metrics():
+    import nltk
+    from nltk.translate.meteor_score import meteor_score
+    meteor_score([nltk.word_tokenize("a user story")], nltk.word_tokenize("a user story"))
+
+
+def _check_visualize():
+    import seaborn  # noqa: F401
+
+
+# what a benchmark needs beyond the core stack, checked before the run
+REQUIREMENTS = {
+    "pairwise_metrics": (_check_text_metrics, "nltk data: python -m nltk.downloader punkt punkt_tab wordnet"),
+    "visualize": (_check_visualize, "pip install seaborn"),
+}
+
+
+def missing_requirements(names):
+    """{benchmark: hint} for selected benchmarks that cannot run here."""
+    missing = {}
+    for name in names:
+        if name in REQUIREMENTS:
+            check, hint = REQUIREMENTS[name]
+            try:
+                check()
+            except (ImportError, LookupError) as e:
+                missing[name] = f"{hint} ({type(e).__name__})"
+    return missing
+
+
+def _quiet(fn):
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        return fn()
+
+
+def _in_dir(path, fn):
+    with contextlib.chdir(path):
+        return _quiet(fn)
+
+
+# ---------------- running ----------------
+
+def measure(fn):
+    """(best, mean, repeats): best of REPEAT runs for fast functions, one run otherwise."""
+    times = []
+    while True:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if len(times) >= REPEAT or times[0] >= REPEAT_UNDER:
+            return min(times), float(np.mean(times)), len(times)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "Host": platform.node(),
+        "Commit": commit,
+        "Python": platform.python_version(),
+        "Numpy": np.__version__,
+        "Pandas": pd.__version__,
+        "CPUs": os.cpu_count(),
+    }
+
+
+def run_suite(stories=STORIES, models=MODELS, only=None):
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    env = environment()
+    unknown = set(only or ()) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"❌ Unknown benchmarks: {', '.join(sorted(unknown))} (choose from {', '.join(BENCHMARKS)})")
+    names = [n for n in BENCHMARKS if not only or n in only]
+    missing = missing_requirements(names)
+    if missing:
+        for name, hint in missing.items():
+            print(f"❌ {name} cannot run here: {hint}")
+        raise SystemExit("Install the missing requirements or leave those benchmarks out with --only.")
+    over_budget = {}  # benchmark -> smallest size (rows) at which it exceeded TIME_BUDGET
+    rows = []
+
+    grid = sorted(((s, m) for s in stories for m in models), key=lambda sm: sm[0] * sm[1])
+    for n_stories, n_models in grid:
+        n_rows = n_stories * n_models
+        if n_rows > MAX_ROWS:
+            print(f"⏩ {n_stories} x {n_models}: more than MAX_ROWS={MAX_ROWS} rows, skipped")
+            rows += [{"Run": run_id, **env, "Benchmark": name, "Stories": n_stories, "Models": n_models,
+                      "Rows": n_rows, "Seconds_Best": np.nan, "Seconds_Mean": np.nan, "Repeats": 0,
+                      "Status": f"skipped: more than MAX_ROWS={MAX_ROWS} rows"} for name in names]
+            continue
+        start = time.perf_counter()
+        df = generate_master(n_stories, n_models)
+        print(f"\n🧪 {n_stories} stories x {n_models} models ({n_rows} rows, generated in "
+              f"{time.perf_counter() - start:.1f}s)")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in names:
+                row = {"Run": run_id, **env, "Benchmark": name, "Stories": n_stories,
+                       "Models": n_models, "Rows": n_rows,
+                       "Seconds_Best": np.nan, "Seconds_Mean": np.nan, "Repeats": 0}
+                if name in over_budget and n_rows > over_budget[name]:
+                    row["Status"] = f"skipped: over {TIME_BUDGET:.0f}s at {over_budget[name]} rows"
+                else:
+                    try:
+                        fn = BENCHMARKS[name](df, tmp)
+                        best, mean, reps = measure(fn)
+                        row.update(Seconds_Best=best, Seconds_Mean=mean, Repeats=reps, Status="ok")
+                        if best > TIME_BUDGET:
+                            over_budget[name] = min(over_budget.get(name, n_rows), n_rows)
+                    except SkipBenchmark as e:
+                        row["Status"] = f"skipped: {e}"
+                    except Exception as e:
+                        # a broken benchmark is not a measurement: stop instead of recording it
+                        raise SystemExit(f"❌ {name} failed at {n_stories} x {n_models}: "
+                                         f"{type(e).__name__}: {' '.join(str(e).split())[:200]}")
+                rows.append(row)
+                shown = f"{row['Seconds_Best']:.4f}s" if row["Status"] == "ok" else row["Status"]
+                print(f"   {name:28s} {shown}")
+
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def compare(current, history):
+    """Join this run with the previous run on the same host, per (benchmark, stories, models)."""
+    key = ["Benchmark", "Stories", "Models"]
+    prev_runs = history[(history["Host"] == current["Host"].iloc[0]) & (history["Run"] != current["Run"].iloc[0])]
+    prev_runs = prev_runs[prev_runs["Status"] == "ok"]
+    if prev_runs.empty:
+        return pd.DataFrame()
+    previous = prev_runs.sort_values("Run").groupby(key).tail(1)
+    cmp = current[current["Status"] == "ok"].merge(previous[key + ["Run", "Commit", "Seconds_Best"]],
+                                                   on=key, suffixes=("", "_Previous"))
+    cmp["Ratio"] = cmp["Seconds_Best"] / cmp["Seconds_Best_Previous"]
+    cmp["Regression"] = ((cmp["Ratio"] > 1 + REGRESSION_TOLERANCE)
+                         & (cmp["Seconds_Best"] - cmp["Seconds_Best_Previous"] >= REGRESSION_MIN_SECONDS))
+    return cmp[key + ["Run_Previous", "Commit_Previous", "Seconds_Best_Previous", "Seconds_Best", "Ratio", "Regression"]]
+
+
+def _list_arg(name, cast=int):
+    if name not in sys.argv:
+        return None
+    return tuple(cast(x) for x in sys.argv[sys.argv.index(name) + 1].split(","))
+
+
+def main():
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    stories, models = QUICK_GRID if "--quick" in sys.argv else (STORIES, MODELS)
+    stories = _list_arg("--stories") or stories
+    models = _list_arg("--models") or models
+    only = _list_arg("--only", str)
+
+    current = run_suite(stories, models, only)
+    if current.empty:
+        print("ℹ️ Nothing to run for this grid.")
+        return
+    history = pd.read_csv(HISTORY) if HISTORY.exists() else pd.DataFrame()
+    # measurements only; size-cap / budget skips stay in this run's report
+    history = pd.concat([history, current[current["Status"] == "ok"]], ignore_index=True)
+    history.to_csv(HISTORY, index=False)
+
+    cmp = compare(current, history)
+    out_xlsx = OUT_DIR / f"Benchmark_Report_{current['Run'].iloc[0]}.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        current.to_excel(xw, sheet_name="This_Run", index=False)
+        if not cmp.empty:
+            cmp.to_excel(xw, sheet_name="Vs_Previous", index=False)
+
+    regressions = cmp[cmp["Regression"]] if not cmp.empty else cmp
+    if cmp.empty:
+        print("\nℹ️ No previous run on this host to compare with.")
+    elif regressions.empty:
+        print(f"\n✅ No regressions vs previous runs ({len(cmp)} measurements compared).")
+    else:
+        print(f"\n❌ {len(regressions)} regressions (> {REGRESSION_TOLERANCE:.0%} slower):")
+        print(regressions.to_string(index=False))
+    print("✅ Saved:", HISTORY, "and", out_xlsx)
+
+    if "--fail-on-regression" in sys.argv and not regressions.empty:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
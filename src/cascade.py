@@ -0,0 +1,290 @@
+# src/cascade.py
+"""
+Cheap-model-first judging cascade.
+
+A story is scored by the cheapest model in CASCADE_ORDER first and escalated
+to the next (stronger / pricier) judge only when the judgement is close to the
+regeneration acceptance boundary (THRESH_TOTAL, THRESH_TIER1) or incomplete
+(missing criteria, scores outside 0-2, or a total_score more than
+TOTAL_MISMATCH_TOLERANCE away from the sum of its own criterion scores). The
+last stage is the regeneration judge, whose answer is final. Decisions use the
+sum of the criterion scores, as in the regeneration loop.
+
+The regeneration loop uses the cascade for its full judgements when
+QURAL_CASCADE_JUDGING=1. Phase 1 (main.py) keeps asking every model, since the
+agreement analysis needs all of their judgements.
+
+Costs use config.MODEL_PRICES with token counts estimated from the real prompt
+and the recorded judgements; latencies are the median measured call times per
+model from the router's Route_Log (written by main.py), or NaN without one.
+
+Usage:
+    python src/cascade.py              # offline simulation on the master (no API calls)
+    python src/cascade.py --live 20    # judge 20 shortlisted stories through the cascade
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import MODEL_PRICES
+from evaluator import analyze_structural_quality
+from prompts import get_evaluation_prompt
+from regeneration_policy import (
+    CRITERIA, JUDGE_MODEL, MASTER, SHORTLIST, THRESH_TOTAL, THRESH_TIER1, THRESH_AC,
+    criterion_total, simplify_scores,
+)
+
+OUT_DIR = Path("outputs/analysis_cascade")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+ROUTE_LOG = os.path.join("outputs_with_text", "Route_Log.xlsx")  # measured call times (main.py)
+CHARS_PER_TOKEN = 4  # token estimate for prompts / recorded answers
+
+# cheapest first; the regeneration judge closes the cascade
+CASCADE_ORDER = ["Mistral-Nemo", "Gemini-2.0-Flash-Lite", JUDGE_MODEL]
+
+TOTAL_MARGIN = 2   # escalate when |total - THRESH_TOTAL| <= this
+TIER1_MARGIN = 1   # escalate when |tier1 - THRESH_TIER1| <= this
+TOTAL_MISMATCH_TOLERANCE = 1  # escalate when |total_score - sum of scores| > this (off-by-one is common)
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    if model not in MODEL_PRICES:
+        return np.nan
+    cin, cout = MODEL_PRICES[model]
+    return (prompt_tokens * cin + completion_tokens * cout) / 1e6
+
+
+def prompt_tokens(story):
+    return sum(len(m["content"]) for m in get_evaluation_prompt(story)) / CHARS_PER_TOKEN
+
+
+def answer_tokens(answer):
+    return len(json.dumps(answer, ensure_ascii=False)) / CHARS_PER_TOKEN
+
+
+def measured_latency(path=ROUTE_LOG):
+    """Median seconds of successful calls per model from the router's call log ({} without one)."""
+    if not os.path.exists(path):
+        return {}
+    calls = pd.read_excel(path, sheet_name="Calls")
+    return calls[calls["Ok"].astype(bool)].groupby("Model")["Seconds"].median().to_dict()
+
+
+def judgement_from_scores(scores, reported_total=None):
+    """scores: {criterion: score} -> dict used for escalation and the accept decision."""
+    tier1, _, _ = analyze_structural_quality(scores)
+    return {
+        "scores": scores,
+        "total": criterion_total(scores),
+        "reported_total": reported_total,
+        "tier1": tier1,
+        "ac": scores.get("Acceptance Criteria", 0),
+    }
+
+
+def accept(j):
+    return j["total"] >= THRESH_TOTAL and j["tier1"] >= THRESH_TIER1 and j["ac"] >= THRESH_AC
+
+
+def escalation_reason(j, total_margin=TOTAL_MARGIN, tier1_margin=TIER1_MARGIN):
+    """Why this judgement should go to a stronger judge, or None if it can stand."""
+    if len(j["scores"]) < len(CRITERIA):
+        return "missing_criteria"
+    if any(s not in (0, 1, 2) for s in j["scores"].values()):
+        return "score_out_of_range"
+    if j["reported_total"] is not None and abs(j["reported_total"] - j["total"]) > TOTAL_MISMATCH_TOLERANCE:
+        return "total_mismatch"
+    if abs(j["total"] - THRESH_TOTAL) <= total_margin:
+        return "near_total_threshold"
+    if abs(j["tier1"] - THRESH_TIER1) <= tier1_margin:
+        return "near_tier1_threshold"
+    return None
+
+
+# ---------------- live cascade ----------------
+
+def cascade_judge(story, order=CASCADE_ORDER):
+    """
+    Judge one story through the cascade.
+    Returns (response, judgement, model, accepted, stage log). The response, its
+    judgement and model come from the last stage that answered (None if none
+    did); accepted is False when that answer was escalated and every later
+    stage failed, so no judgement actually stood.
+    """
+    from llm_engine import call_llm
+
+    log = []
+    final_resp = final = final_model = None
+    accepted = False
+    for stage, model in enumerate(order):
+        start = time.time()
+        resp = call_llm(get_evaluation_prompt(story), model_friendly_name=model)
+        entry = {"Model": model, "Seconds": time.time() - start,
+                 "Cost_USD": call_cost(model, prompt_tokens(story), answer_tokens(resp) if resp else 0)}
+        if resp:
+            scores = {k: v for k, v in simplify_scores(resp.get("evaluations", {})).items() if k in CRITERIA}
+            total = pd.to_numeric(resp.get("total_score"), errors="coerce")
+            final_resp, final, final_model = resp, judgement_from_scores(scores, None if pd.isna(total) else int(total)), model
+            entry["Reason"] = escalation_reason(final) if stage < len(order) - 1 else None
+            accepted = entry["Reason"] is None
+        else:
+            entry["Reason"] = "call_failed"
+        log.append(entry)
+        if accepted:
+            break
+    return final_resp, final, final_model, accepted, log
+
+
+def run_live(n):
+    shortlist = pd.read_csv(SHORTLIST)
+    col = "Defective User Story" if "Defective User Story" in shortlist.columns else shortlist.columns[0]
+    rows = []
+    for story in shortlist[col].astype(str).head(n):
+        _, final, model, accepted, log = cascade_judge(story)
+        rows.append({
+            "Original_Story": story,
+            "Stages": len(log),
+            "Final_Model": model,
+            "Judgement_Stood": accepted,
+            "Escalations": " > ".join(e["Reason"] for e in log if e["Reason"]),
+            "Accept": accept(final) if accepted else None,
+            "Cost_USD": sum(e["Cost_USD"] for e in log),
+            "Seconds": sum(e["Seconds"] for e in log),
+        })
+    df = pd.DataFrame(rows)
+    out = OUT_DIR / "Cascade_Live.xlsx"
+    df.to_excel(out, index=False)
+    print(df[["Stages", "Cost_USD", "Seconds"]].mean().to_string())
+    print("✅ Saved:", out)
+
+
+# ---------------- offline simulation on the master ----------------
+
+def master_judgements(master):
+    """{(story, model): judgement} from the master's recorded scores, with token estimates."""
+    out = {}
+    score_cols = {c: f"{c}_Score" for c in CRITERIA if f"{c}_Score" in master.columns}
+    prompt_toks = {}
+    for _, r in master.drop_duplicates(["Original_Story", "Model"]).iterrows():
+        scores = {}
+        for c, col in score_cols.items():
+            v = pd.to_numeric(r[col], errors="coerce")
+            if not pd.isna(v):
+                scores[c] = int(v)
+        total = pd.to_numeric(r["Total_Score"], errors="coerce")
+        j = judgement_from_scores(scores, None if pd.isna(total) else int(total))
+
+        # the recorded answer, re-serialized in the response format, stands in for the completion
+        story = r["Original_Story"]
+        if story not in prompt_toks:
+            prompt_toks[story] = prompt_tokens(story)
+        answer = {"evaluations": {c: {"score": s, "text": str(r.get(f"{c}_Text", "N/A"))} for c, s in scores.items()},
+                  "total_score": j["reported_total"], "reasoning": str(r.get("Reasoning", ""))}
+        j["prompt_tokens"], j["completion_tokens"] = prompt_toks[story], answer_tokens(answer)
+        out[(story, r["Model"])] = j
+    return out
+
+
+def stage_cost(j, model):
+    return call_cost(model, j["prompt_tokens"], j["completion_tokens"])
+
+
+def simulate(judged, order=CASCADE_ORDER, total_margin=TOTAL_MARGIN, tier1_margin=TIER1_MARGIN, latency=None):
+    """Replay the cascade on recorded judgements (stories judged by every model in order)."""
+    latency = {} if latency is None else latency
+    strong = order[-1]
+    stories = [s for s in dict.fromkeys(s for s, _ in judged)
+               if all((s, m) in judged for m in order)]
+
+    rows = []
+    for s in stories:
+        cost = seconds = 0.0
+        reasons = []
+        for stage, model in enumerate(order):
+            j = judged[(s, model)]
+            cost += stage_cost(j, model)
+            seconds += latency.get(model, np.nan)
+            reason = escalation_reason(j, total_margin, tier1_margin) if stage < len(order) - 1 else None
+            if reason is None:
+                break
+            reasons.append(reason)
+        strong_j = judged[(s, strong)]
+        rows.append({
+            "Original_Story": s,
+            "Final_Model": model,
+            "Stages": stage + 1,
+            "Escalations": " > ".join(reasons),
+            "Cascade_Accept": accept(j),
+            "Strong_Accept": accept(strong_j),
+            "Cascade_Total": j["total"],
+            "Strong_Total": strong_j["total"],
+            "Cost_USD": cost,
+            "Strong_Cost_USD": stage_cost(strong_j, strong),
+            "Latency_s": seconds,
+            "Strong_Latency_s": latency.get(strong, np.nan),
+        })
+    return pd.DataFrame(rows)
+
+
+def summarize(sim, order=CASCADE_ORDER):
+    strong = order[-1]
+    cost, strong_cost = sim["Cost_USD"].sum(), sim["Strong_Cost_USD"].sum()
+    # sum(min_count=1): NaN when no latency was measured, instead of 0
+    latency, strong_latency = sim["Latency_s"].sum(min_count=1), sim["Strong_Latency_s"].sum(min_count=1)
+    return {
+        "Stories": len(sim),
+        "Resolved_At_Stage_1": float((sim["Stages"] == 1).mean()),
+        "Reached_Strong_Judge": float((sim["Final_Model"] == strong).mean()),
+        "Cost_Cascade_USD": float(cost),
+        "Cost_Strong_Only_USD": float(strong_cost),
+        "Cost_Saved": 1.0 - cost / strong_cost if strong_cost else np.nan,
+        "Latency_Cascade_s": float(latency),
+        "Latency_Strong_Only_s": float(strong_latency),
+        "Latency_Saved": 1.0 - latency / strong_latency if strong_latency else np.nan,
+        "Decision_Agreement": float((sim["Cascade_Accept"] == sim["Strong_Accept"]).mean()),
+        "Mean_Abs_Total_Diff": float((sim["Cascade_Total"] - sim["Strong_Total"]).abs().mean()),
+    }
+
+
+def main():
+    judged = master_judgements(pd.read_excel(MASTER))
+    latency = measured_latency()
+    if not latency:
+        print(f"ℹ️ No router call log at {ROUTE_LOG}: latency is not estimated")
+    sim = simulate(judged, latency=latency)
+    summary = summarize(sim)
+
+    # how much decision agreement each margin buys, and at what cost
+    sweep = []
+    for tm in range(0, 6):
+        for t1m in range(0, 3):
+            row = summarize(simulate(judged, total_margin=tm, tier1_margin=t1m, latency=latency))
+            sweep.append({"Total_Margin": tm, "Tier1_Margin": t1m, **row})
+
+    out_xlsx = OUT_DIR / "Cascade_Simulation.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        pd.DataFrame([summary]).to_excel(xw, sheet_name="Summary", index=False)
+        pd.DataFrame(sweep).to_excel(xw, sheet_name="Margin_Sweep", index=False)
+        sim.to_excel(xw, sheet_name="Per_Story", index=False)
+        sim["Escalations"].str.split(" > ").explode().replace("", np.nan).dropna() \
+            .value_counts().rename_axis("Reason").reset_index(name="Count") \
+            .to_excel(xw, sheet_name="Escalation_Reasons", index=False)
+        pd.DataFrame([{"Model": m, "Median_Seconds": s} for m, s in latency.items()]) \
+            .to_excel(xw, sheet_name="Measured_Latency", index=False)
+
+    print(f"Cascade: {' -> '.join(CASCADE_ORDER)}")
+    for k, v in summary.items():
+        print(f"   {k}: {v:.3f}" if isinstance(v, float) else f"   {k}: {v}")
+    print("✅ Saved:", out_xlsx)
+
+if __name__ == "__main__":
+    if "--live" in sys.argv:
+        run_live(int(sys.argv[sys.argv.index("--live") + 1]))
+    else:
+        main()
@@ -1,7 +1,15 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from scipy.stats import spearmanr, kendalltau
+from functools import partial
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA
+from evaluator import structural_columns
+from rank_correlation import rank_correlation_cube
+from reliability_engine import (
+    alpha_unit_stats, alpha_weighted, icc_unit_stats, icc_weighted,
+    pair_cell_stats, spearman_weighted, kendall_weighted,
+    bootstrap_replicates, percentile_ci, N_BOOT, BOOT_SEED,
+)
 
 MASTER = "Master_QURAL_Analysis.xlsx"
 OUT_DIR = Path("outputs/analysis_metrics")
@@ -24,8 +32,8 @@ CRITERIA = [
     "Testable",
 ]
 
-TIER1_KEYS = ["Role Identification","Task Nature","Acceptance Criteria","Business Need","Unambiguous"]
-TIER2_KEYS = ["Task Identification","Dependency","Priority","Quality Requirement","Estimable","Well Formed","Problem Oriented","Unique","Testable"]
+TIER1_KEYS = TIER_1_CRITERIA
+TIER2_KEYS = TIER_2_CRITERIA
 
 def krippendorff_alpha_ordinal(data, min_rating=0, max_rating=2):
     """
@@ -118,6 +126,10 @@ def build_pivot(df, value_col):
     pivot = pivot.dropna()  # require all 5 models present for that story
     return pivot
 
+def sheet_label(score_col):
+    # Excel sheet names are capped at 31 chars: "Tier_1_Score" -> "Tier1", "Acceptance Criteria_Score" -> "AcceptanceCriteria"
+    return "".join(ch for ch in score_col.replace("_Score", "") if ch.isalnum())
+
 def main():
     df = pd.read_excel(MASTER)
 
@@ -125,10 +137,10 @@ def main():
     df["Total_Score"] = pd.to_numeric(df["Total_Score"], errors="coerce")
 
     # compute tier scores if missing (some masters already have them)
-    if "Tier_1_Score" not in df.columns:
-        df["Tier_1_Score"] = df[[f"{k}_Score" for k in TIER1_KEYS]].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
-    if "Tier_2_Score" not in df.columns:
-        df["Tier_2_Score"] = df[[f"{k}_Score" for k in TIER2_KEYS]].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
+    tiers = structural_columns(df)
+    for col in ("Tier_1_Score", "Tier_2_Score"):
+        if col not in df.columns:
+            df[col] = tiers[col]
 
     # --- Krippendorff's Alpha per criterion (ordinal 0-2) ---
     alpha_rows = []
@@ -139,7 +151,9 @@ def main():
         df[col] = pd.to_numeric(df[col], errors="coerce")
         pivot = build_pivot(df, col)  # stories x models
         alpha = krippendorff_alpha_ordinal(pivot.values, 0, 2)
-        alpha_rows.append({"Criterion": c, "Krippendorff_Alpha_Ordinal": alpha, "Stories_Used": pivot.shape[0]})
+        reps, = bootstrap_replicates([partial(alpha_weighted, alpha_unit_stats(pivot.values, 0, 2))], pivot.shape[0])
+        lo, hi = percentile_ci(reps)
+        alpha_rows.append({"Criterion": c, "Krippendorff_Alpha_Ordinal": alpha, "Alpha_CI_Low": lo, "Alpha_CI_High": hi, "Stories_Used": pivot.shape[0]})
 
     alpha_df = pd.DataFrame(alpha_rows).sort_values("Krippendorff_Alpha_Ordinal", ascending=False)
     alpha_df.to_excel(OUT_DIR / "Krippendorff_Alpha_ByCriterion.xlsx", index=False)
@@ -149,37 +163,59 @@ def main():
     for metric in ["Total_Score", "Tier_1_Score", "Tier_2_Score"]:
         pivot = build_pivot(df, metric)
         icc = icc_2_1(pivot.values)
-        icc_rows.append({"Metric": metric, "ICC_2_1": icc, "Stories_Used": pivot.shape[0], "Num_Models": pivot.shape[1]})
+        reps, = bootstrap_replicates([partial(icc_weighted, icc_unit_stats(pivot.values))], pivot.shape[0])
+        lo, hi = percentile_ci(reps)
+        icc_rows.append({"Metric": metric, "ICC_2_1": icc, "ICC_CI_Low": lo, "ICC_CI_High": hi, "Stories_Used": pivot.shape[0], "Num_Models": pivot.shape[1]})
 
     icc_df = pd.DataFrame(icc_rows)
     icc_df.to_excel(OUT_DIR / "ICC_Summary.xlsx", index=False)
 
-    # --- Spearman & Kendall matrices (Total Score) ---
-    pivot_total = build_pivot(df, "Total_Score")
+    # --- Spearman & Kendall matrices (Total, tiers and every criterion) ---
+    rank_cols = ["Total_Score", "Tier_1_Score", "Tier_2_Score"] + [f"{c}_Score" for c in CRITERIA if f"{c}_Score" in df.columns]
+    pivots = {col: build_pivot(df, col) for col in rank_cols}
+    pivot_total = pivots["Total_Score"]
     models = list(pivot_total.columns)
 
-    spearman_mat = pd.DataFrame(index=models, columns=models, dtype=float)
-    kendall_mat = pd.DataFrame(index=models, columns=models, dtype=float)
-
-    for i, m1 in enumerate(models):
-        for j, m2 in enumerate(models):
-            if i == j:
-                spearman_mat.loc[m1, m2] = 1.0
-                kendall_mat.loc[m1, m2] = 1.0
-            else:
-                s, _ = spearmanr(pivot_total[m1], pivot_total[m2])
-                k, _ = kendalltau(pivot_total[m1], pivot_total[m2])
-                spearman_mat.loc[m1, m2] = s
-                kendall_mat.loc[m1, m2] = k
+    columns, spearman_cube, kendall_cube = rank_correlation_cube(pivots, models)
+    np.savez(OUT_DIR / "Rank_Correlation_Cube.npz", columns=np.array(columns), models=np.array(models),
+             spearman=spearman_cube, kendall=kendall_cube)
+
+    ci_mats = {name: pd.DataFrame(1.0, index=models, columns=models)
+               for name in ["Spearman_CI_Low", "Spearman_CI_High", "Kendall_CI_Low", "Kendall_CI_High"]}
+
+    # bootstrap every model pair on the same replicates (one pass over the pool)
+    pairs = [(m1, m2) for i, m1 in enumerate(models) for m2 in models[i + 1:]]
+    estimators = []
+    for m1, m2 in pairs:
+        stats = pair_cell_stats(pivot_total[m1].values, pivot_total[m2].values)
+        estimators += [partial(spearman_weighted, stats), partial(kendall_weighted, stats)]
+    reps = bootstrap_replicates(estimators, pivot_total.shape[0]) if estimators else []
+    for p, (m1, m2) in enumerate(pairs):
+        for name, r in (("Spearman", reps[2 * p]), ("Kendall", reps[2 * p + 1])):
+            lo, hi = percentile_ci(r)
+            for a, b in ((m1, m2), (m2, m1)):
+                ci_mats[f"{name}_CI_Low"].loc[a, b] = lo
+                ci_mats[f"{name}_CI_High"].loc[a, b] = hi
 
     with pd.ExcelWriter(OUT_DIR / "Rank_Correlation_Matrices.xlsx") as xw:
-        spearman_mat.to_excel(xw, sheet_name="Spearman_TotalScore")
-        kendall_mat.to_excel(xw, sheet_name="Kendall_TotalScore")
-
+        total = columns.index("Total_Score")
+        pd.DataFrame(spearman_cube[total], index=models, columns=models).to_excel(xw, sheet_name="Spearman_TotalScore")
+        pd.DataFrame(kendall_cube[total], index=models, columns=models).to_excel(xw, sheet_name="Kendall_TotalScore")
+        for name, mat in ci_mats.items():
+            mat.to_excel(xw, sheet_name=f"{name}_TotalScore")
+        for c, col in enumerate(columns):
+            if col == "Total_Score":
+                continue
+            label = sheet_label(col)
+            pd.DataFrame(spearman_cube[c], index=models, columns=models).to_excel(xw, sheet_name=f"Spearman_{label}")
+            pd.DataFrame(kendall_cube[c], index=models, columns=models).to_excel(xw, sheet_name=f"Kendall_{label}")
+
+    print(f"Bootstrap: {N_BOOT} story-level replicates, seed {BOOT_SEED}")
     print("✅ Saved:")
     print(" -", OUT_DIR / "Krippendorff_Alpha_ByCriterion.xlsx")
     print(" -", OUT_DIR / "ICC_Summary.xlsx")
     print(" -", OUT_DIR / "Rank_Correlation_Matrices.xlsx")
+    print(" -", OUT_DIR / "Rank_Correlation_Cube.npz")
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,13 @@
+import os
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from nltk.translate.meteor_score import meteor_score
-from rouge_score import rouge_scorer
-from bert_score import score as bertscore
+from rouge_score import tokenizers
+from similarity_backends import get_backend, compare_with_bertscore
 
 import nltk
 nltk.download("punkt", quiet=True)
@@ -14,6 +16,10 @@ MASTER = "Master_QURAL_Analysis.xlsx"
 OUT_DIR = Path("outputs/analysis_text_metrics")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+LEXICAL_WORKERS = os.cpu_count() or 1
+ROUGE_TOKENIZER = tokenizers.DefaultTokenizer(use_stemmer=True)
+SEMANTIC_SHEET = "Semantic_Similarity"  # used instead of BERTScore_F1 for non-BERTScore backends
+
 CRITERIA = [
     "Task Identification",
     "Task Nature",
@@ -41,44 +47,114 @@ def build_evidence_text(row):
                 parts.append(t)
     return " | ".join(parts).strip()
 
-def cosine_tfidf(texts_a, texts_b):
-    # lightweight cosine similarity using TF-IDF (works offline, no external APIs)
+def rowwise_cosine(A, B):
+    # rows are already L2-normalized by TfidfVectorizer, so cosine = row-wise sparse dot product
+    return np.asarray(A.multiply(B).sum(axis=1)).ravel()
+
+def fit_tfidf(columns):
+    """Fit one TF-IDF vocabulary over every model's texts; returns {model: sparse row block}."""
     from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
 
+    models = list(columns)
     vec = TfidfVectorizer(min_df=1)
-    X = vec.fit_transform(list(texts_a) + list(texts_b))
-    A = X[:len(texts_a)]
-    B = X[len(texts_a):]
-    sims = cosine_similarity(A, B).diagonal()
-    return sims
-
-def pairwise_metrics(refs, cands):
-    # BLEU
+    X = vec.fit_transform([t for m in models for t in columns[m]]).tocsr()
+    blocks, start = {}, 0
+    for m in models:
+        blocks[m] = X[start:start + len(columns[m])]
+        start += len(columns[m])
+    return blocks
+
+def cosine_tfidf(texts_a, texts_b):
+    # lightweight cosine similarity using TF-IDF (works offline, no external APIs)
+    blocks = fit_tfidf({"a": list(texts_a), "b": list(texts_b)})
+    return rowwise_cosine(blocks["a"], blocks["b"])
+
+def tokenize_texts(texts, memo=None):
+    """nltk tokens (BLEU/METEOR) and stemmed ROUGE tokens, once per distinct text."""
+    memo = {} if memo is None else memo
+    nltk_toks, rouge_toks = [], []
+    for t in texts:
+        if t not in memo:
+            memo[t] = (nltk.word_tokenize(t), ROUGE_TOKENIZER.tokenize(t))
+        nltk_toks.append(memo[t][0])
+        rouge_toks.append(memo[t][1])
+    return nltk_toks, rouge_toks
+
+def lcs_f1(ref, cand):
+    """ROUGE-L F1 of two token lists (longest common subsequence, as in rouge_score)."""
+    if not ref or not cand:
+        return 0.0
+    prev = [0] * (len(cand) + 1)
+    for r in ref:
+        cur = [0]
+        for j, c in enumerate(cand):
+            cur.append(prev[j] + 1 if r == c else max(prev[j + 1], cur[j]))
+        prev = cur
+    lcs = prev[-1]
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(cand), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def lexical_scores(ref_toks, cand_toks, with_rouge=True):
+    """Mean BLEU, METEOR and ROUGE-L F1 over aligned, pre-tokenized rows."""
+    (r_nltk, r_rouge), (c_nltk, c_rouge) = ref_toks, cand_toks
     smooth = SmoothingFunction().method1
-    bleu_vals = []
-    for r, c in zip(refs, cands):
-        r_tok = nltk.word_tokenize(r)
-        c_tok = nltk.word_tokenize(c)
-        bleu_vals.append(sentence_bleu([r_tok], c_tok, smoothing_function=smooth))
-    bleu = float(np.mean(bleu_vals))
-
-    # METEOR
-    meteor_vals = []
-    for r, c in zip(refs, cands):
-        meteor_vals.append(meteor_score([nltk.word_tokenize(r)], nltk.word_tokenize(c)))
-    meteor = float(np.mean(meteor_vals))
-
-    # ROUGE-L
-    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=True)
-    rouge_vals = []
-    for r, c in zip(refs, cands):
-        rouge_vals.append(scorer.score(r, c)["rougeL"].fmeasure)
-    rougeL = float(np.mean(rouge_vals))
-
-    # BERTScore
-    P, R, F1 = bertscore(cands, refs, lang="en", verbose=False)
-    bert = float(F1.mean().item())
+    bleu = float(np.mean([sentence_bleu([r], c, smoothing_function=smooth) for r, c in zip(r_nltk, c_nltk)]))
+    meteor = float(np.mean([meteor_score([r], c) for r, c in zip(r_nltk, c_nltk)]))
+    out = {"BLEU": bleu, "METEOR": meteor}
+    if with_rouge:
+        out["ROUGE_L"] = float(np.mean([lcs_f1(r, c) for r, c in zip(r_rouge, c_rouge)]))
+    return out
+
+_TOKENS = {}
+
+def _init_lexical_worker(tokens):
+    global _TOKENS
+    _TOKENS = tokens
+
+def _lexical_pair(task):
+    ref_model, cand_model, with_rouge = task
+    return task, lexical_scores(_TOKENS[ref_model], _TOKENS[cand_model], with_rouge)
+
+def lexical_matrices(columns, workers=LEXICAL_WORKERS):
+    """
+    BLEU / METEOR / ROUGE-L matrices (rows = reference model, cols = candidate).
+    Texts are tokenized once per model; the ordered pairs are fanned out over a
+    process pool. ROUGE-L F1 is symmetric, so it is computed once per unordered pair.
+    """
+    models = list(columns)
+    memo = {}
+    tokens = {m: tokenize_texts(columns[m], memo) for m in models}
+    tasks = [(m1, m2, i < j) for i, m1 in enumerate(models) for j, m2 in enumerate(models) if i != j]
+
+    if workers <= 1:
+        _init_lexical_worker(tokens)
+        results = list(map(_lexical_pair, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_lexical_worker, initargs=(tokens,)) as ex:
+            results = list(ex.map(_lexical_pair, tasks))
+
+    mats = {mn: pd.DataFrame(1.0, index=models, columns=models) for mn in ["BLEU", "METEOR", "ROUGE_L"]}
+    for (m1, m2, with_rouge), res in results:
+        mats["BLEU"].loc[m1, m2] = res["BLEU"]
+        mats["METEOR"].loc[m1, m2] = res["METEOR"]
+        if with_rouge:
+            mats["ROUGE_L"].loc[m1, m2] = mats["ROUGE_L"].loc[m2, m1] = res["ROUGE_L"]
+    return mats
+
+def semantic_label(backend_name):
+    return "BERTScore_F1" if backend_name == "bertscore" else SEMANTIC_SHEET
+
+def pairwise_metrics(refs, cands, bert_f1=None, backend=None):
+    res = lexical_scores(tokenize_texts(refs), tokenize_texts(cands))
+    bleu, meteor, rougeL = res["BLEU"], res["METEOR"], res["ROUGE_L"]
+
+    # semantic similarity (pass precomputed per-row scores to skip re-encoding)
+    backend_name, fn = get_backend(backend)
+    if bert_f1 is None:
+        bert_f1 = fn({"cand": list(cands), "ref": list(refs)})[("cand", "ref")]
+    bert = float(np.mean(bert_f1))
 
     # Cosine (TF-IDF)
     cos_vals = cosine_tfidf(refs, cands)
@@ -88,7 +164,7 @@ def pairwise_metrics(refs, cands):
         "BLEU": bleu,
         "METEOR": meteor,
         "ROUGE_L": rougeL,
-        "BERTScore_F1": bert,
+        semantic_label(backend_name): bert,
         "Cosine_TFIDF": cos
     }
 
@@ -106,30 +182,50 @@ def main():
     pivot = pivot.dropna()
     models = list(pivot.columns)
 
-    metrics_names = ["BLEU", "METEOR", "ROUGE_L", "BERTScore_F1", "Cosine_TFIDF"]
+    backend_name, backend = get_backend()
+    semantic = semantic_label(backend_name)
+    metrics_names = ["BLEU", "METEOR", "ROUGE_L", semantic, "Cosine_TFIDF"]
     matrices = {m: pd.DataFrame(index=models, columns=models, dtype=float) for m in metrics_names}
 
+    columns = {m: pivot[m].astype(str).tolist() for m in models}
+
+    # tokenize once per model, fan BLEU/METEOR/ROUGE-L pairs over a process pool
+    for mn, mat in lexical_matrices(columns).items():
+        matrices[mn] = mat
+
+    # semantic similarity for all ordered pairs from the configured backend
+    print(f"🔎 Semantic similarity backend: {backend_name}")
+    sem_pairs = backend(columns)
+
+    # one TF-IDF fit over all models; cosine is symmetric, so one pass per unordered pair
+    tfidf = fit_tfidf(columns)
+    for i, m1 in enumerate(models):
+        for m2 in models[i + 1:]:
+            cos = float(np.mean(rowwise_cosine(tfidf[m1], tfidf[m2])))
+            matrices["Cosine_TFIDF"].loc[m1, m2] = matrices["Cosine_TFIDF"].loc[m2, m1] = cos
+
     for i, m1 in enumerate(models):
         for j, m2 in enumerate(models):
             if i == j:
-                for mn in metrics_names:
-                    matrices[mn].loc[m1, m2] = 1.0
+                matrices[semantic].loc[m1, m2] = 1.0
+                matrices["Cosine_TFIDF"].loc[m1, m2] = 1.0
                 continue
+            matrices[semantic].loc[m1, m2] = float(np.mean(sem_pairs[(m2, m1)]))
 
-            refs = pivot[m1].astype(str).tolist()
-            cands = pivot[m2].astype(str).tolist()
-
-            res = pairwise_metrics(refs, cands)
-            for mn in metrics_names:
-                matrices[mn].loc[m1, m2] = res[mn]
+    # how far the offline backend is from BERTScore, when BERTScore can run here
+    comparison = compare_with_bertscore(columns, sem_pairs) if backend_name != "bertscore" else None
 
     # save
     out_xlsx = OUT_DIR / "Text_Similarity_Matrices.xlsx"
     with pd.ExcelWriter(out_xlsx) as xw:
         for mn, mat in matrices.items():
             mat.to_excel(xw, sheet_name=mn)
+        if comparison:
+            pd.DataFrame([{"Backend": backend_name, **comparison}]).to_excel(xw, sheet_name="Backend_vs_BERTScore", index=False)
 
     print("✅ Saved:", out_xlsx)
+    if comparison:
+        print(f"{backend_name} vs BERTScore F1 (per row): Pearson={comparison['Pearson']:.3f} Spearman={comparison['Spearman']:.3f}")
     print("Stories compared (complete across all models):", pivot.shape[0])
 
 if __name__ == "__main__":
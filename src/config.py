@@ -24,4 +24,27 @@ TIER_2_CRITERIA = [
     "Unique",
     "Testable",
     "Task Identification"
-]
\ No newline at end of file
+]
+
+# Structural-quality policy (evaluator.analyze_structural_quality[_batch]).
+# Each criterion counts with its tier's weight unless "criterion_weights" overrides
+# it. A story is structurally sound when its tier-1 sum reaches "tier1_threshold"
+# (and its tier-2 sum reaches "tier2_threshold", if set).
+STRUCTURAL_POLICY = {
+    "tier1_weight": 1.0,
+    "tier2_weight": 1.0,
+    "criterion_weights": {},
+    "tier1_threshold": 8,
+    "tier2_threshold": None,
+}
+
+# OpenRouter list prices in USD per 1M tokens (input, output) for the judging
+# cascade's cost estimates (cascade.py). Update from https://openrouter.ai/models
+# when providers change prices; a model without a price has an unknown (NaN) cost.
+MODEL_PRICES = {
+    "Mistral-Nemo": (0.035, 0.08),
+    "Gemini-2.0-Flash-Lite": (0.075, 0.30),
+    "GPT-4o-Mini": (0.15, 0.60),
+    "Claude-3-Haiku": (0.25, 1.25),
+    "Llama-3.1-70B": (0.40, 0.40),
+}
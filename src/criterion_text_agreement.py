@@ -0,0 +1,159 @@
+# src/criterion_text_agreement.py
+"""
+Per-criterion text agreement between models.
+
+build_evidence_text joins all 14 <criterion>_Text fields before comparing
+models, which hides which elements they disagree on. Here the master is
+melted to a long (story, model, criterion, text) table, every distinct text
+is tokenized / vectorized once, every distinct (reference, candidate) text
+pair is scored once, and the per-row scores are averaged back into a
+criterion x model x model cube for BLEU, ROUGE-L, TF-IDF cosine and
+(optionally, with --embeddings) BERTScore F1.
+
+Missing evidence ("N/A" or empty) on both sides counts as full agreement (1.0);
+missing on one side only counts as 0.0.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+
+from compute_text_similarity_metrics import CRITERIA, MASTER, lcs_f1, tokenize_texts, rowwise_cosine
+
+OUT_DIR = Path("outputs/analysis_text_metrics")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def long_format(df):
+    """(story, model, criterion, text) rows for stories evaluated by every model."""
+    df = df[df["Model"].notna() & df["Original_Story"].notna()]
+    text_cols = [f"{c}_Text" for c in CRITERIA if f"{c}_Text" in df.columns]
+    long = df.melt(id_vars=["Original_Story", "Model"], value_vars=text_cols,
+                   var_name="Criterion", value_name="Text")
+    long["Criterion"] = long["Criterion"].str.replace("_Text", "", regex=False)
+    text = long["Text"].fillna("").astype(str).str.strip()
+    long["Text"] = text.where(text.str.lower() != "n/a", "")
+    long = long.drop_duplicates(["Original_Story", "Model", "Criterion"])
+
+    n_models = long["Model"].nunique()
+    complete = long.groupby("Original_Story")["Model"].nunique()
+    return long[long["Original_Story"].isin(complete[complete == n_models].index)]
+
+
+def agreement_cube(long, encoder=None):
+    """
+    Returns (criteria, models, {metric: criteria x models x models array}).
+    Rows of each matrix are the reference model, columns the candidate.
+    BERTScore F1 is added when a similarity_engine encoder is given.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    criteria = [c for c in CRITERIA if c in set(long["Criterion"])]
+    models = sorted(long["Model"].unique())
+
+    # de-duplicate texts: every distinct string is processed exactly once
+    text_id, texts = pd.factorize(long["Text"])
+    texts = list(texts)
+    U = len(texts)
+    long = long.assign(Text_Id=text_id)
+    ids = long.pivot_table(index=["Criterion", "Original_Story"], columns="Model",
+                           values="Text_Id", aggfunc="first")[models]
+
+    nonempty = np.array([bool(t) for t in texts])
+    nltk_toks, rouge_toks = tokenize_texts(texts)
+    X = TfidfVectorizer(min_df=1).fit_transform(texts).tocsr()
+
+    # stack every (criterion, ref model, cand model, story) comparison into flat arrays
+    crit_index = ids.index.get_level_values("Criterion")
+    A, B, G = [], [], []
+    groups = []
+    for c_pos, c in enumerate(criteria):
+        block = ids[crit_index == c].values.astype(np.int64)
+        for i in range(len(models)):
+            for j in range(len(models)):
+                if i == j:
+                    continue
+                A.append(block[:, i])
+                B.append(block[:, j])
+                G.append(np.full(len(block), len(groups)))
+                groups.append((c_pos, i, j))
+    A, B, G = np.concatenate(A), np.concatenate(B), np.concatenate(G)
+
+    # score each distinct ordered text pair once
+    pair_keys, inverse = np.unique(A * U + B, return_inverse=True)
+    pa, pb = pair_keys // U, pair_keys % U
+    smooth = SmoothingFunction().method1
+    bleu_u = np.empty(len(pair_keys))
+    rouge_u = np.empty(len(pair_keys))
+    rouge_memo = {}
+    for k, (a, b) in enumerate(zip(pa, pb)):
+        if not nonempty[a] or not nonempty[b]:
+            bleu_u[k] = rouge_u[k] = float(nonempty[a] == nonempty[b])
+            continue
+        bleu_u[k] = sentence_bleu([nltk_toks[a]], nltk_toks[b], smoothing_function=smooth)
+        key = (min(a, b), max(a, b))  # ROUGE-L F1 is symmetric
+        if key not in rouge_memo:
+            rouge_memo[key] = lcs_f1(rouge_toks[a], rouge_toks[b])
+        rouge_u[k] = rouge_memo[key]
+
+    both_empty = ~nonempty[pa] & ~nonempty[pb]
+    cos_u = rowwise_cosine(X[pa], X[pb])
+    cos_u[both_empty] = 1.0
+
+    per_row = {"BLEU": bleu_u[inverse], "ROUGE_L": rouge_u[inverse], "Cosine_TFIDF": cos_u[inverse]}
+
+    if encoder is not None:
+        from similarity_engine import encode_texts, greedy_match
+        stats = encode_texts([t for t in texts if t], encoder)
+        empty = (np.zeros((0, 1), dtype=np.float32), np.zeros(0, dtype=np.float32))
+        bert_u = np.array([greedy_match(stats.get(texts[b], empty), stats.get(texts[a], empty))[2]
+                           for a, b in zip(pa, pb)])
+        bert_u[both_empty] = 1.0
+        per_row["BERTScore_F1"] = bert_u[inverse]
+
+    counts = np.bincount(G, minlength=len(groups))
+    cube = {}
+    for metric, vals in per_row.items():
+        means = np.bincount(G, weights=vals, minlength=len(groups)) / np.maximum(counts, 1)
+        arr = np.tile(np.eye(len(models)), (len(criteria), 1, 1))
+        for g, (c_pos, i, j) in enumerate(groups):
+            arr[c_pos, i, j] = means[g] if counts[g] else np.nan
+        cube[metric] = arr
+    return criteria, models, cube
+
+
+def main(with_embeddings=False):
+    df = pd.read_excel(MASTER)
+    long = long_format(df)
+    encoder = None
+    if with_embeddings:
+        from similarity_engine import load_encoder
+        encoder = load_encoder()
+    criteria, models, cube = agreement_cube(long, encoder=encoder)
+
+    out_npz = OUT_DIR / "Criterion_Text_Agreement_Cube.npz"
+    np.savez(out_npz, criteria=np.array(criteria), models=np.array(models), **cube)
+
+    k = len(models)
+    summary = pd.DataFrame({"Criterion": criteria})
+    for metric, arr in cube.items():
+        summary[f"{metric}_mean_offdiag"] = (arr.sum(axis=(1, 2)) - k) / (k * (k - 1))
+
+    out_xlsx = OUT_DIR / "Criterion_Text_Agreement.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        summary.to_excel(xw, sheet_name="Criterion_Summary", index=False)
+        for metric, arr in cube.items():
+            rows = [{"Criterion": c, "Reference_Model": models[i], "Candidate_Model": models[j], metric: arr[ci, i, j]}
+                    for ci, c in enumerate(criteria) for i in range(k) for j in range(k) if i != j]
+            pd.DataFrame(rows).to_excel(xw, sheet_name=metric, index=False)
+
+    print("✅ Saved:")
+    print(" -", out_npz)
+    print(" -", out_xlsx)
+    print("Stories compared (complete across all models):", long["Original_Story"].nunique())
+    print("Distinct evidence texts:", long["Text"].nunique(), "of", len(long), "cells")
+
+if __name__ == "__main__":
+    main(with_embeddings="--embeddings" in sys.argv)
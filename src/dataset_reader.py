@@ -0,0 +1,53 @@
+# src/dataset_reader.py
+"""
+Lazy reader for the story workbook (datasets/User_Stories_Combined.xlsx).
+
+Uses openpyxl read-only mode, so rows are parsed from the sheet XML as they are
+consumed instead of loading every sheet into DataFrames up front. The story
+column is picked like before: the first header containing "story" or
+"content", else the first column.
+"""
+from openpyxl import load_workbook
+
+MIN_STORY_CHARS = 10
+
+
+def story_column(header):
+    for i, name in enumerate(header):
+        if isinstance(name, str) and ("story" in name.lower() or "content" in name.lower()):
+            return i
+    return 0
+
+
+def _rows(ws):
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    col = story_column(header)
+    for values in rows:
+        yield values[col] if col < len(values) else None
+
+
+def iter_workbook(path):
+    """
+    Yields (sheet_name, approx_rows, rows) per sheet, where rows lazily yields the
+    story cell of every data row (None for blanks). approx_rows comes from the
+    sheet's stored dimensions and may be None. Consume (or skip) one sheet's rows
+    before advancing to the next sheet.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            n = ws.max_row - 1 if ws.max_row else None
+            yield ws.title, n, _rows(ws)
+    finally:
+        wb.close()
+
+
+def iter_stories(path):
+    """(project, story) for every story of at least MIN_STORY_CHARS characters."""
+    for sheet_name, _, rows in iter_workbook(path):
+        for story in rows:
+            if isinstance(story, str) and len(story) >= MIN_STORY_CHARS:
+                yield sheet_name, story
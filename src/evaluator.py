@@ -1,33 +1,117 @@
 # src/evaluator.py
+import numpy as np
+import pandas as pd
 
-TIER_1_KEYS = [
-    "Role Identification", 
-    "Task Nature",         
-    "Acceptance Criteria", 
-    "Business Need", 
-    "Unambiguous"
-]
-
-TIER_2_KEYS = [
-    "Task Identification", 
-    "Dependency", 
-    "Priority", 
-    "Quality Requirement", 
-    "Estimable", 
-    "Well Formed", 
-    "Problem Oriented", 
-    "Unique", 
-    "Testable"
-]
-
-def analyze_structural_quality(scores):
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA, STRUCTURAL_POLICY
+
+# one tier definition, in config.py
+TIER_1_KEYS = TIER_1_CRITERIA
+TIER_2_KEYS = TIER_2_CRITERIA
+CRITERIA = TIER_1_KEYS + TIER_2_KEYS
+
+
+def tier_weights(criteria=CRITERIA, policy=STRUCTURAL_POLICY):
+    """(w1, w2): weight vectors over criteria for the tier-1 and tier-2 sums."""
+    overrides = policy.get("criterion_weights") or {}
+    w1 = np.array([overrides.get(c, policy["tier1_weight"]) if c in TIER_1_KEYS else 0.0 for c in criteria])
+    w2 = np.array([overrides.get(c, policy["tier2_weight"]) if c in TIER_2_KEYS else 0.0 for c in criteria])
+    return w1, w2
+
+
+def analyze_structural_quality_batch(scores, criteria=CRITERIA, policy=STRUCTURAL_POLICY):
+    """
+    scores: N x len(criteria) matrix (missing / NaN count as 0).
+    Returns (tier1, tier2, sound) arrays of length N.
     """
-    Implements the 'Weighted Criticality' check.
+    S = np.nan_to_num(np.asarray(scores, dtype=float).reshape(-1, len(criteria)))
+    w1, w2 = tier_weights(criteria, policy)
+    tier1, tier2 = S @ w1, S @ w2
+    sound = tier1 >= policy["tier1_threshold"]
+    if policy.get("tier2_threshold") is not None:
+        sound &= tier2 >= policy["tier2_threshold"]
+    return tier1, tier2, sound
+
+
+def score_matrix(df, criteria=CRITERIA):
+    """N x len(criteria) matrix from a master / Detailed frame's <criterion>_Score columns."""
+    cols = [f"{c}_Score" for c in criteria]
+    return df.reindex(columns=cols).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+def structural_columns(df, policy=STRUCTURAL_POLICY):
+    """Tier_1_Score, Tier_2_Score and Structurally_Sound for every row of df under policy."""
+    tier1, tier2, sound = analyze_structural_quality_batch(score_matrix(df), policy=policy)
+    return pd.DataFrame({"Tier_1_Score": tier1, "Tier_2_Score": tier2, "Structurally_Sound": sound},
+                        index=df.index)
+
+
+def _plain(x):
+    return int(x) if float(x).is_integer() else float(x)
+
+def analyze_structural_quality(scores, policy=STRUCTURAL_POLICY):
+    """
+    Implements the 'Weighted Criticality' check for one story.
     Returns: (Tier 1 Score, Tier 2 Score, Is_Structurally_Sound)
     """
-    tier_1_total = sum(scores.get(k, 0) for k in TIER_1_KEYS)
-    tier_2_total = sum(scores.get(k, 0) for k in TIER_2_KEYS)
-    
-    is_structurally_sound = tier_1_total >= 8
-    
-    return tier_1_total, tier_2_total, is_structurally_sound
\ No newline at end of file
+    row = [pd.to_numeric(scores.get(k, 0), errors="coerce") for k in CRITERIA]
+    tier1, tier2, sound = analyze_structural_quality_batch([row], policy=policy)
+    return _plain(tier1[0]), _plain(tier2[0]), bool(sound[0])
+
+
+def _score(v):
+    if isinstance(v, dict):
+        v = v.get("score", 0)
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return 0
+
+def aggregate_judgements(samples):
+    """
+    Self-consistency: merges n decoded judgements of the same story into one.
+    Each criterion gets the majority score (ties go to the lower score) with the
+    text quoted by a sample that gave it; total_score is the sum of the majority
+    scores. The spread across samples is kept under "self_consistency".
+    """
+    samples = [s for s in samples if isinstance(s, dict)]
+    if not samples:
+        return None
+    judged = [s for s in samples if isinstance(s.get("evaluations"), dict)]
+    if not judged:
+        return samples[0]
+
+    criteria = list(dict.fromkeys(k for s in judged for k in s["evaluations"]))
+    evaluations, spread = {}, {}
+    for c in criteria:
+        votes = [(_score(s["evaluations"][c]), s["evaluations"][c]) for s in judged if c in s["evaluations"]]
+        scores = sorted(v for v, _ in votes)
+        majority = max(sorted(set(scores)), key=scores.count)
+        text = next((raw.get("text", "N/A") for v, raw in votes if v == majority and isinstance(raw, dict)), "N/A")
+        mean = sum(scores) / len(scores)
+        mid = len(scores) // 2
+        evaluations[c] = {"score": majority, "text": text}
+        spread[c] = {
+            "majority": majority,
+            "median": scores[mid] if len(scores) % 2 else (scores[mid - 1] + scores[mid]) / 2,
+            "variance": sum((v - mean) ** 2 for v in scores) / len(scores),
+            "agreement": scores.count(majority) / len(scores),
+        }
+
+    totals = [sum(_score(v) for v in s["evaluations"].values()) for s in judged]
+    total = sum(e["score"] for e in evaluations.values())
+    # reasoning from the sample whose own total is closest to the aggregate
+    closest = min(range(len(judged)), key=lambda i: abs(totals[i] - total))
+    mean_total = sum(totals) / len(totals)
+    routes = list(dict.fromkeys(s["_route"] for s in judged if s.get("_route")))
+    return {
+        "evaluations": evaluations,
+        "total_score": total,
+        "reasoning": judged[closest].get("reasoning", ""),
+        "self_consistency": {
+            "n_samples": len(judged),
+            "criteria": spread,
+            "totals": totals,
+            "total_variance": sum((t - mean_total) ** 2 for t in totals) / len(totals),
+        },
+        "_route": ", ".join(routes),
+    }
@@ -0,0 +1,316 @@
+# src/incremental_agreement.py
+"""
+Incremental inter-model agreement.
+
+AgreementTracker keeps the sufficient statistics behind every reliability
+metric in compute_agreement_metrics.py and updates them per story:
+  - Krippendorff's alpha: pairwise disagreement sums and level counts per criterion
+  - ICC(2,1): per-model column sums, squared row sums and squared values
+  - Spearman / Kendall: a (score_a, score_b) contingency table per model pair
+
+Appending a row or replacing one model's sheet only touches the stories in
+those rows, so re-running one model (or watching a Phase 1 run in progress)
+no longer needs the full master.
+
+Usage:
+    python src/incremental_agreement.py outputs_with_text/Claude-3-Haiku/Detailed_2_Loudoun.xlsx ...
+"""
+import os
+import pickle
+import sys
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from compute_agreement_metrics import CRITERIA, MASTER, OUT_DIR
+from evaluator import analyze_structural_quality
+from reliability_engine import (
+    alpha_unit_stats, alpha_weighted, pair_cell_stats,
+    spearman_weighted, kendall_weighted,
+)
+
+STATE_FILE = OUT_DIR / "agreement_state.pkl"
+ICC_METRICS = ["Total_Score", "Tier_1_Score", "Tier_2_Score"]
+RANK_METRIC = "Total_Score"
+
+
+def row_scores(row):
+    """Numeric score columns of a master/Detailed row (tiers derived if missing)."""
+    def num(v):
+        v = pd.to_numeric(v, errors="coerce")
+        return None if pd.isna(v) else float(v)
+
+    scores = {}
+    for c in CRITERIA:
+        v = num(row.get(f"{c}_Score"))
+        if v is not None:
+            scores[f"{c}_Score"] = v
+    derived = None
+    for i, metric in enumerate(("Tier_1_Score", "Tier_2_Score")):
+        v = num(row.get(metric))
+        if v is None:
+            derived = derived or analyze_structural_quality({c: scores.get(f"{c}_Score", 0.0) for c in CRITERIA})
+            v = float(derived[i])
+        scores[metric] = v
+    v = num(row.get("Total_Score"))
+    if v is not None:
+        scores["Total_Score"] = v
+    return scores
+
+
+class AgreementTracker:
+    def __init__(self, models=None):
+        # models=None: the rater set grows with every model seen ("agreement so far")
+        self.fixed_models = models is not None
+        self.models = list(models or [])
+        self._groups = defaultdict(list)   # (model, project) -> [(story, scores)]
+        self._cells = defaultdict(lambda: defaultdict(dict))  # story -> model -> col -> [sum, count]
+        self._contrib = {}                 # story -> {col: contribution}
+        self._reset_aggregates()
+
+    # ---------------- updates ----------------
+
+    def append(self, row):
+        """Add one master-format row (dict with Model, Project, Original_Story, *_Score)."""
+        model, project, story = row["Model"], row["Project"], row["Original_Story"]
+        self._ensure_model(model)
+        scores = row_scores(row)
+        self._groups[(model, project)].append((story, scores))
+        self._add_cells(story, model, scores, +1)
+        self._refresh(story)
+
+    def replace_sheet(self, model, project, rows):
+        """Replace every row previously recorded for (model, project) with rows."""
+        self._ensure_model(model)
+        touched = set()
+        for story, scores in self._groups.pop((model, project), []):
+            self._add_cells(story, model, scores, -1)
+            touched.add(story)
+        for row in rows:
+            story, scores = row["Original_Story"], row_scores(row)
+            self._groups[(model, project)].append((story, scores))
+            self._add_cells(story, model, scores, +1)
+            touched.add(story)
+        for story in touched:
+            self._refresh(story)
+
+    def update_from_frame(self, df):
+        """Replace the (Model, Project) groups present in a Detailed_*.xlsx / master frame."""
+        df = df[df["Model"].notna() & df["Original_Story"].notna()]
+        for (model, project), g in df.groupby(["Model", "Project"], sort=False):
+            self.replace_sheet(model, project, g.to_dict("records"))
+
+    # ---------------- metrics ----------------
+
+    def alpha(self):
+        out = {}
+        for c in CRITERIA:
+            agg = self._alpha[f"{c}_Score"]
+            # the running totals act as a single unit with weight 1
+            out[c] = float(alpha_weighted((agg["two_s"], agg["pairs"], agg["counts"]), np.ones((1, 1)))[0])
+        return out
+
+    def icc(self):
+        out = {}
+        k = len(self.models)
+        for metric in ICC_METRICS:
+            agg = self._icc[metric]
+            if agg["n"] < 2 or k < 2:
+                out[metric] = np.nan
+                continue
+            out[metric] = float(_icc_from_sums(agg["col_sums"], agg["row_sq"], agg["sq"], agg["n"], k))
+        return out
+
+    def rank_correlations(self):
+        """(spearman, kendall) DataFrames for RANK_METRIC over complete stories."""
+        k = len(self.models)
+        spearman = pd.DataFrame(np.eye(k), index=self.models, columns=self.models)
+        kendall = spearman.copy()
+        for (i, j), table in self._rank.items():
+            if not table:
+                s = t = np.nan
+            else:
+                pairs = np.array(list(table.keys()))
+                w = np.array(list(table.values()), dtype=float)[None]
+                stats = pair_cell_stats(pairs[:, 0], pairs[:, 1])
+                s = spearman_weighted(stats, w)[0]
+                t = kendall_weighted(stats, w)[0]
+            a, b = self.models[i], self.models[j]
+            spearman.loc[a, b] = spearman.loc[b, a] = s
+            kendall.loc[a, b] = kendall.loc[b, a] = t
+        return spearman, kendall
+
+    def stories_used(self, col=RANK_METRIC):
+        return int(self._icc[col]["n"]) if col in self._icc else 0
+
+    def summary_line(self):
+        """Short 'agreement so far' readout for progress bars."""
+        if len(self.models) < 2 or self.stories_used() < 2:
+            return f"agreement: waiting ({len(self.models)} model(s), {self.stories_used()} complete stories)"
+        alpha = np.nanmean(list(self.alpha().values()))
+        icc = self.icc()["Total_Score"]
+        spearman, _ = self.rank_correlations()
+        k = len(self.models)
+        rho = (spearman.values.sum() - k) / (k * (k - 1))
+        return f"n={self.stories_used()} α={alpha:.3f} ICC={icc:.3f} ρ={rho:.3f}"
+
+    # ---------------- persistence ----------------
+
+    def save(self, path=STATE_FILE):
+        state = dict(self.__dict__)
+        state["_cells"] = {s: {m: dict(c) for m, c in d.items()} for s, d in self._cells.items()}
+        state["_groups"] = dict(self._groups)
+        with open(path, "wb") as f:
+            pickle.dump(state, f)
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        tracker = cls.__new__(cls)
+        tracker.__dict__.update(state)
+        tracker._groups = defaultdict(list, state["_groups"])
+        cells = defaultdict(lambda: defaultdict(dict))
+        for s, d in state["_cells"].items():
+            cells[s].update(d)
+        tracker._cells = cells
+        return tracker
+
+    # ---------------- internals ----------------
+
+    def _reset_aggregates(self):
+        k = len(self.models)
+        self._contrib = {}
+        self._alpha = {f"{c}_Score": {"two_s": np.zeros(1), "pairs": np.zeros(1), "counts": np.zeros((1, 3))}
+                       for c in CRITERIA}
+        self._icc = {m: {"n": 0, "col_sums": np.zeros(k), "row_sq": 0.0, "sq": 0.0} for m in ICC_METRICS}
+        self._rank = {(i, j): Counter() for i in range(k) for j in range(i + 1, k)}
+
+    def _ensure_model(self, model):
+        if model in self.models:
+            return
+        if self.fixed_models:
+            raise ValueError(f"Unknown model: {model}")
+        # a new rater makes every story incomplete until it has been scored by that rater too
+        self.models.append(model)
+        self._reset_aggregates()
+        for story in list(self._cells):
+            self._refresh(story)
+
+    def _add_cells(self, story, model, scores, sign):
+        cells = self._cells[story][model]
+        for col, v in scores.items():
+            s, n = cells.get(col, (0.0, 0))
+            s, n = s + sign * v, n + sign
+            if n:
+                cells[col] = (s, n)
+            else:
+                cells.pop(col, None)
+        if not cells:
+            del self._cells[story][model]
+            if not self._cells[story]:
+                del self._cells[story]
+
+    def _unit_values(self, story, col):
+        # mean over the story's rows per model, like pivot_table(aggfunc="mean")
+        per_model = self._cells.get(story, {})
+        vals = []
+        for m in self.models:
+            cell = per_model.get(m, {}).get(col)
+            if cell is None:
+                return None
+            vals.append(cell[0] / cell[1])
+        return np.array(vals)
+
+    def _refresh(self, story):
+        old = self._contrib.pop(story, None)
+        if old:
+            self._apply(old, -1)
+        new = {}
+        for col in list(self._alpha) + ICC_METRICS:
+            vals = self._unit_values(story, col)
+            if vals is not None:
+                new[col] = vals
+        if new:
+            self._contrib[story] = new
+            self._apply(new, +1)
+
+    def _apply(self, contrib, sign):
+        for col, vals in contrib.items():
+            if col in self._alpha:
+                two_s, pairs, counts = alpha_unit_stats(vals[None], 0, 2)
+                agg = self._alpha[col]
+                agg["two_s"] += sign * two_s
+                agg["pairs"] += sign * pairs
+                agg["counts"] += sign * counts
+            if col in self._icc:
+                agg = self._icc[col]
+                agg["n"] += sign
+                agg["col_sums"] = agg["col_sums"] + sign * vals
+                agg["row_sq"] += sign * vals.sum() ** 2
+                agg["sq"] += sign * (vals ** 2).sum()
+            if col == RANK_METRIC:
+                for (i, j), table in self._rank.items():
+                    key = (vals[i], vals[j])
+                    table[key] += sign
+                    if table[key] == 0:
+                        del table[key]
+
+
+def _icc_from_sums(col_sums, row_sq, sq, n, k):
+    # same decomposition as reliability_engine.icc_weighted, from running sums
+    grand_sum = col_sums.sum()
+    correction = grand_sum ** 2 / (n * k)
+    SS_total = sq - correction
+    SS_target = row_sq / k - correction
+    SS_rater = (col_sums ** 2).sum() / n - correction
+    SS_error = SS_total - SS_target - SS_rater
+
+    MS_target = SS_target / (n - 1)
+    MS_rater = SS_rater / (k - 1)
+    MS_error = SS_error / ((n - 1) * (k - 1))
+    denom = MS_target + (k - 1) * MS_error + (k * (MS_rater - MS_error) / n)
+    if denom == 0 or np.isnan(denom):
+        return np.nan
+    return (MS_target - MS_error) / denom
+
+
+def main():
+    if STATE_FILE.exists():
+        print(f"📂 Loading agreement state: {STATE_FILE}")
+        tracker = AgreementTracker.load()
+    else:
+        print(f"📂 Building agreement state from {MASTER}...")
+        tracker = AgreementTracker()
+        tracker.update_from_frame(pd.read_excel(MASTER))
+
+    for path in sys.argv[1:]:
+        if not os.path.exists(path):
+            print(f"⚠️ Skipping missing file {path}")
+            continue
+        print(f"🔄 Replacing rows from {path}")
+        tracker.update_from_frame(pd.read_excel(path))
+
+    tracker.save()
+
+    alpha_df = pd.DataFrame([{"Criterion": c, "Krippendorff_Alpha_Ordinal": a} for c, a in tracker.alpha().items()])
+    icc_df = pd.DataFrame([{"Metric": m, "ICC_2_1": v, "Stories_Used": tracker.stories_used(m)}
+                           for m, v in tracker.icc().items()])
+    spearman, kendall = tracker.rank_correlations()
+
+    out_xlsx = OUT_DIR / "Agreement_Incremental_Summary.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        alpha_df.sort_values("Krippendorff_Alpha_Ordinal", ascending=False).to_excel(xw, sheet_name="Alpha", index=False)
+        icc_df.to_excel(xw, sheet_name="ICC", index=False)
+        spearman.to_excel(xw, sheet_name="Spearman_TotalScore")
+        kendall.to_excel(xw, sheet_name="Kendall_TotalScore")
+
+    print("Agreement so far:", tracker.summary_line())
+    print("✅ Saved:")
+    print(" -", out_xlsx)
+    print(" -", STATE_FILE)
+
+
+if __name__ == "__main__":
+    main()
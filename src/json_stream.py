@@ -0,0 +1,227 @@
+# src/json_stream.py
+"""
+Incremental JSON validation for streamed LLM responses.
+
+IncrementalJSONValidator is fed the completion chunk by chunk and raises
+SchemaViolation as soon as the text can no longer become a valid response:
+broken JSON syntax, a key the schema does not allow, a value of the wrong
+type, or a number outside its range. Scalars follow the JSON grammar (no
+NaN / Infinity, trailing commas or unknown escapes), and strings are decoded
+before keys are checked, so "\u0041" matches "A". Anything before the first
+"{" (e.g. a ```json fence) and after the closing "}" is ignored, like
+clean_json_string.
+
+A schema maps key paths to rules; "*" matches any key at that level:
+    {(): {"type": "object", "keys": [...]},
+     ("evaluations", "*", "score"): {"type": ("number", "string"), "range": (0, 2)}}
+Paths without a rule accept any value.
+"""
+import json
+import re
+
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA
+
+CRITERIA = TIER_1_CRITERIA + TIER_2_CRITERIA
+
+QURAL_SCHEMA = {
+    (): {"type": "object", "keys": ["evaluations", "total_score", "reasoning"]},
+    ("evaluations",): {"type": "object", "keys": CRITERIA},
+    # main.build_row also accepts a bare score in place of {"score", "text"}
+    ("evaluations", "*"): {"type": ("object", "number", "string"), "keys": ["score", "text"], "range": (0, 2)},
+    ("evaluations", "*", "score"): {"type": ("number", "string"), "range": (0, 2)},
+    ("evaluations", "*", "text"): {"type": "string"},
+    ("total_score",): {"type": ("number", "string"), "range": (0, 28)},
+    ("reasoning",): {"type": "string"},
+}
+
+REGEN_SCHEMA = {
+    (): {"type": "object", "keys": ["regenerated_story", "notes"]},
+    ("regenerated_story",): {"type": "string"},
+    ("notes",): {"type": "string"},
+}
+
+_WS = " \t\r\n"
+_SCALAR_END = ",}]" + _WS
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_ESCAPES = '"\\/bfnrtu'
+
+
+class SchemaViolation(ValueError):
+    pass
+
+
+def _rule(schema, path):
+    for pattern, rule in schema.items():
+        if len(pattern) == len(path) and all(p == "*" or p == k for p, k in zip(pattern, path)):
+            return rule
+    return None
+
+
+class IncrementalJSONValidator:
+    def __init__(self, schema=None):
+        self.schema = schema or {}
+        self.stack = []          # open containers: {"type", "path", "state", "key", "items"}
+        self.started = False
+        self.done = False
+        self.mode = None         # None | "string" | "scalar"
+        self.buf = []
+        self.escape = False
+        self.is_key = False
+        self.chars = 0
+
+    # ---------------- public ----------------
+
+    def feed(self, chunk):
+        for ch in chunk:
+            self.chars += 1
+            self._char(ch)
+
+    # ---------------- schema checks ----------------
+
+    def _fail(self, msg):
+        raise SchemaViolation(f"{msg} (after {self.chars} chars)")
+
+    def _check_type(self, path, kind):
+        rule = _rule(self.schema, path)
+        if rule and "type" in rule:
+            allowed = rule["type"] if isinstance(rule["type"], tuple) else (rule["type"],)
+            if kind not in allowed:
+                self._fail(f"{'/'.join(path) or 'root'}: expected {'/'.join(allowed)}, got {kind}")
+        return rule
+
+    def _check_key(self, path, key):
+        rule = _rule(self.schema, path)
+        if rule and "keys" in rule and key not in rule["keys"]:
+            self._fail(f"unexpected key {key!r} in {'/'.join(path) or 'root'}")
+
+    def _check_number(self, path, rule, value):
+        if rule and "range" in rule:
+            lo, hi = rule["range"]
+            if not lo <= value <= hi:
+                self._fail(f"{'/'.join(path)}: {value} outside {lo}-{hi}")
+
+    # ---------------- state machine ----------------
+
+    def _value_path(self):
+        frame = self.stack[-1]
+        return frame["path"] + ((frame["key"],) if frame["type"] == "object" else ("*",))
+
+    def _value_done(self):
+        self.stack[-1]["state"] = "comma"
+        self.stack[-1]["items"] += 1
+
+    def _string_done(self, raw):
+        try:
+            text = json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            self._fail(f"invalid string escape in {raw[:40]!r}")
+        frame = self.stack[-1]
+        if self.is_key:
+            self._check_key(frame["path"], text)
+            frame["key"] = text
+            frame["state"] = "colon"
+            return
+        path = self._value_path()
+        rule = self._check_type(path, "string")
+        if rule and "range" in rule and text.strip().isdigit():
+            self._check_number(path, rule, int(text.strip()))
+        self._value_done()
+
+    def _scalar_done(self, token):
+        path = self._value_path()
+        if token in ("true", "false", "null"):
+            self._check_type(path, "literal")
+        elif _NUMBER.fullmatch(token):
+            self._check_number(path, self._check_type(path, "number"), float(token))
+        else:
+            self._fail(f"invalid token {token!r}")
+        self._value_done()
+
+    def _open(self, kind, path):
+        self._check_type(path, kind)
+        self.stack.append({"type": kind, "path": path,
+                           "state": "key" if kind == "object" else "value", "key": None, "items": 0})
+
+    def _close(self, ch):
+        frame = self.stack.pop()
+        if (ch == "}") != (frame["type"] == "object"):
+            self._fail(f"mismatched {ch!r}")
+        if not self.stack:
+            self.done = True
+        else:
+            self._value_done()
+
+    def _char(self, ch):
+        if self.done:
+            return
+
+        if self.mode == "string":
+            # the raw text (escapes included) is decoded in _string_done
+            if self.escape:
+                if ch not in _ESCAPES:
+                    self._fail(f"invalid escape '\\{ch}'")
+                self.escape = False
+                self.buf.append(ch)
+            elif ch == "\\":
+                self.escape = True
+                self.buf.append(ch)
+            elif ch == '"':
+                self.mode = None
+                self._string_done("".join(self.buf))
+            else:
+                self.buf.append(ch)
+            return
+
+        if self.mode == "scalar":
+            if ch not in _SCALAR_END:
+                self.buf.append(ch)
+                return
+            self.mode = None
+            self._scalar_done("".join(self.buf))
+            # the terminator itself is structural; fall through
+
+        if not self.started:
+            if ch == "{":
+                self.started = True
+                self._open("object", ())
+            return
+
+        if ch in _WS:
+            return
+
+        frame = self.stack[-1]
+        state = frame["state"]
+
+        if state == "key":
+            if ch == '"':
+                self.mode, self.buf, self.is_key = "string", [], True
+            elif ch == "}" and frame["items"] == 0:  # empty object, not a trailing comma
+                self._close(ch)
+            else:
+                self._fail(f"expected key, got {ch!r}")
+        elif state == "colon":
+            if ch != ":":
+                self._fail(f"expected ':', got {ch!r}")
+            frame["state"] = "value"
+        elif state == "value":
+            if ch == "]" and frame["type"] == "array" and frame["items"] == 0:
+                self._close(ch)
+            elif ch == "{":
+                self._open("object", self._value_path())
+            elif ch == "[":
+                self._open("array", self._value_path())
+            elif ch == '"':
+                self.mode, self.buf, self.is_key = "string", [], False
+            elif ch in "-0123456789tfn":
+                self.mode, self.buf = "scalar", [ch]
+            else:
+                self._fail(f"unexpected {ch!r}")
+        elif state == "comma":
+            if ch == ",":
+                frame["state"] = "key" if frame["type"] == "object" else "value"
+                if frame["type"] == "object":
+                    frame["key"] = None
+            elif ch in "}]":
+                self._close(ch)
+            else:
+                self._fail(f"expected ',' or close, got {ch!r}")
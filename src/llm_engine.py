@@ -3,8 +3,12 @@ import os
 import json
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
+from json_stream import IncrementalJSONValidator, SchemaViolation
+from evaluator import aggregate_judgements
+from model_router import Router
 
 load_dotenv()
 
@@ -17,11 +21,42 @@ MODELS = {
     "Gemini-2.0-Flash-Lite": "google/gemini-2.0-flash-lite-001" 
 }
 
-# Fallback List
-GEMINI_FALLBACKS = [
-    "google/gemini-flash-1.5",
-    "google/gemini-pro-1.5"
-]
+# Equivalence groups for the router: primary first, then interchangeable routes.
+# A route may only be another id for the SAME model weights (a pinned snapshot of
+# the alias); :free / :beta variants and other models are different raters and are
+# never substituted. Rows record the route in "Route".
+#   GPT-4o-Mini            alias -> pinned 2024-07-18 snapshot
+#   Claude-3-Haiku         alias -> Anthropic's only 3 Haiku snapshot, 20240307
+#   Gemini-2.0-Flash-Lite  pinned -001 -> Google's stable alias, which serves -001
+#                          (keeps the rater alive when the pinned id 404s; the
+#                          old fallbacks, gemini-flash/pro-1.5, were other models)
+# Llama-3.1-70B and Mistral-Nemo have no second id for the same weights, so they
+# rely on circuit breaking alone.
+ROUTE_GROUPS = {
+    "GPT-4o-Mini": ["openai/gpt-4o-mini", "openai/gpt-4o-mini-2024-07-18"],
+    "Claude-3-Haiku": ["anthropic/claude-3-haiku", "anthropic/claude-3-haiku-20240307"],
+    "Gemini-2.0-Flash-Lite": ["google/gemini-2.0-flash-lite-001", "google/gemini-2.0-flash-lite"],
+}
+ROUTER = Router({name: [model_id] + [r for r in ROUTE_GROUPS.get(name, []) if r != model_id]
+                 for name, model_id in MODELS.items()})
+
+# streaming mode: abort as soon as the response leaves the schema
+MAX_STREAM_CHARS = 12000  # a full QURAL judgement is ~2-3k chars; beyond this it is runaway output
+CHARS_PER_TOKEN = 4       # for wasted-token estimates when the stream is cut before usage arrives
+
+STREAM_STATS = {
+    "calls": 0,
+    "aborted": 0,           # schema violation / runaway detected mid-stream
+    "parse_failures": 0,    # stream finished but the JSON did not parse
+    "wasted_chars": 0,
+    "wasted_tokens": 0,     # provider usage when reported, else chars / CHARS_PER_TOKEN
+    "detect_seconds": [],   # request start -> violation detected
+    "reasons": {},
+}
+
+# self-consistency sampling (n > 1)
+SAMPLE_WORKERS = 4      # concurrent requests when the provider ignores n
+N_UNSUPPORTED = set()   # routes that returned fewer choices than asked; not asked for n again
 
 client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
@@ -33,37 +68,182 @@ def clean_json_string(content):
     content = re.sub(r"```\s*$", "", content)
     return content.strip()
 
-def call_llm(messages, model_friendly_name="GPT-4o-Mini"):
-    model_id = MODELS.get(model_friendly_name)
-    if not model_id:
-        return None
+def _stream_completion(model_id, messages, schema):
+    """
+    Streams one completion through an IncrementalJSONValidator.
+    Returns the decoded JSON, or raises SchemaViolation as soon as it diverges.
+    """
+    validator = IncrementalJSONValidator(schema)
+    started = time.time()
+    parts = []
+    usage = None
+    stream = client.chat.completions.create(
+        model=model_id,
+        messages=messages,
+        response_format={"type": "json_object"},
+        temperature=0.1,
+        stream=True,
+        stream_options={"include_usage": True},
+        extra_headers={
+            "X-Title": "QURAL PhD Research Pipeline"
+        }
+    )
+    STREAM_STATS["calls"] += 1
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            validator.feed(delta)
+            if validator.chars > MAX_STREAM_CHARS:
+                raise SchemaViolation(f"runaway output (> {MAX_STREAM_CHARS} chars)")
+    except SchemaViolation as e:
+        stream.close()  # stop paying for the rest of the completion
+        _record_waste(parts, None, str(e), time.time() - started, aborted=True)
+        raise
 
-    current_model_id = model_id
-    
-    for attempt in range(5):
+    content = "".join(parts)
+    try:
+        return json.loads(clean_json_string(content), strict=False)
+    except ValueError as e:
+        _record_waste(parts, usage, f"unparseable: {e}", time.time() - started, aborted=False)
+        raise SchemaViolation(str(e))
+
+def _record_waste(parts, usage, reason, seconds, aborted):
+    chars = sum(len(p) for p in parts)
+    STREAM_STATS["aborted" if aborted else "parse_failures"] += 1
+    STREAM_STATS["wasted_chars"] += chars
+    tokens = getattr(usage, "completion_tokens", None) if usage else None
+    STREAM_STATS["wasted_tokens"] += tokens if tokens is not None else int(round(chars / CHARS_PER_TOKEN))
+    STREAM_STATS["detect_seconds"].append(seconds)
+    key = reason.split(" (after")[0].split(":")[0]
+    STREAM_STATS["reasons"][key] = STREAM_STATS["reasons"].get(key, 0) + 1
+
+def stream_stats_summary():
+    s = STREAM_STATS
+    detect = s["detect_seconds"]
+    return {
+        "Streamed_Calls": s["calls"],
+        "Aborted_Early": s["aborted"],
+        "Parse_Failures": s["parse_failures"],
+        "Wasted_Completion_Tokens": s["wasted_tokens"],
+        "Wasted_Chars": s["wasted_chars"],
+        "Mean_Time_To_Detect_s": sum(detect) / len(detect) if detect else 0.0,
+        "Top_Reasons": dict(sorted(s["reasons"].items(), key=lambda kv: -kv[1])[:5]),
+    }
+
+def call_llm_samples(messages, model_friendly_name="GPT-4o-Mini", n=3, stream=False, schema=None):
+    """
+    Up to n decoded completions of the same prompt. Asks for n choices in one
+    request (one prompt's worth of input tokens) and tops up with concurrent
+    single calls for whatever the provider did not return.
+    """
+    if model_friendly_name not in MODELS:
+        return []
+
+    samples = []
+    route = ROUTER.pick(model_friendly_name)
+    if not stream and route and route not in N_UNSUPPORTED:
+        started = time.time()
         try:
             response = client.chat.completions.create(
-                model=current_model_id,
+                model=route,
                 messages=messages,
                 response_format={"type": "json_object"},
                 temperature=0.1,
+                n=n,
                 extra_headers={
                     "X-Title": "QURAL PhD Research Pipeline"
                 }
             )
+            for choice in response.choices:
+                try:
+                    sample = json.loads(clean_json_string(choice.message.content or ""), strict=False)
+                except ValueError:
+                    continue
+                if isinstance(sample, dict):
+                    sample["_route"] = route
+                    samples.append(sample)
+            # a response with no usable choice counts against the route like a failed call
+            ROUTER.record(model_friendly_name, route, time.time() - started,
+                          error=None if samples else ValueError("no parseable choice"))
+            if len(response.choices) < n:
+                N_UNSUPPORTED.add(route)
+                print(f"⚠️ {route} ignores n={n}; sampling with concurrent calls")
+        except Exception as e:
+            ROUTER.record(model_friendly_name, route, time.time() - started, error=e)
+            # the single-call path below has the retries and other routes
 
-            content = response.choices[0].message.content
-            if not content:
-                continue
+    missing = n - len(samples)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=min(SAMPLE_WORKERS, missing)) as pool:
+            extra = pool.map(lambda _: call_llm(messages, model_friendly_name, stream=stream, schema=schema),
+                             range(missing))
+            samples += [s for s in extra if s]
+    return samples
+
+def call_llm(messages, model_friendly_name="GPT-4o-Mini", stream=False, schema=None, n=1):
+    """
+    stream=True validates the response against schema (json_stream.QURAL_SCHEMA,
+    REGEN_SCHEMA, or None for syntax only) while it arrives and retries
+    immediately when it diverges.
+
+    n > 1 samples n judgements and returns them merged by
+    evaluator.aggregate_judgements (majority scores plus a "self_consistency" block).
+
+    Each attempt goes to the route ROUTER picks from the model's equivalence
+    group; the decoded record carries it under "_route".
+    """
+    if model_friendly_name not in MODELS:
+        return None
+
+    if n > 1:
+        return aggregate_judgements(call_llm_samples(messages, model_friendly_name, n, stream, schema))
 
-            return json.loads(clean_json_string(content), strict=False)
+    for attempt in range(5):
+        route = ROUTER.pick(model_friendly_name)
+        if route is None:
+            time.sleep(2)  # every route's circuit is open; wait for a cooldown
+            continue
 
+        started = time.time()
+        try:
+            if stream:
+                result = _stream_completion(route, messages, schema)
+            else:
+                response = client.chat.completions.create(
+                    model=route,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    temperature=0.1,
+                    extra_headers={
+                        "X-Title": "QURAL PhD Research Pipeline"
+                    }
+                )
+                result = None
+        except SchemaViolation as e:
+            # unusable output counts against the route's health; retry without backing off
+            ROUTER.record(model_friendly_name, route, time.time() - started, error=e)
+            continue
         except Exception as e:
-            if "404" in str(e) and "gemini" in model_friendly_name.lower():
-                if GEMINI_FALLBACKS:
-                    current_model_id = GEMINI_FALLBACKS.pop(0)
-                    print(f"⚠️ Switching to fallback: {current_model_id}")
-                    continue
+            ROUTER.record(model_friendly_name, route, time.time() - started, error=e)
             time.sleep(2)
+            continue
+
+        if result is None:
+            content = response.choices[0].message.content
+            try:
+                result = json.loads(clean_json_string(content or ""), strict=False)
+            except ValueError as e:
+                ROUTER.record(model_friendly_name, route, time.time() - started, error=e)
+                continue
+        ROUTER.record(model_friendly_name, route, time.time() - started)
+
+        if isinstance(result, dict):
+            result["_route"] = route
+        return result
 
     return None
\ No newline at end of file
@@ -2,102 +2,209 @@
 import os
 import pandas as pd
 from tqdm import tqdm
-from prompts import get_evaluation_prompt
-from llm_engine import call_llm, MODELS
+from prompts import PROMPT_VARIANTS, STRICT_PROMPT_VARIANTS
+from llm_engine import call_llm, MODELS, ROUTER, stream_stats_summary
+from json_stream import QURAL_SCHEMA
 from evaluator import analyze_structural_quality
+from incremental_agreement import AgreementTracker
+from dataset_reader import iter_workbook, MIN_STORY_CHARS
+from result_store import ResultStore
+from repair_queue import RepairQueue, REPAIR_STRICT, malformed_criteria, placeholder_row
 
 DATA_FILE = "datasets/User_Stories_Combined.xlsx"
-BASE_OUTPUT_DIR = "outputs_with_text"
+PROMPT_VARIANT = os.getenv("QURAL_PROMPT_VARIANT", "full")
+get_evaluation_prompt = PROMPT_VARIANTS[PROMPT_VARIANT]
+get_strict_evaluation_prompt = STRICT_PROMPT_VARIANTS[PROMPT_VARIANT]
+# non-default prompt variants write next to, not over, the reference outputs
+BASE_OUTPUT_DIR = "outputs_with_text" if PROMPT_VARIANT == "full" else f"outputs_with_text_{PROMPT_VARIANT}"
+STREAM_RESPONSES = os.getenv("QURAL_STREAM", "0") == "1"  # validate while streaming, abort bad output early
+SAMPLES = int(os.getenv("QURAL_SAMPLES", "1"))  # >1: self-consistency, majority score per criterion
+STORE_SOURCE = "phase1" if PROMPT_VARIANT == "full" else f"phase1_{PROMPT_VARIANT}"  # result_store source tag
+LIVE_AGREEMENT_EVERY = 10  # refresh the "agreement so far" readout every N stories
+
+def canonical_story(text):
+    """Dedup key: case-folded with whitespace collapsed."""
+    return " ".join(str(text).casefold().split())
+
+def build_row(model_name, sheet_name, user_story, response):
+    """Master-format row for one story occurrence, or None if the model gave no response."""
+    if not response:
+        return None
+
+    evals = response.get('evaluations', {})
+    total = response.get('total_score', 0)
+
+    simple_scores = {}
+    for k, v in evals.items():
+        if isinstance(v, dict):
+            simple_scores[k] = v.get('score', 0)
+        elif isinstance(v, (int, float)):
+            simple_scores[k] = int(v)
+        elif isinstance(v, str) and v.isdigit():
+            simple_scores[k] = int(v)
+        else:
+            simple_scores[k] = 0
+
+    t1, t2, sound = analyze_structural_quality(simple_scores)
+
+    # Build Row Data
+    row_data = {
+        "Model": model_name,
+        "Project": sheet_name,
+        "Original_Story": user_story,
+        "Total_Score": total,
+        "Structurally_Sound": sound,
+        "Tier_1_Score": t1,
+        "Tier_2_Score": t2,
+        "Reasoning": response.get('reasoning', ''),
+        "Route": response.get('_route', '')  # underlying model id that produced the judgement
+    }
+
+    # Add Score AND Text safely
+    for criteria, data in evals.items():
+        if isinstance(data, dict):
+            row_data[f"{criteria}_Score"] = data.get('score', 0)
+            row_data[f"{criteria}_Text"] = data.get('text', 'N/A')
+        else:
+            # Handle malformed extraction gracefully
+            row_data[f"{criteria}_Score"] = simple_scores.get(criteria, 0)
+            row_data[f"{criteria}_Text"] = "N/A (AI Format Error)"
+
+    # self-consistency sampling: spread of the n judgements behind each majority score
+    consistency = response.get('self_consistency')
+    if consistency:
+        row_data["N_Samples"] = consistency["n_samples"]
+        row_data["Total_Score_Variance"] = consistency["total_variance"]
+        for criteria, stats in consistency["criteria"].items():
+            row_data[f"{criteria}_Median"] = stats["median"]
+            row_data[f"{criteria}_Variance"] = stats["variance"]
+    return row_data
+
+def repair_call(user_story, model_name):
+    prompt = get_strict_evaluation_prompt(user_story) if REPAIR_STRICT else get_evaluation_prompt(user_story)
+    return call_llm(prompt, model_friendly_name=model_name,
+                    stream=STREAM_RESPONSES, schema=QURAL_SCHEMA, n=SAMPLES)
 
 def process_datasets():
     if not os.path.exists(DATA_FILE):
         print(f"❌ Error: File not found at {DATA_FILE}")
         return
 
-    print(f"📂 Loading Excel file: {DATA_FILE}...")
+    # sheets are streamed row by row as they are evaluated; nothing is loaded up front
     try:
-        all_sheets = pd.read_excel(DATA_FILE, sheet_name=None)
+        n_sheets = sum(1 for _ in iter_workbook(DATA_FILE))
     except Exception as e:
         print(f"❌ Error reading Excel file: {e}")
         return
+    print(f"📂 Streaming Excel file: {DATA_FILE} ({n_sheets} sheets)")
+    print(f"📝 Prompt variant: {PROMPT_VARIANT}" + (f" | {SAMPLES} samples per judgement" if SAMPLES > 1 else ""))
+    tracker = AgreementTracker()
+
+    calls_made = {m: 0 for m in MODELS}
+    calls_saved = {m: 0 for m in MODELS}
+    repairs = RepairQueue()  # failed / malformed rows, retried in bulk after the main pass
+    store = ResultStore()    # indexed copy of every row, for queries without loading the master
 
     for model_name in MODELS.keys():
         print(f"\n==========================================")
         print(f"🤖 EXTRACTING WITH: {model_name}")
         print(f"==========================================")
+
+        response_cache = {}  # canonical story -> response, shared across this model's sheets
         
         model_output_dir = os.path.join(BASE_OUTPUT_DIR, model_name)
         os.makedirs(model_output_dir, exist_ok=True)
 
-        for sheet_name, df in all_sheets.items():
+        for sheet_name, n_rows, stories in iter_workbook(DATA_FILE):
             safe_name = "".join([c if c.isalnum() else "_" for c in sheet_name])
             output_path = os.path.join(model_output_dir, f"Detailed_{safe_name}.xlsx")
             
             if os.path.exists(output_path):
                 print(f"⏩ {sheet_name} already done. Skipping...")
+                done = pd.read_excel(output_path)
+                requeued = repairs.push_open_rows(model_name, sheet_name, output_path, done)
+                if requeued:
+                    print(f"   🛠️ {requeued} rows still waiting for repair")
+                if "Repair_Status" in done.columns:
+                    done = done[done["Repair_Status"] != "pending"]
+                tracker.update_from_frame(done)
+                store.import_frame(done, source=STORE_SOURCE)
                 continue
 
-            print(f"   📂 Processing {sheet_name} ({len(df)} stories)...")
+            print(f"   📂 Processing {sheet_name} (~{n_rows if n_rows is not None else '?'} stories)...")
             results = []
             
-            for index, row in tqdm(df.iterrows(), total=len(df), desc=f"   {sheet_name}"):
-                user_story = ""
-                for col in df.columns:
-                    if isinstance(col, str) and ("story" in col.lower() or "content" in col.lower()):
-                        user_story = row[col]
-                        break
-                if not user_story and not df.empty: user_story = row.iloc[0]
-
-                if not isinstance(user_story, str) or len(user_story) < 10:
+            pbar = tqdm(stories, total=n_rows, desc=f"   {sheet_name}")
+            for sheet_row, user_story in enumerate(pbar, start=2):  # Excel row; row 1 is the header
+                if not isinstance(user_story, str) or len(user_story) < MIN_STORY_CHARS:
                     continue
 
-                prompt = get_evaluation_prompt(user_story)
-                response = call_llm(prompt, model_friendly_name=model_name)
-                
-                if response:
-                    evals = response.get('evaluations', {})
-                    total = response.get('total_score', 0)
-                    
-                    simple_scores = {}
-                    for k, v in evals.items():
-                        if isinstance(v, dict):
-                            simple_scores[k] = v.get('score', 0)
-                        elif isinstance(v, (int, float)):
-                            simple_scores[k] = int(v)
-                        elif isinstance(v, str) and v.isdigit():
-                            simple_scores[k] = int(v)
-                        else:
-                            simple_scores[k] = 0 
-
-                    t1, t2, sound = analyze_structural_quality(simple_scores)
-                    
-                    # Build Row Data
-                    row_data = {
-                        "Model": model_name,
-                        "Project": sheet_name,
-                        "Original_Story": user_story,
-                        "Total_Score": total,
-                        "Structurally_Sound": sound,
-                        "Tier_1_Score": t1,
-                        "Tier_2_Score": t2,
-                        "Reasoning": response.get('reasoning', '')
-                    }
-                    
-                    # Add Score AND Text safely
-                    for criteria, data in evals.items():
-                        if isinstance(data, dict):
-                            row_data[f"{criteria}_Score"] = data.get('score', 0)
-                            row_data[f"{criteria}_Text"] = data.get('text', 'N/A')
-                        else:
-                            # Handle malformed extraction gracefully
-                            row_data[f"{criteria}_Score"] = simple_scores.get(criteria, 0)
-                            row_data[f"{criteria}_Text"] = "N/A (AI Format Error)"
-
-                    results.append(row_data)
+                # one call per distinct story per model; repeats reuse the cached response
+                key = canonical_story(user_story)
+                if key in response_cache:
+                    response = response_cache[key]
+                    calls_saved[model_name] += 1
+                else:
+                    prompt = get_evaluation_prompt(user_story)
+                    response = call_llm(prompt, model_friendly_name=model_name,
+                                        stream=STREAM_RESPONSES, schema=QURAL_SCHEMA, n=SAMPLES)
+                    calls_made[model_name] += 1
+                    if response:  # failures are retried on the next occurrence
+                        response_cache[key] = response
+
+                # no inline retries: failures keep their position and are repaired after the run
+                row_data = build_row(model_name, sheet_name, user_story, response)
+                if not row_data:
+                    repairs.push(model_name, sheet_name, output_path, len(results), user_story,
+                                 "pending", "no_response")
+                    results.append({**placeholder_row(model_name, sheet_name, user_story), "Sheet_Row": sheet_row})
+                    continue
+                row_data["Sheet_Row"] = sheet_row  # identifies this occurrence (result_store key)
+                bad = malformed_criteria(response)
+                row_data["Repair_Status"] = "malformed" if bad else ""
+                if bad:
+                    repairs.push(model_name, sheet_name, output_path, len(results), user_story,
+                                 "malformed", ", ".join(bad))
+                results.append(row_data)
+                tracker.append(row_data)
+                store.add_row(row_data, source=STORE_SOURCE)
+                if len(results) % LIVE_AGREEMENT_EVERY == 0:
+                    pbar.set_postfix_str(tracker.summary_line())
 
             # Save Results
             if results:
                 pd.DataFrame(results).to_excel(output_path, index=False)
+            store.commit()
+            print(f"   📈 Agreement so far: {tracker.summary_line()}")
+
+    if repairs:
+        touched = repairs.paths()
+        cross_model_path = os.path.join(BASE_OUTPUT_DIR, "Cross_Model_Repairs.xlsx")
+        counts = repairs.drain(repair_call, build_row, key=canonical_story,
+                               on_row=lambda row: store.add_row(row, source=STORE_SOURCE),
+                               cross_model_path=cross_model_path)
+        for path in touched:
+            tracker.update_from_frame(pd.read_excel(path))
+        print(f"🛠️ Repair pass: {counts['repaired']} repaired, {counts['dropped']} dropped, "
+              f"{counts['failed']} left malformed | {tracker.summary_line()}")
+        if counts["cross_model"]:
+            print(f"   {counts['cross_model']} judgements by the repair model saved to {cross_model_path} "
+                  f"(not credited to the failing models)")
+
+    store.close()
+    print(f"🗄️ Results indexed in {store.path}")
+
+    print("\n📊 Run summary (LLM calls):")
+    for m in MODELS:
+        print(f"   {m}: {calls_made[m]} made, {calls_saved[m]} saved by story dedup")
+    print(f"   Total saved: {sum(calls_saved.values())} (repeated stories, after canonicalization)")
+    if STREAM_RESPONSES:
+        print("📡 Streaming validation:", stream_stats_summary())
+    if ROUTER.log:
+        route_log = os.path.join(BASE_OUTPUT_DIR, "Route_Log.xlsx")
+        ROUTER.save_log(route_log)
+        print(f"🧭 Routes used: {ROUTER.summary().query('Calls > 0')[['Route', 'Calls', 'State']].to_dict('records')}")
+        print(f"   Saved: {route_log}")
 
 if __name__ == "__main__":
     process_datasets()
\ No newline at end of file
@@ -23,6 +23,10 @@ def merge_all_excels():
         except Exception as e:
             print(f"⚠️ Skipping bad file {file}: {e}")
 
+    # placeholders for stories whose repair pass has not run yet
+    if "Repair_Status" in combined_df.columns:
+        combined_df = combined_df[combined_df["Repair_Status"] != "pending"]
+
     cols = list(combined_df.columns)
     first_cols = ['Model', 'Project', 'Original_Story', 'Total_Score', 'Structurally_Sound']
     
@@ -0,0 +1,154 @@
+# src/model_router.py
+"""
+Per-route health tracking and circuit breakers for call_llm.
+
+Every friendly model name maps to an equivalence group of OpenRouter model
+ids (llm_engine.ROUTE_GROUPS), primary first. Each route keeps an EWMA of its
+error rate and of its successful-call latency, plus a circuit:
+
+    closed     -> normal; opens after FAILURE_THRESHOLD consecutive errors
+                  or when the error EWMA exceeds ERROR_RATE_LIMIT
+    open       -> skipped until its cooldown expires (doubling on each re-open;
+                  NOT_FOUND_COOLDOWN for 404 "model not found" errors)
+    half_open  -> one probe call is let through; success closes the circuit,
+                  failure re-opens it
+
+pick() returns the healthiest available route. The primary is kept unless an
+alternative is healthier by SWITCH_MARGIN, so rows only change the underlying
+model when they have to. Every decision is appended to the route log.
+"""
+import threading
+import time
+
+import pandas as pd
+
+EWMA_ALPHA = 0.2
+ERROR_WEIGHT = 4.0          # health score = latency * (1 + ERROR_WEIGHT * error rate)
+SWITCH_MARGIN = 1.5         # an alternative must score this much better than the primary
+FAILURE_THRESHOLD = 3
+ERROR_RATE_LIMIT = 0.6
+MIN_CALLS_FOR_RATE = 5
+COOLDOWN_SECONDS = 30.0
+MAX_COOLDOWN_SECONDS = 600.0
+NOT_FOUND_COOLDOWN = 3600.0
+
+
+class RouteHealth:
+    def __init__(self, route):
+        self.route = route
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.error_rate = 0.0
+        self.latency = None
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.cooldown = COOLDOWN_SECONDS
+        self.probing = False
+
+    def available(self, now):
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "closed":
+            return True
+        return self.state == "half_open" and not self.probing
+
+    def score(self, primary):
+        if self.latency is None:
+            # untried: the primary goes first, alternatives only when nothing measured is left
+            return 0.0 if primary else float("inf")
+        return self.latency * (1.0 + ERROR_WEIGHT * self.error_rate)
+
+    def open(self, now, cooldown=None):
+        if self.state == "closed":
+            self.cooldown = COOLDOWN_SECONDS
+        else:
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN_SECONDS)
+        if cooldown:
+            self.cooldown = cooldown
+        self.state = "open"
+        self.opened_at = now
+        self.probing = False
+
+
+class Router:
+    def __init__(self, groups):
+        self.groups = {name: list(routes) for name, routes in groups.items()}
+        self.health = {r: RouteHealth(r) for routes in self.groups.values() for r in routes}
+        self.log = []
+        self._lock = threading.Lock()
+
+    def pick(self, model_name):
+        """Route id for the next call, or None when every route in the group is open."""
+        routes = self.groups.get(model_name)
+        if not routes:
+            return None
+        with self._lock:
+            now = time.time()
+            live = [self.health[r] for r in routes if self.health[r].available(now)]
+            if not live:
+                return None
+            scored = [(h.score(h.route == routes[0]) * (1.0 if h.route == routes[0] else SWITCH_MARGIN), i, h)
+                      for i, h in enumerate(live)]
+            best = min(scored, key=lambda t: (t[0], t[1]))[2]
+            if best.state == "half_open":
+                best.probing = True
+            return best.route
+
+    def record(self, model_name, route, seconds, error=None):
+        """Outcome of one call on route; error is the exception (None on success)."""
+        with self._lock:
+            h = self.health[route]
+            now = time.time()
+            h.calls += 1
+            h.error_rate = (1 - EWMA_ALPHA) * h.error_rate + EWMA_ALPHA * (error is not None)
+            if error is None:
+                h.consecutive_failures = 0
+                h.latency = seconds if h.latency is None else (1 - EWMA_ALPHA) * h.latency + EWMA_ALPHA * seconds
+                if h.state == "half_open":
+                    h.state = "closed"
+                    h.probing = False
+            else:
+                h.failures += 1
+                h.consecutive_failures += 1
+                not_found = "404" in str(error)
+                if (not_found or h.state == "half_open"
+                        or h.consecutive_failures >= FAILURE_THRESHOLD
+                        or (h.calls >= MIN_CALLS_FOR_RATE and h.error_rate > ERROR_RATE_LIMIT)):
+                    if h.state != "open":
+                        print(f"⚠️ Circuit open for {route}" + (" (not found)" if not_found else ""))
+                    h.open(now, NOT_FOUND_COOLDOWN if not_found else None)
+            self.log.append({
+                "Time": now,
+                "Model": model_name,
+                "Route": route,
+                "Primary": route == self.groups[model_name][0],
+                "Seconds": round(seconds, 3),
+                "Ok": error is None,
+                "Error": str(error)[:200] if error is not None else "",
+                "State_After": h.state,
+            })
+
+    def summary(self):
+        """One row per route: calls, error rate, latency, circuit state."""
+        rows = []
+        for model_name, routes in self.groups.items():
+            for r in routes:
+                h = self.health[r]
+                rows.append({
+                    "Model": model_name,
+                    "Route": r,
+                    "Calls": h.calls,
+                    "Failures": h.failures,
+                    "Error_Rate_EWMA": round(h.error_rate, 3),
+                    "Latency_EWMA_s": round(h.latency, 3) if h.latency is not None else None,
+                    "State": h.state,
+                })
+        return pd.DataFrame(rows)
+
+    def save_log(self, path):
+        """Route_Log: every call and the route that served it, plus per-route health."""
+        with pd.ExcelWriter(path) as xw:
+            pd.DataFrame(self.log).to_excel(xw, sheet_name="Calls", index=False)
+            self.summary().to_excel(xw, sheet_name="Routes", index=False)
@@ -0,0 +1,273 @@
+# src/near_duplicates.py
+"""
+MinHash + LSH near-duplicate index over every story in the ingest table.
+
+The "Unique" criterion is judged by an LLM that only sees one story, so it
+cannot see duplicates. Here each story becomes a set of character shingles,
+summarized by a MinHash signature; LSH banding proposes candidate pairs
+(stories sharing any band bucket), candidates are verified by the estimated
+Jaccard similarity, and verified pairs are merged into clusters with a
+union-find. Everything but the final union-find is vectorized numpy, and the
+work grows with the number of shingles + candidate pairs, not with n^2.
+
+Every occurrence of a story is its own row, so a story repeated in a project
+is scored as a duplicate of its copy. Exact duplicates (after normalize()) are
+collapsed to one text before hashing and LSH, and added back as members of
+that text's cluster at similarity 1.0, so repeated or templated stories do not
+blow up the LSH buckets.
+
+Local_Unique_Score follows the 0/1/2 scale of the evaluation prompt:
+  2 - no other story at >= NEAR_DUP_THRESHOLD
+  1 - near-duplicate (>= NEAR_DUP_THRESHOLD)
+  0 - duplicate (>= DUP_THRESHOLD)
+"""
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset_reader import iter_stories
+
+DATA_FILE = "datasets/User_Stories_Combined.xlsx"
+MASTER = "Master_QURAL_Analysis.xlsx"
+OUT_DIR = Path("outputs/analysis_dedup")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16                  # 16 bands x 8 rows: candidate threshold ~ (1/16)^(1/8) = 0.71
+ROWS = NUM_PERM // BANDS
+NEAR_DUP_THRESHOLD = 0.7
+DUP_THRESHOLD = 0.9
+MAX_BUCKET_SIZE = 2000      # larger buckets are verified against their first member only (reported)
+VERIFY_CHUNK = 1_000_000    # candidate pairs compared per block
+SEED = 42
+STORY_CHUNK = 20000
+PERM_BLOCK = 16
+
+
+def with_occurrence(df, by=("Project", "Original_Story")):
+    """Occurrence = 0, 1, ... for repeats of the same story within a project."""
+    return df.assign(Occurrence=df.groupby(list(by)).cumcount())
+
+
+def load_stories():
+    """(Project, Original_Story, Occurrence), one row per story occurrence, from DATA_FILE or else the master."""
+    if os.path.exists(DATA_FILE):
+        stories = with_occurrence(pd.DataFrame(list(iter_stories(DATA_FILE)), columns=["Project", "Original_Story"]))
+    else:
+        print(f"⚠️ {DATA_FILE} not found, using the stories in {MASTER}")
+        df = pd.read_excel(MASTER, usecols=["Model", "Project", "Original_Story"]).dropna()
+        # every model judged every occurrence: keep each occurrence once, not once per model
+        stories = (with_occurrence(df, ("Model", "Project", "Original_Story"))
+                   .drop_duplicates(["Project", "Original_Story", "Occurrence"])
+                   .drop(columns="Model"))
+    return stories.reset_index(drop=True)
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", str(text).casefold()).strip()
+
+
+def shingle_hashes(texts, k=SHINGLE_SIZE):
+    """
+    64-bit polynomial hashes of every k-character window, for all texts at once.
+    Returns (hashes, owner) with owner[i] = index of the text hash i came from.
+    Texts shorter than k contribute one shingle (the whole text).
+    """
+    encoded = [normalize(t).encode("utf-8") or b" " for t in texts]
+    lengths = np.array([len(b) for b in encoded])
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    n_win = np.maximum(lengths - k + 1, 1)
+    owner = np.repeat(np.arange(len(texts)), n_win)
+    pos = np.arange(n_win.sum()) - np.repeat(np.cumsum(n_win) - n_win, n_win) + np.repeat(starts, n_win)
+    width = np.minimum(lengths, k)[owner]
+
+    base = np.uint64(1099511628211)
+    h = np.full(len(pos), np.uint64(14695981039346656037))
+    padded = np.concatenate([buf, np.zeros(k, dtype=np.uint64)])
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            byte = np.where(j < width, padded[pos + j], np.uint64(0))
+            h = (h ^ byte) * base
+    return h, owner
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=SEED, chunk=STORY_CHUNK):
+    """(n_texts x num_perm) uint32 MinHash signatures, via multiply-shift hashing."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    sigs = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for lo in range(0, len(texts), chunk):
+        h, owner = shingle_hashes(texts[lo:lo + chunk])
+        bounds = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+        for p in range(0, num_perm, PERM_BLOCK):
+            # (perms x shingles) layout keeps each story's shingles contiguous for reduceat
+            aa, bb = a[p:p + PERM_BLOCK, None], b[p:p + PERM_BLOCK, None]
+            with np.errstate(over="ignore"):
+                v = ((h[None, :] * aa + bb) >> np.uint64(32)).astype(np.uint32)
+            sigs[lo:lo + len(bounds), p:p + PERM_BLOCK] = np.minimum.reduceat(v, bounds, axis=1).T
+    return sigs
+
+
+def candidate_pairs(sigs, bands=BANDS, rows=ROWS):
+    """
+    Pairs (i < j) that share at least one LSH band bucket, and the items of
+    buckets over MAX_BUCKET_SIZE (only paired with their first member).
+    Pairs are de-duplicated after every band, so memory follows the distinct pairs.
+    """
+    n = len(sigs)
+    seen, truncated = np.zeros(0, dtype=np.int64), []
+    for band in range(bands):
+        block = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows])
+        _, bucket = np.unique(block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel(),
+                              return_inverse=True)
+        order = np.argsort(bucket, kind="stable")
+        sizes = np.bincount(bucket)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        # buckets of equal size are expanded together: one (buckets x size) member matrix per size
+        band_pairs = []
+        for size in np.unique(sizes[sizes > 1]):
+            bkts = np.flatnonzero(sizes == size)
+            members = order[starts[bkts][:, None] + np.arange(size)[None, :]]
+            if size <= MAX_BUCKET_SIZE:
+                i, j = np.triu_indices(size, k=1)
+            else:
+                i, j = np.zeros(size - 1, dtype=np.int64), np.arange(1, size)
+                truncated.append(members.ravel())
+            a, b = members[:, i].ravel(), members[:, j].ravel()
+            band_pairs.append(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))  # pair code i * n + j
+        if band_pairs:
+            seen = np.unique(np.concatenate([seen, *band_pairs]))
+    truncated = np.unique(np.concatenate(truncated)) if truncated else np.zeros(0, dtype=np.int64)
+    return np.stack([seen // n, seen % n], axis=1), truncated
+
+
+def pair_similarity(sigs, pairs, chunk=VERIFY_CHUNK):
+    """Estimated Jaccard similarity (share of equal MinHash values) of each pair, chunk pairs at a time."""
+    sim = np.empty(len(pairs))
+    for lo in range(0, len(pairs), chunk):
+        p = pairs[lo:lo + chunk]
+        sim[lo:lo + chunk] = (sigs[p[:, 0]] == sigs[p[:, 1]]).mean(axis=1)
+    return sim
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def cluster_pairs(n, pairs):
+    """Union-find over verified pairs; returns a cluster id (smallest member index) per item."""
+    parent = np.arange(n)
+    for i, j in pairs:
+        ri, rj = _find(parent, i), _find(parent, j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([_find(parent, i) for i in range(n)])
+
+
+def near_duplicate_table(stories):
+    """Adds Cluster_Id, Cluster_Size, Max_Similarity, Nearest_Story, Cross_Project, Local_Unique_Score, Bucket_Truncated."""
+    texts = stories["Original_Story"].astype(str).tolist()
+    n = len(texts)
+
+    # exact duplicates (after normalize) share one text in the index
+    code, uniq = pd.factorize(pd.Series([normalize(t) for t in texts]))
+    counts = np.bincount(code)
+    first = np.full(len(uniq), -1)
+    first[code[::-1]] = np.arange(n)[::-1]   # first occurrence of each distinct text
+    second = np.full(len(uniq), -1)
+    later = np.flatnonzero(np.arange(n) != first[code])
+    second[code[later[::-1]]] = later[::-1]  # second occurrence, where there is one
+
+    sigs = minhash_signatures(list(uniq))
+    pairs, truncated = candidate_pairs(sigs)
+    sim = pair_similarity(sigs, pairs)
+    keep = sim >= NEAR_DUP_THRESHOLD
+    pairs, sim = pairs[keep], sim[keep]
+
+    m = len(uniq)
+    best = np.zeros(m)
+    nearest = np.full(m, -1)  # nearest distinct text
+    for col, other in ((0, 1), (1, 0)):
+        order = np.argsort(sim, kind="stable")  # later writes win: highest similarity last
+        idx, oth = pairs[order, col], pairs[order, other]
+        best[idx] = np.maximum(best[idx], sim[order])
+        upd = sim[order] >= best[idx]
+        nearest[idx[upd]] = oth[upd]
+
+    # per occurrence: an exact copy is the nearest story, else the nearest distinct text's first occurrence
+    dup = counts[code] > 1
+    copy_of = np.where(np.arange(n) == first[code], second[code], first[code])
+    occ_best = np.where(dup, 1.0, best[code])
+    occ_nearest = np.where(dup, copy_of, np.where(nearest[code] >= 0, first[np.maximum(nearest[code], 0)], -1))
+    n_pairs = int((counts[pairs[:, 0]] * counts[pairs[:, 1]]).sum() + (counts * (counts - 1) // 2).sum())
+
+    cluster = cluster_pairs(m, pairs)[code]
+    projects = stories["Project"].to_numpy()
+    out = stories.copy()
+    out["Cluster_Id"] = pd.factorize(cluster)[0]
+    out["Cluster_Size"] = out.groupby("Cluster_Id")["Cluster_Id"].transform("size")
+    out["Cross_Project"] = out.groupby("Cluster_Id")["Project"].transform("nunique") > 1
+    out["Max_Similarity"] = occ_best
+    out["Nearest_Story"] = [texts[j] if j >= 0 else "" for j in occ_nearest]
+    out["Nearest_Project"] = [projects[j] if j >= 0 else "" for j in occ_nearest]
+    out["Local_Unique_Score"] = np.where(occ_best >= DUP_THRESHOLD, 0, np.where(occ_best >= NEAR_DUP_THRESHOLD, 1, 2))
+    out["Bucket_Truncated"] = np.isin(code, truncated)
+    return out, n_pairs
+
+
+def join_to_master(master, table):
+    """Master rows with Cluster_Id / Local_Unique_Score joined per occurrence (Project, Original_Story, Occurrence)."""
+    key = ["Project", "Original_Story", "Occurrence"]
+    cols = key + ["Cluster_Id", "Cluster_Size", "Cross_Project", "Max_Similarity", "Local_Unique_Score"]
+    master = with_occurrence(master, ("Model", "Project", "Original_Story"))
+    return master.merge(table[cols], on=key, how="left").drop(columns="Occurrence")
+
+
+def main():
+    stories = load_stories()
+    print(f"🔎 Indexing {len(stories)} stories from {stories['Project'].nunique()} projects...")
+    table, n_pairs = near_duplicate_table(stories)
+
+    clusters = (table[table["Cluster_Size"] > 1]
+                .groupby("Cluster_Id")
+                .agg(Cluster_Size=("Original_Story", "size"),
+                     Projects=("Project", lambda p: ", ".join(sorted(set(p)))),
+                     Max_Similarity=("Max_Similarity", "max"),
+                     Example=("Original_Story", "first"))
+                .sort_values("Cluster_Size", ascending=False)
+                .reset_index())
+
+    out_xlsx = OUT_DIR / "Near_Duplicates.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        table.to_excel(xw, sheet_name="Stories", index=False)
+        clusters.to_excel(xw, sheet_name="Clusters", index=False)
+        if os.path.exists(MASTER):
+            joined = join_to_master(pd.read_excel(MASTER), table)
+            if "Unique_Score" in joined.columns:
+                # how the LLM's Unique score lines up with the index
+                (joined.pivot_table(index="Model", columns="Local_Unique_Score", values="Unique_Score", aggfunc="mean")
+                       .to_excel(xw, sheet_name="LLM_Unique_vs_Local"))
+
+    print(f"Verified near-duplicate pairs: {n_pairs}")
+    if table["Bucket_Truncated"].any():
+        print(f"⚠️ {int(table['Bucket_Truncated'].sum())} stories sit in LSH buckets over MAX_BUCKET_SIZE={MAX_BUCKET_SIZE}; "
+              f"they were only checked against the first story of those buckets")
+    print(f"Clusters with >1 story: {len(clusters)} ({int(clusters['Cluster_Size'].sum()) if len(clusters) else 0} stories)")
+    print(table["Local_Unique_Score"].value_counts().sort_index().to_string())
+    print("✅ Saved:", out_xlsx)
+
+if __name__ == "__main__":
+    main()
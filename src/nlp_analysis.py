@@ -1,5 +1,5 @@
 import pandas as pd
-from bert_score import score
+from similarity_backends import get_backend
 from nltk.translate.bleu_score import sentence_bleu
 import nltk
 import numpy as np
@@ -37,9 +37,9 @@ def calculate_nlp_metrics():
     refs = sample['GPT_Reasoning'].tolist()
     cands = sample['Llama_Reasoning'].tolist()
 
-    print("   ...Calculating BERTScore (Deep Learning)...")
-    P, R, F1 = score(cands, refs, lang="en", verbose=True)
-    bert_mean = F1.mean().item()
+    backend_name, backend = get_backend()
+    print(f"   ...Calculating semantic similarity ({backend_name})...")
+    bert_mean = float(backend({"cand": cands, "ref": refs})[("cand", "ref")].mean())
 
     print("   ...Calculating BLEU Score (Lexical)...")
     bleu_scores = []
@@ -55,7 +55,7 @@ def calculate_nlp_metrics():
     print("="*40)
     print(f"Comparison: GPT-4o (Reasoning) vs Llama-3 (Reasoning)")
     print("-" * 40)
-    print(f"🔹 BERTScore (Semantic): {bert_mean:.4f}")
+    print(f"🔹 Semantic similarity ({backend_name}): {bert_mean:.4f}")
     print(f"   (0.0 = Different Meaning, 1.0 = Same Meaning)")
     print("-" * 40)
     print(f"🔹 BLEU Score (Lexical):  {bleu_mean:.4f}")
@@ -0,0 +1,142 @@
+# src/prompt_variant_report.py
+"""
+Compare the evaluation prompt variants in prompts.PROMPT_VARIANTS.
+
+Token report (no API calls): static-prefix tokens, per-story tokens and the
+estimated prompt tokens for a full run, using tiktoken when installed and a
+4-characters-per-token estimate otherwise. Each variant's repair (strict)
+prompt is listed next to it, since main.py repairs with the selected variant.
+The regeneration prompt is listed too, but QURAL_PROMPT_VARIANT does not reach
+the regeneration loop: its rewrite prompt and its judge's full evaluation
+prompt are not compacted, so the savings apply to phase 1 and repairs only.
+
+Agreement check (--check N): evaluates N sampled master stories with the
+compact prompt and compares the scores with the ones the same model gave
+under the current (full) prompt in the master, so only the compact calls are
+billed.
+
+Usage:
+    python src/prompt_variant_report.py
+    python src/prompt_variant_report.py --check 30
+"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from prompts import PROMPT_VARIANTS, STRICT_PROMPT_VARIANTS
+from regeneration_prompt import get_regeneration_prompt
+from compute_agreement_metrics import CRITERIA, MASTER, krippendorff_alpha_ordinal
+
+OUT_DIR = Path("outputs/analysis_prompts")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+CHECK_MODEL = os.getenv("QURAL_CHECK_MODEL", "GPT-4o-Mini")
+CHECK_SEED = 42
+N_MODELS = 5
+
+
+def token_counter():
+    """(name, fn(text) -> tokens)."""
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("o200k_base")
+        return "tiktoken/o200k_base", lambda t: len(enc.encode(t))
+    except Exception:
+        return "chars/4 estimate", lambda t: int(np.ceil(len(t) / 4))
+
+
+def prompt_split(messages):
+    """(static prefix, per-story part): everything before the last message is static."""
+    static = "".join(m["content"] for m in messages[:-1])
+    return static, messages[-1]["content"]
+
+
+def token_report(stories):
+    counter_name, count = token_counter()
+    # (variant, used by, baseline variant for Saving_vs_Full, builder)
+    builders = [(name, "phase 1", "full", build) for name, build in PROMPT_VARIANTS.items()]
+    builders += [(f"{name} (repair)", "repair pass", "full (repair)", build)
+                 for name, build in STRICT_PROMPT_VARIANTS.items()]
+    builders.append(("regeneration", "regeneration loop (not compacted)", None, get_regeneration_prompt))
+
+    rows = []
+    for name, used_by, baseline, build in builders:
+        static, _ = prompt_split(build("x"))
+        static_tokens = count(static)
+        story_tokens = np.array([count(prompt_split(build(s))[1]) for s in stories])
+        per_call = static_tokens + story_tokens
+        rows.append({
+            "Variant": name,
+            "Used_By": used_by,
+            "Baseline": baseline,
+            "Static_Prefix_Tokens": static_tokens,
+            "Mean_Story_Tokens": float(story_tokens.mean()),
+            "Mean_Prompt_Tokens": float(per_call.mean()),
+            "Static_Share": float(static_tokens / per_call.mean()),
+            "Run_Prompt_Tokens": int(per_call.sum() * N_MODELS),
+            "Counter": counter_name,
+        })
+    report = pd.DataFrame(rows)
+    mean_tokens = report.set_index("Variant")["Mean_Prompt_Tokens"]
+    report["Saving_vs_Full"] = 1.0 - report["Mean_Prompt_Tokens"] / report["Baseline"].map(mean_tokens)
+    return report.drop(columns="Baseline")
+
+
+def agreement_check(master, n, model=CHECK_MODEL):
+    """Per-criterion agreement between the master's scores and fresh compact-prompt scores."""
+    from llm_engine import call_llm
+    from main import build_row
+
+    ref = master[master["Model"] == model].drop_duplicates("Original_Story")
+    sample = ref.sample(n=min(n, len(ref)), random_state=CHECK_SEED)
+    build = PROMPT_VARIANTS["compact"]
+
+    pairs = []
+    for _, row in sample.iterrows():
+        response = call_llm(build(row["Original_Story"]), model_friendly_name=model)
+        new = build_row(model, row["Project"], row["Original_Story"], response)
+        if new:
+            pairs.append((row, new))
+    print(f"   {len(pairs)}/{len(sample)} compact responses parsed")
+
+    rows = []
+    for col in [f"{c}_Score" for c in CRITERIA] + ["Total_Score"]:
+        a = np.array([pd.to_numeric(r.get(col), errors="coerce") for r, _ in pairs], dtype=float)
+        b = np.array([pd.to_numeric(nw.get(col), errors="coerce") for _, nw in pairs], dtype=float)
+        ok = ~np.isnan(a) & ~np.isnan(b)
+        rows.append({
+            "Score": col,
+            "Stories": int(ok.sum()),
+            "Exact_Agreement": float((a[ok] == b[ok]).mean()) if ok.any() else np.nan,
+            "Mean_Abs_Diff": float(np.abs(a[ok] - b[ok]).mean()) if ok.any() else np.nan,
+            "Alpha_Full_vs_Compact": (krippendorff_alpha_ordinal(np.stack([a, b], axis=1))
+                                      if col != "Total_Score" else np.nan),
+        })
+    return pd.DataFrame(rows)
+
+
+def main(check=0):
+    master = pd.read_excel(MASTER)
+    stories = master["Original_Story"].dropna().astype(str).unique().tolist()
+
+    report = token_report(stories)
+    print(report[["Variant", "Used_By", "Static_Prefix_Tokens", "Mean_Prompt_Tokens", "Saving_vs_Full"]].to_string(index=False))
+    print("ℹ️ The regeneration loop (rewrite prompt and its judge) is not compacted; savings cover phase 1 and repairs.")
+
+    out_xlsx = OUT_DIR / "Prompt_Variant_Report.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        report.to_excel(xw, sheet_name="Token_Counts", index=False)
+        if check:
+            print(f"🔁 Agreement check: {check} stories with {CHECK_MODEL} (compact vs master)...")
+            agree = agreement_check(master, check)
+            agree.to_excel(xw, sheet_name="Agreement_Check", index=False)
+            print(agree.to_string(index=False))
+
+    print("✅ Saved:", out_xlsx)
+
+if __name__ == "__main__":
+    n = int(sys.argv[sys.argv.index("--check") + 1]) if "--check" in sys.argv else 0
+    main(check=n)
@@ -51,4 +51,61 @@ def get_evaluation_prompt(user_story_text):
     return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": f"Analyze this User Story: '{user_story_text}'"}
-    ]
\ No newline at end of file
+    ]
+
+# Compact variant: terse schema, byte-identical static system prefix, story alone
+# in the last message so provider-side prefix caching can reuse everything before it.
+COMPACT_SYSTEM_PROMPT = """QURAL user story judge. Score each of the 14 criteria 0 (missing), 1 (vague) or 2 (clear), and quote the EXACT substring of the story that satisfies it as "text" ("N/A" if missing).
+Criteria: Task Identification (the action), Task Nature (atomic task?), Role Identification (persona), Acceptance Criteria (conditions of satisfaction), Dependency (links to other stories/tasks), Business Need (benefit, "so that"), Priority (urgency), Quality Requirement (performance/security constraints), Estimable (enough detail to estimate), Unambiguous (clear phrasing), Well Formed (standard format), Problem Oriented (what, not how), Unique (distinct), Testable (verifiable).
+Reply with JSON only: {"evaluations": {"<criterion>": {"score": 0-2, "text": "..."}, ... one entry per criterion, names exactly as above}, "total_score": 0-28, "reasoning": "brief summary"}"""
+
+def get_compact_evaluation_prompt(user_story_text):
+    return [
+        {"role": "system", "content": COMPACT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_story_text}
+    ]
+
+# Partial variant: re-score only the listed criteria (used for delta re-judging
+# during regeneration). Static prefix first; criteria list and story last.
+PARTIAL_SYSTEM_PROMPT = """QURAL user story judge. Score ONLY the criteria listed in the request, each 0 (missing), 1 (vague) or 2 (clear), and quote the EXACT substring of the story that satisfies it as "text" ("N/A" if missing).
+Criteria: Task Identification (the action), Task Nature (atomic task?), Role Identification (persona), Acceptance Criteria (conditions of satisfaction), Dependency (links to other stories/tasks), Business Need (benefit, "so that"), Priority (urgency), Quality Requirement (performance/security constraints), Estimable (enough detail to estimate), Unambiguous (clear phrasing), Well Formed (standard format), Problem Oriented (what, not how), Unique (distinct), Testable (verifiable).
+Reply with JSON only: {"evaluations": {"<criterion>": {"score": 0-2, "text": "..."}, ... one entry per listed criterion, names exactly as listed}, "reasoning": "brief summary"}"""
+
+def get_partial_evaluation_prompt(user_story_text, criteria):
+    return [
+        {"role": "system", "content": PARTIAL_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Criteria: {'; '.join(criteria)}\nUser Story: {user_story_text}"}
+    ]
+
+# Strict variant: the full prompt plus explicit format rules, used to repair
+# responses that came back malformed in the main pass (see repair_queue.py).
+STRICT_FORMAT_RULES = """
+FORMAT RULES (a previous answer for this story could not be used):
+- "evaluations" MUST contain all 14 criteria, spelled exactly as listed above.
+- Every criterion MUST be an object {"score": <0, 1 or 2 as an integer>, "text": "<string>"}; never a bare number or string.
+- "total_score" MUST equal the sum of the 14 scores.
+- Output the JSON object only, with no markdown fences or commentary.
+"""
+
+def get_strict_evaluation_prompt(user_story_text):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + STRICT_FORMAT_RULES},
+        {"role": "user", "content": f"Analyze this User Story: '{user_story_text}'"}
+    ]
+
+def get_compact_strict_evaluation_prompt(user_story_text):
+    return [
+        {"role": "system", "content": COMPACT_SYSTEM_PROMPT + STRICT_FORMAT_RULES},
+        {"role": "user", "content": user_story_text}
+    ]
+
+PROMPT_VARIANTS = {
+    "full": get_evaluation_prompt,
+    "compact": get_compact_evaluation_prompt,
+}
+
+# repair prompt of each variant, so the repair pass stays on the selected variant
+STRICT_PROMPT_VARIANTS = {
+    "full": get_strict_evaluation_prompt,
+    "compact": get_compact_strict_evaluation_prompt,
+}
@@ -0,0 +1,124 @@
+# src/rank_correlation.py
+"""
+Model x model rank-correlation matrices from one ranking pass per score column.
+
+Each column of a (stories x models) pivot is ranked once; Spearman is then a
+single correlation of the rank matrix, and Kendall tau-b is computed for the
+upper triangle only with an O(n log n) inversion count (Knight's algorithm).
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+
+def rank_columns(X):
+    """
+    One ranking pass over a (stories x models) matrix.
+    Returns (average_ranks, dense_ranks, tie_pairs) where tie_pairs[j] is the
+    number of tied pairs in column j.
+    """
+    X = np.asarray(X, dtype=float)
+    avg = rankdata(X, method="average", axis=0)
+    dense = rankdata(X, method="dense", axis=0).astype(np.int64) - 1
+    tie_pairs = np.zeros(X.shape[1])
+    for j in range(X.shape[1]):
+        counts = np.bincount(dense[:, j]).astype(float)
+        tie_pairs[j] = (counts * (counts - 1) / 2).sum()
+    return avg, dense, tie_pairs
+
+
+def spearman_matrix(avg_ranks):
+    """Spearman rho for every column pair = Pearson correlation of the average ranks."""
+    R = np.asarray(avg_ranks, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mat = np.corrcoef(R, rowvar=False)
+    mat = np.atleast_2d(mat)
+    np.fill_diagonal(mat, 1.0)
+    return mat
+
+
+def count_inversions(a):
+    """
+    Number of pairs i < j with a[i] > a[j], by bottom-up merge sort.
+    Each level counts cross-half inversions for all blocks at once with a
+    single searchsorted over block-offset keys.
+    """
+    arr = np.asarray(a, dtype=np.int64).copy()
+    n = len(arr)
+    if n < 2:
+        return 0
+    K = int(arr.max()) + 1
+    pos = np.arange(n)
+    total = 0
+    width = 1
+    while width < n:
+        block = pos // (2 * width)
+        is_right = (pos % (2 * width)) >= width
+        key = block * K + arr
+
+        left_keys = key[~is_right]
+        rb = block[is_right]
+        left_end = np.searchsorted(left_keys, (rb + 1) * K, side="left")
+        not_greater = np.searchsorted(left_keys, key[is_right], side="right")
+        total += int((left_end - not_greater).sum())
+
+        arr = arr[np.argsort(key, kind="stable")]
+        width *= 2
+    return total
+
+
+def kendall_tau_b(dx, dy, ties_x, ties_y):
+    """
+    Kendall tau-b from dense ranks of two columns and their tie-pair counts.
+    Sort by (x, y), count joint ties, then count discordant pairs as the
+    inversions of y.
+    """
+    n = len(dx)
+    if n < 2:
+        return np.nan
+    ly = int(dy.max()) + 1
+    joint = dx * ly + dy
+    order = np.argsort(joint, kind="stable")
+    joint_counts = np.bincount(joint).astype(float)
+    ties_xy = (joint_counts * (joint_counts - 1) / 2).sum()
+
+    swaps = count_inversions(dy[order])
+    n0 = n * (n - 1) / 2.0
+    numer = n0 - ties_x - ties_y + ties_xy - 2 * swaps
+    denom = np.sqrt((n0 - ties_x) * (n0 - ties_y))
+    return numer / denom if denom > 0 else np.nan
+
+
+def kendall_matrix(dense_ranks, tie_pairs):
+    """Kendall tau-b for every column pair, upper triangle only, mirrored."""
+    k = dense_ranks.shape[1]
+    mat = np.eye(k)
+    for i in range(k):
+        for j in range(i + 1, k):
+            mat[i, j] = mat[j, i] = kendall_tau_b(dense_ranks[:, i], dense_ranks[:, j],
+                                                  tie_pairs[i], tie_pairs[j])
+    return mat
+
+
+def rank_correlation_matrices(pivot):
+    """Spearman and Kendall matrices (as DataFrames) for a stories x models pivot."""
+    models = list(pivot.columns)
+    avg, dense, ties = rank_columns(pivot.values)
+    spearman = pd.DataFrame(spearman_matrix(avg), index=models, columns=models)
+    kendall = pd.DataFrame(kendall_matrix(dense, ties), index=models, columns=models)
+    return spearman, kendall
+
+
+def rank_correlation_cube(pivots, models):
+    """
+    Stack per-column matrices into (columns x models x models) arrays.
+    pivots: {column_name: stories x models pivot}
+    """
+    columns = list(pivots.keys())
+    spearman = np.full((len(columns), len(models), len(models)), np.nan)
+    kendall = np.full_like(spearman, np.nan)
+    for c, col in enumerate(columns):
+        s, k = rank_correlation_matrices(pivots[col])
+        spearman[c] = s.reindex(index=models, columns=models).values
+        kendall[c] = k.reindex(index=models, columns=models).values
+    return columns, spearman, kendall
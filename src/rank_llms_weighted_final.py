@@ -1,3 +1,4 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -10,6 +11,10 @@ ICC_XLSX = "outputs/analysis_metrics/ICC_Summary.xlsx"
 OUT_DIR = Path("outputs/final_ranking")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Sensitivity sweep: (STEPS+1)(STEPS+2)/2 weight vectors on the (BERT, METEOR, CONS) simplex
+SENSITIVITY_STEPS = 300
+SWEEP_CHUNK = 8192
+
 def mean_offdiag(mat: pd.DataFrame) -> pd.Series:
     models = list(mat.index)
     out = {}
@@ -24,10 +29,52 @@ def minmax(s: pd.Series) -> pd.Series:
         return pd.Series(1.0, index=s.index)
     return (s - s.min()) / (s.max() - s.min())
 
-def main():
+def simplex_grid(steps=SENSITIVITY_STEPS) -> np.ndarray:
+    """All weight vectors (w_bert, w_meteor, w_cons) >= 0 summing to 1 on a 1/steps lattice."""
+    i, j = np.triu_indices(steps + 1)
+    return np.column_stack([i, j - i, steps - j]) / steps
+
+
+def weight_sensitivity(norm_table: pd.DataFrame, weights: np.ndarray, judge_scores: pd.Series,
+                       chunk: int = SWEEP_CHUNK) -> pd.DataFrame:
+    """
+    Final weighted score for every weight vector as one matrix product over the
+    normalized metric table (models x metrics), evaluated in chunks of weights.
+    Regenerator slot = top score; judge slot = main()'s rule, the highest
+    judge_scores (raw consistency), which does not depend on the weights.
+    """
+    models = list(norm_table.index)
+    M = norm_table.values.astype(float)
+    judge = models.index(judge_scores.reindex(models).astype(float).idxmax())
+    regen_wins = np.zeros(len(models))
+    score_sum = np.zeros(len(models))
+    same_model = 0  # weight vectors where the judge is also the regenerator
+
+    for start in range(0, len(weights), chunk):
+        S = weights[start:start + chunk] @ M.T                   # (weights x models)
+        score_sum += S.sum(axis=0)
+        top = np.argmax(S, axis=1)
+        regen_wins += np.bincount(top, minlength=len(models))
+        same_model += int((top == judge).sum())
+
+    n = len(weights)
+    judge_wins = np.zeros(len(models))
+    judge_wins[judge] = 1.0
+    return pd.DataFrame({
+        "Model": models,
+        "Regenerator_Win_Fraction": regen_wins / n,
+        "Judge_Win_Fraction": judge_wins,
+        "Judge_Is_Regenerator_Fraction": np.where(np.arange(len(models)) == judge, same_model / n, 0.0),
+        "Mean_Weighted_Score": score_sum / n,
+    }).sort_values("Regenerator_Win_Fraction", ascending=False)
+
+
+def main(sensitivity=False):
     # --- Load matrices ---
     text_xl = pd.ExcelFile(TEXT_XLSX)
-    bert = text_xl.parse("BERTScore_F1", index_col=0)
+    # offline similarity backends write their matrix as Semantic_Similarity instead
+    bert_sheet = "BERTScore_F1" if "BERTScore_F1" in text_xl.sheet_names else "Semantic_Similarity"
+    bert = text_xl.parse(bert_sheet, index_col=0)
     meteor = text_xl.parse("METEOR", index_col=0)
 
     rank_xl = pd.ExcelFile(RANK_XLSX)
@@ -88,7 +135,7 @@ def main():
 
     # --- Select winners ---
     # Judge = highest consistency (stable scoring)
-    judge_model = table.sort_values("Consistency_mean(Spearman,Kendall)", ascending=False).iloc[0]["Model"]
+    judge_model = table.set_index("Model")["Consistency_mean(Spearman,Kendall)"].astype(float).idxmax()
     # Regenerator = highest final weighted score
     regen_model = table.iloc[0]["Model"]
 
@@ -108,5 +155,15 @@ def main():
     print("\nWinner (Regeneration):", regen_model)
     print("Winner (Judge):", judge_model)
 
+    if sensitivity:
+        weights = simplex_grid()
+        norm_table = pd.DataFrame({"BERT": bert_n, "METEOR": meteor_n, "CONS": cons_n}, index=models)
+        sens = weight_sensitivity(norm_table, weights, consistency_m)
+        out_sens = OUT_DIR / "Weight_Sensitivity.xlsx"
+        sens.to_excel(out_sens, index=False)
+        print(f"\nWeight sensitivity over {len(weights)} weight vectors:")
+        print(sens.to_string(index=False))
+        print("Saved:", out_sens)
+
 if __name__ == "__main__":
-    main()
+    main(sensitivity="--sensitivity" in sys.argv)
@@ -1,73 +1,142 @@
 # src/regenerate_150_real_loop.py
 
+import os
 import pandas as pd
 from pathlib import Path
 from llm_engine import call_llm
-from prompts import get_evaluation_prompt
+from prompts import get_evaluation_prompt, get_partial_evaluation_prompt
 from evaluator import analyze_structural_quality
 from regeneration_prompt import get_regeneration_prompt
-
-MASTER = "Master_QURAL_Analysis.xlsx"
-SHORTLIST = "Shortlisted_150_Bad_Stories.csv"
+from regeneration_policy import (
+    MASTER, SHORTLIST, REGEN_MODEL, JUDGE_MODEL, THRESH_TOTAL, THRESH_TIER1, THRESH_AC, CRITERIA,
+    simplify_scores, extract_texts, criterion_total,
+)
+from result_store import ResultStore
 
 OUT_DIR = Path("outputs/regeneration_real")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-# 🔧 Model Strategy
-REGEN_MODEL = "Llama-3.1-70B"
-JUDGE_MODEL = "Claude-3-Haiku"
-
 # 🔧 Optimized Settings
 MAX_ITERS = 2
-THRESH_TOTAL = 22
-THRESH_TIER1 = 8
-THRESH_AC = 1
-
-
-def simplify_scores(evals: dict):
-    simple = {}
-    for k, v in evals.items():
-        if isinstance(v, dict):
-            simple[k] = int(v.get("score", 0) or 0)
-        elif isinstance(v, (int, float)):
-            simple[k] = int(v)
-        else:
-            try:
-                simple[k] = int(str(v))
-            except:
-                simple[k] = 0
-    return simple
 
+# Delta judging: candidates are re-scored only on criteria that were failing or
+# whose evidence text no longer appears in the candidate; the rest carry over.
+# Acceptance is always confirmed with a full 14-criterion judgement.
+DELTA_JUDGING = True
+PASS_SCORE = 2
 
-def judge_story(story_text: str):
-    prompt = get_evaluation_prompt(story_text)
-    resp = call_llm(prompt, model_friendly_name=JUDGE_MODEL)
+# Feed the judge's failed criteria, scores and reasoning into the next regeneration request.
+JUDGE_FEEDBACK = True
 
-    if not resp:
-        return None
+# Full judgements go through cascade.py (cheapest judge first, JUDGE_MODEL only
+# near the acceptance boundary) instead of straight to JUDGE_MODEL.
+CASCADE_JUDGING = os.getenv("QURAL_CASCADE_JUDGING", "0") == "1"
 
-    evals = resp.get("evaluations", {})
-    total = resp.get("total_score", 0)
-    simple = simplify_scores(evals)
 
+def _judgement(simple: dict, texts: dict, reported_total, reasoning: str, mode: str, n_judged: int,
+               model: str = JUDGE_MODEL):
     t1, t2, sound = analyze_structural_quality(simple)
-    ac = simple.get("Acceptance Criteria", 0)
-
     return {
-        "total": int(total or 0),
+        "total": criterion_total(simple),
+        "reported_total": reported_total,  # the judge's own total_score (None for delta calls)
         "tier1": int(t1),
         "tier2": int(t2),
-        "ac": int(ac),
+        "ac": int(simple.get("Acceptance Criteria", 0)),
         "sound": bool(sound),
+        "scores": simple,
+        "texts": texts,
+        "reasoning": reasoning,
+        "mode": mode,
+        "criteria_judged": n_judged,
+        "model": model,   # the judge whose answer this is (a cheaper one under CASCADE_JUDGING)
     }
 
 
+def judge_story(story_text: str):
+    """Full judgement -> (judgement or None, LLM calls it took)."""
+    if CASCADE_JUDGING:
+        from cascade import cascade_judge
+        resp, _, model, accepted, log = cascade_judge(story_text)
+        calls = len(log)
+        if not accepted:
+            resp = None  # only answers the cascade escalated, and the stronger judges failed
+    else:
+        resp = call_llm(get_evaluation_prompt(story_text), model_friendly_name=JUDGE_MODEL)
+        model, calls = JUDGE_MODEL, 1
+
+    if not resp:
+        return None, calls
+
+    evals = resp.get("evaluations", {})
+    total = pd.to_numeric(resp.get("total_score"), errors="coerce")
+    simple = simplify_scores(evals)
+
+    return _judgement(simple, extract_texts(evals), None if pd.isna(total) else int(total),
+                      str(resp.get("reasoning", "")), "full", len(CRITERIA), model), calls
+
+
+def carried_criteria(previous: dict, candidate: str):
+    """Passing criteria whose quoted evidence is still present verbatim in the candidate."""
+    keep = []
+    for c in CRITERIA:
+        text = previous["texts"].get(c, "N/A").strip()
+        if previous["scores"].get(c, 0) >= PASS_SCORE and text and not text.upper().startswith("N/A") and text in candidate:
+            keep.append(c)
+    return keep
+
+
+def judge_story_delta(candidate: str, previous: dict):
+    """
+    Re-score only the criteria that cannot be carried over from previous.
+    The total is the sum of the merged scores, like every other judgement here.
+    Returns (judgement or None, LLM calls it took).
+    """
+    keep = carried_criteria(previous, candidate)
+    todo = [c for c in CRITERIA if c not in keep]
+    simple = {c: previous["scores"][c] for c in keep}
+    texts = {c: previous["texts"][c] for c in keep}
+    reasoning = previous["reasoning"]
+
+    if todo:
+        resp = call_llm(get_partial_evaluation_prompt(candidate, todo), model_friendly_name=JUDGE_MODEL)
+        if not resp:
+            return None, 1
+        evals = {k: v for k, v in resp.get("evaluations", {}).items() if k in todo}
+        simple.update({c: 0 for c in todo})
+        simple.update(simplify_scores(evals))
+        texts.update(extract_texts(evals))
+        reasoning = str(resp.get("reasoning", ""))
+
+    return _judgement(simple, texts, None, reasoning, "delta", len(todo)), 1 if todo else 0
+
+
+def judge_feedback(judged: dict):
+    """Structured feedback for get_regeneration_prompt from a judgement."""
+    if not judged:
+        return None
+    scores = {c: judged["scores"].get(c, 0) for c in CRITERIA}
+    return {
+        "failed": {c: s for c, s in scores.items() if s < PASS_SCORE},
+        "scores": scores,
+        "reasoning": judged["reasoning"],
+    }
+
+
+def meets_threshold(judged: dict):
+    return (judged["total"] >= THRESH_TOTAL and
+            judged["tier1"] >= THRESH_TIER1 and
+            judged["ac"] >= THRESH_AC)
+
+
 def main():
     master = pd.read_excel(MASTER)
     shortlist = pd.read_csv(SHORTLIST)
 
+    # old scores on the same scale as the loop's judgements: the sum of the criterion scores
+    score_cols = [f"{c}_Score" for c in CRITERIA if f"{c}_Score" in master.columns]
+    master["Criterion_Total"] = master[score_cols].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
     old_scores = master.drop_duplicates("Original_Story") \
-        .set_index("Original_Story")["Total_Score"].to_dict()
+        .set_index("Original_Story")["Criterion_Total"].to_dict()
 
     stories = shortlist["Defective User Story"].tolist() \
         if "Defective User Story" in shortlist.columns \
@@ -75,15 +144,18 @@ def main():
 
     trace_rows = []
     final_rows = []
+    store = ResultStore()  # every judgement, indexed by story / criterion
 
     for idx, story in enumerate(stories, start=1):
 
         original = str(story)
         old_score = int(old_scores.get(original, 0) or 0)
 
-        baseline = judge_story(original)
+        baseline, llm_calls = judge_story(original)
         if baseline:
             best_total = baseline["total"]
+            store.add_judgement(original, baseline, baseline["model"], "regeneration", "regeneration",
+                                position=idx, iteration=0, meta={"mode": baseline["mode"]})
         else:
             best_total = old_score
 
@@ -92,18 +164,31 @@ def main():
 
         current_story = original
         prev_score = best_total
+        previous = baseline  # judgement of current_story, the base for delta re-judging
+        iterations_to_threshold = None
 
         for iteration in range(1, MAX_ITERS + 1):
 
-            regen_prompt = get_regeneration_prompt(current_story)
+            feedback = judge_feedback(previous) if JUDGE_FEEDBACK else None
+            regen_prompt = get_regeneration_prompt(current_story, feedback=feedback)
             regen_resp = call_llm(regen_prompt, model_friendly_name=REGEN_MODEL)
+            llm_calls += 1
 
             if not regen_resp or "regenerated_story" not in regen_resp:
                 stop_reason = "regen_failed"
                 break
 
             candidate = str(regen_resp["regenerated_story"])
-            judged = judge_story(candidate)
+            if DELTA_JUDGING and previous:
+                judged, calls = judge_story_delta(candidate, previous)  # all carried -> no call
+            else:
+                judged, calls = judge_story(candidate)
+            llm_calls += calls
+
+            # final acceptance is always decided by a full judgement
+            if judged and judged["mode"] != "full" and meets_threshold(judged):
+                judged, calls = judge_story(candidate)
+                llm_calls += calls
 
             if not judged:
                 stop_reason = "judge_failed"
@@ -111,6 +196,9 @@ def main():
 
             new_score = judged["total"]
             improvement = new_score - prev_score
+            store.add_judgement(candidate, judged, judged["model"], "regeneration", "regeneration",
+                                position=idx, iteration=iteration,
+                                meta={"mode": judged["mode"], "original": original})
 
             trace_rows.append({
                 "Index": idx,
@@ -118,11 +206,17 @@ def main():
                 "Old_Score": old_score,
                 "Previous_Score": prev_score,
                 "New_Score": new_score,
+                "Judge_Reported_Total": judged["reported_total"],
                 "Improvement": improvement,
                 "Tier1": judged["tier1"],
                 "Tier2": judged["tier2"],
                 "AC_Score": judged["ac"],
                 "Structurally_Sound": judged["sound"],
+                "Judge_Mode": judged["mode"],
+                "Judge_Model": judged["model"],
+                "Criteria_Judged": judged["criteria_judged"],
+                "Feedback_Failed": ", ".join(feedback["failed"]) if feedback else "",
+                "LLM_Calls_So_Far": llm_calls,
                 "Original_Story": original,
                 "Candidate_Story": candidate
             })
@@ -133,10 +227,9 @@ def main():
                 best_story = candidate
 
             # Stop if threshold reached
-            if (new_score >= THRESH_TOTAL and
-                judged["tier1"] >= THRESH_TIER1 and
-                judged["ac"] >= THRESH_AC):
+            if meets_threshold(judged):
                 stop_reason = f"threshold_met_iter{iteration}"
+                iterations_to_threshold = iteration
                 break
 
             # Stop if no improvement
@@ -146,6 +239,7 @@ def main():
 
             prev_score = new_score
             current_story = candidate
+            previous = judged
 
         final_rows.append({
             "Index": idx,
@@ -154,17 +248,26 @@ def main():
             "Final_Score": best_total,
             "Score_Improvement": best_total - old_score,
             "Final_Story": best_story,
-            "Stop_Reason": stop_reason
+            "Stop_Reason": stop_reason,
+            "Iterations_To_Threshold": iterations_to_threshold,
+            "LLM_Calls": llm_calls,
         })
 
         print(f"[{idx}/{len(stories)}] Old={old_score} → Final={best_total} | Δ={best_total - old_score} | {stop_reason}")
 
+    store.close()
     trace_df = pd.DataFrame(trace_rows)
     final_df = pd.DataFrame(final_rows)
 
     trace_df.to_excel(OUT_DIR / "Regeneration_Trace_150.xlsx", index=False)
     final_df.to_excel(OUT_DIR / "Regeneration_Final_150.xlsx", index=False)
 
+    fixed = final_df[final_df["Iterations_To_Threshold"].notna()] if len(final_df) else final_df
+    if len(fixed):
+        print(f"\n🎯 Fixed {len(fixed)}/{len(final_df)} stories | "
+              f"mean iterations to threshold = {fixed['Iterations_To_Threshold'].mean():.2f} | "
+              f"mean LLM calls per fixed story = {fixed['LLM_Calls'].mean():.2f}")
+
     print("\n✅ Saved:")
     print(" - Regeneration_Trace_150.xlsx")
     print(" - Regeneration_Final_150.xlsx")
@@ -0,0 +1,45 @@
+# src/regeneration_policy.py
+"""
+Models, acceptance thresholds and judgement helpers shared by the regeneration
+loop (regenerate_150_real_loop.py) and the judging cascade (cascade.py).
+Nothing here creates an API client, so offline tools can import it.
+"""
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA
+
+MASTER = "Master_QURAL_Analysis.xlsx"
+SHORTLIST = "Shortlisted_150_Bad_Stories.csv"
+
+# 🔧 Model Strategy
+REGEN_MODEL = "Llama-3.1-70B"
+JUDGE_MODEL = "Claude-3-Haiku"
+
+# 🔧 Acceptance thresholds
+THRESH_TOTAL = 22
+THRESH_TIER1 = 8
+THRESH_AC = 1
+
+CRITERIA = TIER_1_CRITERIA + TIER_2_CRITERIA
+
+
+def simplify_scores(evals: dict):
+    simple = {}
+    for k, v in evals.items():
+        if isinstance(v, dict):
+            simple[k] = int(v.get("score", 0) or 0)
+        elif isinstance(v, (int, float)):
+            simple[k] = int(v)
+        else:
+            try:
+                simple[k] = int(str(v))
+            except:
+                simple[k] = 0
+    return simple
+
+
+def extract_texts(evals: dict):
+    return {k: str(v.get("text", "N/A")) if isinstance(v, dict) else "N/A" for k, v in evals.items()}
+
+
+def criterion_total(simple: dict):
+    """Total on one scale for every judgement: the sum of the criterion scores."""
+    return int(sum(simple.get(c, 0) for c in CRITERIA))
@@ -14,8 +14,29 @@ Rules:
   "notes": "brief summary of improvements"
 }
 """
-def get_regeneration_prompt(defective_story: str):
+def format_feedback(feedback: dict):
+    """
+    feedback: {"failed": {criterion: score}, "scores": {criterion: score}, "reasoning": str}
+    from the judge of the story being rewritten.
+    """
+    lines = ["Judge feedback on this story (scores 0 = missing, 1 = vague, 2 = clear):"]
+    failed = feedback.get("failed") or {}
+    if failed:
+        lines.append("Fix these criteria first:")
+        lines += [f"- {c}: {s}" for c, s in failed.items()]
+    passed = [c for c, s in (feedback.get("scores") or {}).items() if c not in failed]
+    if passed:
+        lines.append("Keep these as they are: " + ", ".join(passed))
+    if feedback.get("reasoning"):
+        lines.append(f"Judge reasoning: {feedback['reasoning']}")
+    return "\n".join(lines)
+
+def get_regeneration_prompt(defective_story: str, feedback: dict = None):
+    # story stays last so the static prefix (and feedback layout) is cache-friendly
+    content = f"Defective User Story:\n{defective_story}"
+    if feedback:
+        content = f"{format_feedback(feedback)}\n\n{content}"
     return [
         {"role":"system", "content": REGEN_SYSTEM_PROMPT},
-        {"role":"user", "content": f"Defective User Story:\n{defective_story}"}
+        {"role":"user", "content": content}
     ]
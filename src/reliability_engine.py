@@ -0,0 +1,254 @@
+# src/reliability_engine.py
+"""
+Weighted (resampling-friendly) forms of the reliability statistics used in
+compute_agreement_metrics.py.
+
+Every estimator takes a weight matrix W (replicates x units). Row r of W says
+how many times each story appears in replicate r, so:
+  - W = ones((1, n))              -> the ordinary point estimate
+  - W = bootstrap counts          -> one bootstrap replicate per row
+  - W = one-hot project indicator -> one estimate per project (stratified)
+
+The per-unit work (pairwise disagreements, level counts, sums of squares,
+contingency cells) is done once; each replicate is then only a matrix product.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy import sparse
+
+N_BOOT = 2000
+BOOT_SEED = 42
+CI_LEVEL = 0.95
+CHUNK_SIZE = 250
+
+
+# ---------------- Krippendorff's Alpha (ordinal) ----------------
+
+def alpha_unit_stats(data, min_rating=0, max_rating=2):
+    """
+    Per-unit sufficient statistics for krippendorff_alpha_ordinal.
+    Returns (two_s, pairs, counts) with shapes (n,), (n,), (n, levels).
+    """
+    data = np.asarray(data, dtype=float)
+    rng = max_rating - min_rating
+    valid = ~np.isnan(data)
+    m = valid.sum(axis=1)
+
+    # sum over i<j of squared normalized distance, computed per unit
+    filled = np.where(valid, data, 0.0)
+    s1 = filled.sum(axis=1)
+    s2 = (filled ** 2).sum(axis=1)
+    pair_sum = (m * s2 - s1 ** 2) / (rng ** 2)  # = sum_{i<j} (a_i - a_j)^2 / rng^2
+    pairable = m >= 2
+    two_s = np.where(pairable, 2 * pair_sum, 0.0)
+    pairs = np.where(pairable, m * (m - 1), 0).astype(float)
+
+    levels = np.arange(min_rating, max_rating + 1)
+    as_int = np.where(valid, filled, np.nan)
+    with np.errstate(invalid="ignore"):
+        as_int = np.trunc(as_int)
+    counts = np.stack([(as_int == l).sum(axis=1) for l in levels], axis=1).astype(float)
+    return two_s, pairs, counts
+
+
+def alpha_weighted(stats, W, min_rating=0, max_rating=2):
+    """Krippendorff's alpha for every row of W. Returns array (replicates,)."""
+    two_s, pairs, counts = stats
+    W = np.atleast_2d(W)
+    rng = max_rating - min_rating
+    levels = np.arange(min_rating, max_rating + 1)
+
+    Do_num = W @ two_s
+    Do_den = W @ pairs
+    level_counts = W @ counts
+    n = level_counts.sum(axis=1)
+
+    dist = ((levels[:, None] - levels[None, :]) / rng) ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        Do = Do_num / Do_den
+        p = level_counts / n[:, None]
+        De = np.einsum("ri,ij,rj->r", p, dist, p)
+        alpha = 1.0 - Do / De
+    alpha[(Do_den == 0) | (n <= 1) | (De == 0)] = np.nan
+    return alpha
+
+
+# ---------------- ICC(2,1) ----------------
+
+def icc_unit_stats(ratings_matrix):
+    """Per-unit sums needed for icc_2_1: (X, row_sum^2, sum x^2)."""
+    X = np.asarray(ratings_matrix, dtype=float)
+    return X, X.sum(axis=1) ** 2, (X ** 2).sum(axis=1)
+
+
+def icc_weighted(stats, W):
+    """ICC(2,1) for every row of W. Returns array (replicates,)."""
+    X, row_sq, sq = stats
+    W = np.atleast_2d(W).astype(float)
+    if np.isnan(X).any():
+        return np.full(W.shape[0], np.nan)
+
+    k = X.shape[1]
+    n = W.sum(axis=1)
+    col_sums = W @ X                     # (r, k)
+    grand_sum = col_sums.sum(axis=1)
+    correction = grand_sum ** 2 / (n * k)
+
+    SS_total = W @ sq - correction
+    SS_target = (W @ row_sq) / k - correction
+    SS_rater = (col_sums ** 2).sum(axis=1) / n - correction
+    SS_error = SS_total - SS_target - SS_rater
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        MS_target = SS_target / (n - 1)
+        MS_rater = SS_rater / (k - 1) if k > 1 else np.full_like(n, np.nan)
+        MS_error = SS_error / ((n - 1) * (k - 1))
+        denom = MS_target + (k - 1) * MS_error + (k * (MS_rater - MS_error) / n)
+        icc = (MS_target - MS_error) / denom
+    icc[(denom == 0) | np.isnan(denom)] = np.nan
+    return icc
+
+
+# ---------------- Spearman / Kendall on a contingency table ----------------
+
+def pair_cell_stats(x, y):
+    """
+    Encode a pair of rating columns as cells of their (x-level, y-level)
+    contingency table. Returns (cell_matrix, lx, ly) where cell_matrix is a
+    sparse (n x lx*ly) one-hot map from stories to cells.
+    """
+    _, ix = np.unique(np.asarray(x, dtype=float), return_inverse=True)
+    _, iy = np.unique(np.asarray(y, dtype=float), return_inverse=True)
+    lx, ly = int(ix.max()) + 1, int(iy.max()) + 1
+    n = len(ix)
+    cells = sparse.csr_matrix((np.ones(n), (np.arange(n), ix * ly + iy)), shape=(n, lx * ly))
+    return cells, lx, ly
+
+
+def _tables(stats, W):
+    cells, lx, ly = stats
+    W = np.atleast_2d(W).astype(float)
+    T = np.asarray((cells.T @ W.T).T)
+    return T.reshape(W.shape[0], lx, ly)
+
+
+def _midranks(counts):
+    # average rank of each level given per-level counts (r x levels)
+    below = np.cumsum(counts, axis=1) - counts
+    return below + (counts + 1) / 2.0
+
+
+def spearman_weighted(stats, W):
+    """Spearman rho (average ranks for ties) for every row of W."""
+    T = _tables(stats, W)
+    cx, cy = T.sum(axis=2), T.sum(axis=1)
+    n = cx.sum(axis=1)
+    mean_rank = ((n + 1) / 2.0)[:, None]
+    rx = _midranks(cx) - mean_rank
+    ry = _midranks(cy) - mean_rank
+
+    cov = np.einsum("ra,rab,rb->r", rx, T, ry)
+    var_x = (cx * rx ** 2).sum(axis=1)
+    var_y = (cy * ry ** 2).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cov / np.sqrt(var_x * var_y)
+
+
+def kendall_weighted(stats, W):
+    """Kendall tau-b for every row of W."""
+    T = _tables(stats, W)
+    # weight strictly below-left / below-right of each cell
+    cum = T.cumsum(axis=1).cumsum(axis=2)
+    pad = np.zeros_like(cum)
+    pad[:, 1:, 1:] = cum[:, :-1, :-1]
+    lower_left = pad
+    col_below = np.zeros_like(T)
+    col_below[:, 1:, :] = T.cumsum(axis=1)[:, :-1, :]
+    below_total = col_below.sum(axis=2, keepdims=True)
+    below_le = col_below.cumsum(axis=2)
+    lower_right = below_total - below_le
+
+    concordant = (T * lower_left).sum(axis=(1, 2))
+    discordant = (T * lower_right).sum(axis=(1, 2))
+
+    cx, cy = T.sum(axis=2), T.sum(axis=1)
+    n = cx.sum(axis=1)
+    n0 = n * (n - 1) / 2.0
+    n1 = (cx * (cx - 1) / 2.0).sum(axis=1)
+    n2 = (cy * (cy - 1) / 2.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (concordant - discordant) / np.sqrt((n0 - n1) * (n0 - n2))
+
+
+# ---------------- Bootstrap driver ----------------
+
+def bootstrap_weights(n_units, n_reps, rng):
+    """Draw n_reps story-level resamples as index arrays and return their count matrix."""
+    idx = rng.integers(0, n_units, size=(n_reps, n_units))
+    offsets = (np.arange(n_reps) * n_units)[:, None]
+    counts = np.bincount((idx + offsets).ravel(), minlength=n_reps * n_units)
+    return counts.reshape(n_reps, n_units)
+
+
+def _run_chunk(estimators, n_units, n_reps, seed):
+    W = bootstrap_weights(n_units, n_reps, np.random.default_rng(seed))
+    return [fn(W) for fn in estimators]
+
+
+def bootstrap_replicates(estimators, n_units, n_boot=N_BOOT, seed=BOOT_SEED, workers=None):
+    """
+    Evaluate each estimator (a callable W -> array) on the same n_boot
+    story-level bootstrap replicates. Replicates are drawn in fixed-size chunks
+    from a SeedSequence, so results do not depend on the number of workers.
+    Returns one (n_boot,) array per estimator.
+    """
+    n_chunks = -(-n_boot // CHUNK_SIZE)
+    sizes = [min(CHUNK_SIZE, n_boot - i * CHUNK_SIZE) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    workers = workers or os.cpu_count() or 1
+    job = partial(_run_chunk, estimators, n_units)
+
+    if workers <= 1 or n_chunks == 1:
+        parts = [job(s, sd) for s, sd in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, n_chunks)) as ex:
+            parts = list(ex.map(job, sizes, seeds))
+
+    return [np.concatenate([p[i] for p in parts]) for i in range(len(estimators))]
+
+
+def _run_block(estimators, W):
+    return [fn(W) for fn in estimators]
+
+
+def evaluate_weights(estimators, W, workers=1):
+    """
+    Evaluate each estimator on the rows of a fixed weight matrix (e.g. one
+    indicator row per project), splitting the rows across a process pool.
+    Returns one (rows,) array per estimator.
+    """
+    W = np.atleast_2d(W)
+    blocks = [b for b in np.array_split(W, max(1, min(workers, len(W)))) if len(b)]
+    job = partial(_run_block, estimators)
+
+    if len(blocks) <= 1:
+        parts = [job(b) for b in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(blocks)) as ex:
+            parts = list(ex.map(job, blocks))
+
+    return [np.concatenate([p[i] for p in parts]) for i in range(len(estimators))]
+
+
+def percentile_ci(replicates, level=CI_LEVEL):
+    """Percentile interval over non-NaN replicates."""
+    reps = np.asarray(replicates, dtype=float)
+    reps = reps[~np.isnan(reps)]
+    if len(reps) == 0:
+        return np.nan, np.nan
+    tail = (1.0 - level) / 2.0 * 100
+    lo, hi = np.percentile(reps, [tail, 100 - tail])
+    return float(lo), float(hi)
@@ -0,0 +1,180 @@
+# src/repair_queue.py
+"""
+Deferred repair of failed or malformed extractions.
+
+During Phase 1 a story whose call returned nothing is written as a placeholder
+row (Repair_Status "pending") and a story with non-dict / missing / out-of-range
+criteria keeps its partial row (Repair_Status "malformed"). Both are pushed here
+instead of being retried inline. At the end of the run the queue is drained in
+one concurrent pass, one call per distinct (model, story), optionally with a
+different model (QURAL_REPAIR_MODEL) and the stricter prompt, and the results
+are spliced back into the same Detailed_<sheet>.xlsx rows:
+
+    pending   -> repaired row, or dropped if the repair failed too
+    malformed -> repaired row, or kept as it was with Repair_Status "failed"
+
+A repair by a different model is that model's judgement, not the queued
+model's, so it is never spliced into the queued model's rows (which then count
+as unrepaired). It is written to a separate cross-model file instead, labelled
+with the model that produced it, outside the per-model outputs and metrics.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA
+
+CRITERIA = TIER_1_CRITERIA + TIER_2_CRITERIA
+
+REPAIR_WORKERS = 4
+REPAIR_MODEL = os.getenv("QURAL_REPAIR_MODEL")            # None: repair with the model that failed
+REPAIR_STRICT = os.getenv("QURAL_REPAIR_STRICT", "1") == "1"
+
+OPEN_STATUSES = ("pending", "malformed")
+
+
+def malformed_criteria(response):
+    """Criteria that are missing, not {"score", "text"} objects, or scored outside 0-2."""
+    evals = response.get("evaluations") if isinstance(response, dict) else None
+    if not isinstance(evals, dict):
+        return list(CRITERIA)
+    bad = []
+    for c in CRITERIA:
+        v = evals.get(c)
+        if not isinstance(v, dict):
+            bad.append(c)
+            continue
+        try:
+            ok = int(float(v.get("score"))) in (0, 1, 2)
+        except (TypeError, ValueError):
+            ok = False
+        if not ok:
+            bad.append(c)
+    return bad
+
+
+def placeholder_row(model_name, sheet_name, user_story):
+    return {
+        "Model": model_name,
+        "Project": sheet_name,
+        "Original_Story": user_story,
+        "Repair_Status": "pending",
+    }
+
+
+class RepairQueue:
+    def __init__(self):
+        self.items = []  # {"model", "sheet", "path", "position", "story", "status", "reason"}
+
+    def __len__(self):
+        return len(self.items)
+
+    def paths(self):
+        return sorted({item["path"] for item in self.items})
+
+    def push(self, model_name, sheet_name, output_path, position, user_story, status, reason=""):
+        self.items.append({
+            "model": model_name, "sheet": sheet_name, "path": output_path,
+            "position": position, "story": user_story, "status": status, "reason": reason,
+        })
+
+    def push_open_rows(self, model_name, sheet_name, output_path, frame):
+        """Re-queue rows a previous, interrupted run left pending or malformed."""
+        if "Repair_Status" not in frame.columns:
+            return 0
+        open_rows = frame.index[frame["Repair_Status"].isin(OPEN_STATUSES)]
+        for pos in open_rows:
+            self.push(model_name, sheet_name, output_path, int(pos),
+                      frame.at[pos, "Original_Story"], frame.at[pos, "Repair_Status"], "resumed")
+        return len(open_rows)
+
+    def drain(self, call, build_row, key=lambda s: s, on_row=None, cross_model_path=None):
+        """
+        call(story, model_name) -> response, build_row as in main.py.
+        Stories are repaired once per (model, key(story)), or once per key(story) when
+        REPAIR_MODEL is set, and fanned out to every queued row; on_row(row) is called
+        for every row repaired by its own model. Repairs by REPAIR_MODEL for other
+        models are appended to cross_model_path (if given), one row per story and
+        Sheet_Row, with the models it stands in for in Repair_For_Model.
+        Returns {"repaired", "dropped", "failed", "cross_model"} counts.
+        """
+        if not self.items:
+            return {"repaired": 0, "dropped": 0, "failed": 0, "cross_model": 0}
+
+        def job_key(item):
+            # with REPAIR_MODEL set, a story is repaired once however many models failed on it
+            return REPAIR_MODEL or item["model"], key(item["story"])
+
+        jobs = {}
+        for item in self.items:
+            jobs.setdefault(job_key(item), item["story"])
+
+        def run(job):
+            (model_name, _), story = job
+            response = call(story, model_name)
+            return response if response and not malformed_criteria(response) else None
+
+        print(f"🛠️ Repairing {len(self.items)} rows ({len(jobs)} distinct calls, "
+              f"{REPAIR_WORKERS} workers{', model ' + REPAIR_MODEL if REPAIR_MODEL else ''})...")
+        with ThreadPoolExecutor(max_workers=REPAIR_WORKERS) as pool:
+            responses = dict(zip(jobs, pool.map(run, jobs.items())))
+
+        counts = {"repaired": 0, "dropped": 0, "failed": 0, "cross_model": 0}
+        cross_rows = {}  # (story, sheet, Sheet_Row) -> one REPAIR_MODEL row for every model that failed there
+
+        by_path = {}
+        for item in self.items:
+            by_path.setdefault(item["path"], []).append(item)
+
+        for path, items in by_path.items():
+            frame = pd.read_excel(path)
+            rows = frame.to_dict("records")
+            drop = set()
+            for item in items:
+                response = responses[job_key(item)]
+                sheet_row = rows[item["position"]].get("Sheet_Row")
+                sheet_row = None if pd.isna(sheet_row) else int(sheet_row)
+                if REPAIR_MODEL and REPAIR_MODEL != item["model"]:
+                    # another model's judgement: recorded in cross_model_path, not in this model's rows
+                    if response:
+                        cross = (key(item["story"]), item["sheet"], sheet_row)
+                        if cross not in cross_rows:
+                            row = build_row(REPAIR_MODEL, item["sheet"], item["story"], response)
+                            if sheet_row is not None:
+                                row["Sheet_Row"] = sheet_row
+                            row["Repair_For_Model"] = []
+                            cross_rows[cross] = row
+                        if item["model"] not in cross_rows[cross]["Repair_For_Model"]:
+                            cross_rows[cross]["Repair_For_Model"].append(item["model"])
+                    response = None
+                if response:
+                    row = build_row(item["model"], item["sheet"], item["story"], response)
+                    if sheet_row is not None:
+                        row["Sheet_Row"] = sheet_row
+                    row["Repair_Status"] = "repaired"
+                    row["Repaired_By"] = item["model"]
+                    rows[item["position"]] = row
+                    if on_row:
+                        on_row(row)
+                    counts["repaired"] += 1
+                elif item["status"] == "pending":
+                    drop.add(item["position"])
+                    counts["dropped"] += 1
+                else:
+                    rows[item["position"]]["Repair_Status"] = "failed"
+                    counts["failed"] += 1
+            kept = [r for i, r in enumerate(rows) if i not in drop]
+            columns = list(dict.fromkeys([*frame.columns, *(c for r in kept for c in r)]))
+            pd.DataFrame(kept, columns=columns).to_excel(path, index=False)
+
+        for row in cross_rows.values():
+            row["Repair_For_Model"] = ", ".join(sorted(row["Repair_For_Model"]))
+        counts["cross_model"] = len(cross_rows)
+
+        if cross_rows and cross_model_path:
+            previous = [pd.read_excel(cross_model_path)] if os.path.exists(cross_model_path) else []
+            pd.concat(previous + [pd.DataFrame(list(cross_rows.values()))], ignore_index=True).to_excel(cross_model_path, index=False)
+
+        self.items = []
+        return counts
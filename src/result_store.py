@@ -0,0 +1,351 @@
+# src/result_store.py
+"""
+Indexed local store for evaluation results (SQLite, standard library only).
+
+Phase 1 (main.py) and the regeneration loop write every judgement here as it
+is produced, next to the Excel outputs, so questions like "all Claude scores
+for project X where Priority = 0" are an indexed lookup instead of loading the
+whole master.
+
+    stories      story_id, canonical text (unique), original text
+    evaluations  one judgement per story occurrence: (source, model, project,
+                 position, iteration), with the occurrence's exact story text.
+                 position is the story's row in the input sheet in Phase 1
+                 (Sheet_Row; else its order within model / project) and the
+                 shortlist Index in the regeneration loop, whose iteration is
+                 0 for the baseline. Re-writing the same key replaces it
+                 (e.g. after a repair)
+    scores       one row per (evaluation, criterion), with model / project /
+                 story_id repeated so filtered aggregates are index-only
+
+Usage:
+    python src/result_store.py import Master_QURAL_Analysis.xlsx
+    python src/result_store.py query --model Claude-3-Haiku --criterion Priority --score 0
+    python src/result_store.py export outputs/store_export.xlsx [--model M] [--project P] [--source S]
+    python src/result_store.py check Master_QURAL_Analysis.xlsx    # import / export round trip
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import TIER_1_CRITERIA, TIER_2_CRITERIA
+
+STORE_PATH = Path(os.getenv("QURAL_STORE", "outputs/results.db"))
+CRITERIA = TIER_1_CRITERIA + TIER_2_CRITERIA
+COMMIT_EVERY = 500  # rows between commits while writing
+SCHEMA_VERSION = 2  # PRAGMA user_version; older stores have to be re-imported
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    story_id  INTEGER PRIMARY KEY,
+    canonical TEXT NOT NULL UNIQUE,
+    text      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    eval_id     INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    project     TEXT NOT NULL,
+    story_id    INTEGER NOT NULL REFERENCES stories(story_id),
+    story_text  TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    iteration   INTEGER NOT NULL DEFAULT 0,
+    route       TEXT,
+    total_score REAL,
+    tier1       REAL,
+    tier2       REAL,
+    sound       INTEGER,
+    reasoning   TEXT,
+    meta        TEXT,
+    created     REAL,
+    UNIQUE (source, model, project, position, iteration)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    eval_id   INTEGER NOT NULL REFERENCES evaluations(eval_id),
+    story_id  INTEGER NOT NULL,
+    model     TEXT NOT NULL,
+    project   TEXT NOT NULL,
+    criterion TEXT NOT NULL,
+    score     REAL,
+    text      TEXT,
+    PRIMARY KEY (eval_id, criterion)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_eval_story ON evaluations(story_id);
+CREATE INDEX IF NOT EXISTS idx_eval_model_project ON evaluations(model, project);
+CREATE INDEX IF NOT EXISTS idx_eval_trace ON evaluations(source, position, iteration);
+CREATE INDEX IF NOT EXISTS idx_scores_criterion ON scores(criterion, model, project, score);
+CREATE INDEX IF NOT EXISTS idx_scores_story ON scores(story_id, criterion);
+"""
+
+
+def canonical_story(text):
+    """Same key as main.canonical_story: case-folded with whitespace collapsed."""
+    return " ".join(str(text).casefold().split())
+
+
+def _num(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return None if v != v else float(v)
+    v = pd.to_numeric(v, errors="coerce")
+    return None if pd.isna(v) else float(v)
+
+
+def _text(v):
+    return None if v is None or (isinstance(v, float) and v != v) or v == "" else str(v)
+
+
+class ResultStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        has_tables = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'evaluations'").fetchone()
+        if has_tables and version < SCHEMA_VERSION:
+            self.conn.close()
+            raise RuntimeError(f"{self.path} was written by an older result_store (one row per story, "
+                               f"not per occurrence); delete it and re-import the Detailed / master files")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._pending = 0
+
+    # ---------------- writing ----------------
+
+    def story_id(self, text):
+        key = canonical_story(text)
+        self.conn.execute("INSERT OR IGNORE INTO stories (canonical, text) VALUES (?, ?)", (key, str(text)))
+        return self.conn.execute("SELECT story_id FROM stories WHERE canonical = ?", (key,)).fetchone()[0]
+
+    def add_row(self, row, source="phase1", meta=None, position=None, iteration=0):
+        """
+        Store one master-format row (Model, Project, Original_Story, *_Score, *_Text, ...)
+        as the judgement of one story occurrence; position defaults to row["Sheet_Row"].
+        """
+        if position is None:
+            position = _num(row.get("Sheet_Row"))
+        if position is None:
+            raise ValueError("add_row needs the occurrence: a Sheet_Row column or position=")
+        story = str(row["Original_Story"])
+        sid = self.story_id(story)
+        model, project = row["Model"], str(row["Project"])
+        sound = row.get("Structurally_Sound")
+        # same occurrence again, e.g. after a repair: the new judgement replaces it
+        old = self.conn.execute(
+            """SELECT eval_id FROM evaluations
+               WHERE source = ? AND model = ? AND project = ? AND position = ? AND iteration = ?""",
+            (source, model, project, int(position), int(iteration))).fetchone()
+        if old:
+            self.conn.execute("DELETE FROM scores WHERE eval_id = ?", old)
+            self.conn.execute("DELETE FROM evaluations WHERE eval_id = ?", old)
+        cur = self.conn.execute(
+            """INSERT INTO evaluations
+               (source, model, project, story_id, story_text, position, iteration, route,
+                total_score, tier1, tier2, sound, reasoning, meta, created)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (source, model, project, sid, story, int(position), int(iteration), _text(row.get("Route")),
+             _num(row.get("Total_Score")), _num(row.get("Tier_1_Score")), _num(row.get("Tier_2_Score")),
+             None if sound is None or pd.isna(sound) else int(bool(sound)),
+             _text(row.get("Reasoning")),
+             json.dumps(meta) if meta else None, time.time()))
+        eval_id = cur.lastrowid
+        self.conn.executemany(
+            "INSERT INTO scores (eval_id, story_id, model, project, criterion, score, text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(eval_id, sid, model, project, c, _num(row.get(f"{c}_Score")),
+              _text(row.get(f"{c}_Text")))
+             for c in CRITERIA if f"{c}_Score" in row])
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+        return eval_id
+
+    def add_judgement(self, story, judged, model, project, source, position, iteration, meta=None):
+        """
+        Store a regeneration-loop judgement dict (scores, texts, total, tier1, tier2, sound, reasoning)
+        for shortlist item `position` at `iteration` (0 = baseline).
+        """
+        row = {"Model": model, "Project": project, "Original_Story": story,
+               "Total_Score": judged["total"], "Tier_1_Score": judged["tier1"], "Tier_2_Score": judged["tier2"],
+               "Structurally_Sound": judged["sound"], "Reasoning": judged["reasoning"],
+               "Route": judged.get("route")}
+        for c, s in judged["scores"].items():
+            row[f"{c}_Score"] = s
+            row[f"{c}_Text"] = judged["texts"].get(c)
+        return self.add_row(row, source=source, meta=meta, position=position, iteration=iteration)
+
+    def import_frame(self, df, source="master"):
+        """
+        Bulk-load a master / Detailed frame in one transaction. Without a Sheet_Row
+        column, an occurrence's position is its order within (Model, Project).
+        """
+        df = df[df["Model"].notna() & df["Original_Story"].notna()]
+        if "Sheet_Row" in df.columns:
+            positions = df["Sheet_Row"]
+        else:
+            positions = df.groupby(["Model", df["Project"].astype(str)]).cumcount()
+        with self.conn:
+            for row, position in zip(df.to_dict("records"), positions):
+                self.add_row(row, source=source, position=position)
+        self._pending = 0
+        return len(df)
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    # ---------------- querying ----------------
+
+    @staticmethod
+    def _where(**filters):
+        """filters: {"alias.column": value or list of values}; None means no filter."""
+        clauses, args = [], []
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"{col} IN ({', '.join('?' * len(value))})")
+                args.extend(value)
+            else:
+                clauses.append(f"{col} = ?")
+                args.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def scores(self, model=None, project=None, criterion=None, score=None, source=None, story=None):
+        """Per-criterion scores matching every given filter (values or lists of values)."""
+        story_id = None
+        if story is not None:
+            found = self.conn.execute("SELECT story_id FROM stories WHERE canonical = ?",
+                                      (canonical_story(story),)).fetchone()
+            story_id = found[0] if found else -1
+        where, args = self._where(**{"s.model": model, "s.project": project, "s.criterion": criterion,
+                                     "s.score": score, "s.story_id": story_id, "e.source": source})
+        sql = f"""SELECT s.model AS Model, s.project AS Project, e.story_text AS Original_Story,
+                         e.position AS Position, e.iteration AS Iteration,
+                         s.criterion AS Criterion, s.score AS Score, s.text AS Text, e.source AS Source
+                  FROM scores s JOIN evaluations e ON e.eval_id = s.eval_id{where}"""
+        return pd.read_sql_query(sql, self.conn, params=args)
+
+    def aggregate(self, by=("model", "criterion"), model=None, project=None, criterion=None, score=None):
+        """Mean score and count per group, e.g. by=("model", "criterion")."""
+        cols = ", ".join(f"s.{c}" for c in by)
+        where, args = self._where(**{"s.model": model, "s.project": project,
+                                     "s.criterion": criterion, "s.score": score})
+        sql = (f"SELECT {cols}, AVG(s.score) AS Mean_Score, COUNT(*) AS N "
+               f"FROM scores s{where} GROUP BY {cols} ORDER BY {cols}")
+        return pd.read_sql_query(sql, self.conn, params=args)
+
+    def story(self, text):
+        """Every stored evaluation of one story (any source / model / project)."""
+        sql = """SELECT e.* FROM evaluations e
+                 WHERE e.story_id = (SELECT story_id FROM stories WHERE canonical = ?)"""
+        return pd.read_sql_query(sql, self.conn, params=[canonical_story(text)])
+
+    def master_frame(self, model=None, project=None, source=None, position=None, iteration=None):
+        """Master-format frame (one row per evaluation, *_Score / *_Text columns)."""
+        where, args = self._where(**{"e.model": model, "e.project": project, "e.source": source,
+                                     "e.position": position, "e.iteration": iteration})
+        ev = pd.read_sql_query(
+            f"""SELECT e.eval_id, e.model AS Model, e.project AS Project, e.story_text AS Original_Story,
+                       e.total_score AS Total_Score, e.sound AS Structurally_Sound,
+                       e.tier1 AS Tier_1_Score, e.tier2 AS Tier_2_Score, e.reasoning AS Reasoning,
+                       e.route AS Route, e.source AS Source, e.position AS Position, e.iteration AS Iteration
+                FROM evaluations e{where}
+                ORDER BY e.eval_id""", self.conn, params=args)
+        if ev.empty:
+            return ev.drop(columns="eval_id")
+        sc = pd.read_sql_query(
+            f"""SELECT s.eval_id, s.criterion, s.score, s.text FROM scores s
+                JOIN evaluations e ON e.eval_id = s.eval_id{where}""", self.conn, params=args)
+        wide = sc.pivot(index="eval_id", columns="criterion", values=["score", "text"])
+        wide.columns = [f"{c}_{'Score' if kind == 'score' else 'Text'}" for kind, c in wide.columns]
+        ordered = [f"{c}_{k}" for c in CRITERIA for k in ("Score", "Text") if f"{c}_{k}" in wide.columns]
+        ev["Structurally_Sound"] = ev["Structurally_Sound"].map({1: True, 0: False})
+        return ev.join(wide[ordered], on="eval_id").drop(columns="eval_id")
+
+    def trace(self, position=None, iteration=None, source="regeneration"):
+        """Regeneration judgements by shortlist Index (position) and iteration, in loop order."""
+        df = self.master_frame(source=source, position=position, iteration=iteration)
+        return df.sort_values(["Position", "Iteration"], kind="stable").reset_index(drop=True)
+
+    def export_xlsx(self, path, **filters):
+        df = self.master_frame(**filters)
+        df.to_excel(path, index=False)
+        return len(df)
+
+
+def roundtrip_check(master_path):
+    """
+    Import a master into a scratch store and export it again. Returns the
+    mismatching (row, column) cells as a DataFrame (empty when the round trip is exact).
+    """
+    master = pd.read_excel(master_path)
+    master = master[master["Model"].notna() & master["Original_Story"].notna()].reset_index(drop=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResultStore(Path(tmp) / "check.db")
+        store.import_frame(master, source="check")
+        back = store.master_frame(source="check")
+        store.close()
+
+    cols = ["Model", "Project", "Original_Story", "Total_Score"] + \
+           [f"{c}_{k}" for c in CRITERIA for k in ("Score", "Text") if f"{c}_{k}" in master.columns]
+    problems = []
+    if len(back) != len(master):
+        problems.append({"Row": None, "Column": "rows", "Master": len(master), "Store": len(back)})
+    for col in cols:
+        a, b = master[col].reset_index(drop=True), back[col].reindex(range(len(master)))
+        if col.endswith("_Score"):
+            a, b = pd.to_numeric(a, errors="coerce"), pd.to_numeric(b, errors="coerce")
+        else:
+            a, b = a.map(_text), b.map(_text)
+            if col == "Project":
+                a = a.astype(str)
+        same = (a == b) | (a.isna() & b.isna())
+        for i in np.flatnonzero(~same.to_numpy()):
+            problems.append({"Row": int(i), "Column": col, "Master": a[i], "Store": b[i]})
+    return pd.DataFrame(problems, columns=["Row", "Column", "Master", "Store"])
+
+
+def _arg(name, cast=str):
+    return cast(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else None
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "check":
+        problems = roundtrip_check(sys.argv[2])
+        if problems.empty:
+            print(f"✅ Round trip exact: {sys.argv[2]}")
+        else:
+            print(problems.head(20).to_string(index=False))
+            print(f"❌ {len(problems)} mismatching cells")
+        sys.exit(1 if len(problems) else 0)
+    store = ResultStore()
+    if cmd == "import":
+        n = store.import_frame(pd.read_excel(sys.argv[2]))
+        print(f"✅ Imported {n} rows into {store.path}")
+    elif cmd == "query":
+        df = store.scores(model=_arg("--model"), project=_arg("--project"),
+                          criterion=_arg("--criterion"), score=_arg("--score", float))
+        print(df.to_string(index=False, max_colwidth=60))
+        print(f"{len(df)} rows")
+    elif cmd == "export":
+        out = sys.argv[2]
+        n = store.export_xlsx(out, model=_arg("--model"), project=_arg("--project"), source=_arg("--source"))
+        print(f"✅ Saved: {out} ({n} rows)")
+    else:
+        print(__doc__)
+    store.close()
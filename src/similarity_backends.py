@@ -0,0 +1,168 @@
+# src/similarity_backends.py
+"""
+Pluggable semantic-similarity backends.
+
+Every backend is a function columns -> {(cand_model, ref_model): per-row scores},
+with columns = {model: list of texts aligned on the same stories}, i.e. the
+same contract as similarity_engine.bertscore_all_pairs. Pick one with
+QURAL_SIM_BACKEND:
+
+  bertscore - BERTScore F1 (downloads roberta-large on first use; slow on CPU)
+  hashed    - hashed char + word n-gram vectors with SIF-style weighting and
+              common-component removal; no model, no network, CPU-cheap
+  local     - BERTScore F1 with a model from a local directory
+              (QURAL_SIM_MODEL_PATH, optional QURAL_SIM_MODEL_LAYERS)
+"""
+import os
+
+import numpy as np
+
+SIM_BACKEND = os.getenv("QURAL_SIM_BACKEND", "bertscore")
+SIM_MODEL_PATH = os.getenv("QURAL_SIM_MODEL_PATH")
+SIM_MODEL_LAYERS = os.getenv("QURAL_SIM_MODEL_LAYERS")
+
+HASH_FEATURES = 2 ** 20
+CHAR_NGRAMS = (3, 5)
+WORD_NGRAMS = (1, 2)
+SIF_A = 1e-3
+SIF_MIN_TEXTS = 20  # below this the "common component" is mostly the texts themselves
+
+
+def _bertscore_f1(columns, encoder=None):
+    from similarity_engine import bertscore_all_pairs
+    return {pair: prf[2] for pair, prf in bertscore_all_pairs(columns, encoder).items()}
+
+
+def bertscore_backend(columns):
+    return _bertscore_f1(columns)
+
+
+def local_model_backend(columns):
+    from similarity_engine import load_encoder
+
+    if not SIM_MODEL_PATH:
+        raise ValueError("QURAL_SIM_BACKEND=local needs QURAL_SIM_MODEL_PATH")
+    layers = SIM_MODEL_LAYERS
+    if layers is None:
+        from transformers import AutoConfig
+        layers = AutoConfig.from_pretrained(SIM_MODEL_PATH).num_hidden_layers
+    return _bertscore_f1(columns, load_encoder(SIM_MODEL_PATH, num_layers=int(layers)))
+
+
+def _sif_block(texts, vectorizer):
+    """
+    Hashed n-gram counts re-weighted by a / (a + p(feature)) (SIF), L2-normalized.
+    Returns (X, u): the sparse rows and the unit top singular direction
+    (the "common component" shared by all texts), which is projected out lazily.
+    """
+    from sklearn.utils.extmath import randomized_svd
+
+    X = vectorizer.transform(texts).tocsr().astype(np.float64)
+    freq = np.asarray(X.sum(axis=0)).ravel()
+    p = freq / max(freq.sum(), 1.0)
+    X = X.multiply(SIF_A / (SIF_A + p)).tocsr()
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    X = X.multiply(1.0 / norms[:, None]).tocsr()
+    if X.shape[0] < SIF_MIN_TEXTS or X.nnz == 0:
+        return X, None
+    _, _, vt = randomized_svd(X, n_components=1, random_state=0)
+    return X, vt[0]
+
+
+def hashed_backend(columns):
+    """
+    Cosine similarity of SIF-weighted hashed char and word n-gram vectors.
+    The common component is removed without densifying:
+      cos(x - (x.u)u, y - (y.u)u) = (x.y - (x.u)(y.u)) / (|x'| |y'|)
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    models = list(columns)
+    texts = [t for m in models for t in columns[m]]
+    sizes = np.cumsum([0] + [len(columns[m]) for m in models])
+
+    blocks = [slice(sizes[i], sizes[i + 1]) for i in range(len(models))]
+    pairs = [(i, j) for i in range(len(models)) for j in range(i + 1, len(models))]
+
+    # char and word views weigh equally: average the per-view cosines
+    cos = {p: [] for p in pairs}
+    for analyzer, ngrams in (("char_wb", CHAR_NGRAMS), ("word", WORD_NGRAMS)):
+        vec = HashingVectorizer(analyzer=analyzer, ngram_range=ngrams, n_features=HASH_FEATURES,
+                                alternate_sign=False, norm=None, lowercase=True)
+        X, u = _sif_block(texts, vec)
+        xu = X @ u if u is not None else np.zeros(X.shape[0])
+        norm = np.sqrt(np.clip(np.asarray(X.multiply(X).sum(axis=1)).ravel() - xu ** 2, 0, None))
+        for i, j in pairs:
+            a, b = blocks[i], blocks[j]
+            d = np.asarray(X[a].multiply(X[b]).sum(axis=1)).ravel() - xu[a] * xu[b]
+            denom = norm[a] * norm[b]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                cos[(i, j)].append(np.where(denom > 0, d / denom, 0.0))
+
+    out = {}
+    for (i, j), views in cos.items():
+        score = np.clip(np.mean(views, axis=0), 0.0, 1.0)
+        out[(models[i], models[j])] = out[(models[j], models[i])] = score
+    return out
+
+
+BACKENDS = {
+    "bertscore": bertscore_backend,
+    "hashed": hashed_backend,
+    "local": local_model_backend,
+}
+
+
+def get_backend(name=None):
+    name = (name or SIM_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown similarity backend {name!r}; choose from {sorted(BACKENDS)}")
+    return name, BACKENDS[name]
+
+
+def similarity(cands, refs, backend=None):
+    """Per-row similarity of aligned candidate / reference texts."""
+    _, fn = get_backend(backend)
+    return fn({"cand": list(cands), "ref": list(refs)})[("cand", "ref")]
+
+
+def bertscore_model_cached(lang="en"):
+    """Default BERTScore model name, and whether it is in the local Hugging Face cache."""
+    try:
+        from bert_score.utils import lang2model
+        from transformers import AutoConfig, AutoTokenizer
+    except ImportError:
+        return None, False
+    model = lang2model[lang]
+    try:
+        AutoConfig.from_pretrained(model, local_files_only=True)
+        AutoTokenizer.from_pretrained(model, local_files_only=True)
+    except Exception:
+        return model, False
+    return model, True
+
+
+def compare_with_bertscore(columns, scores):
+    """
+    Correlation between a backend's per-row scores and BERTScore F1 over all
+    ordered pairs. Returns None when BERTScore cannot run; nothing is downloaded,
+    so the comparison is skipped unless the model is already cached locally.
+    """
+    from scipy.stats import pearsonr, spearmanr
+
+    model, cached = bertscore_model_cached()
+    if not cached:
+        print(f"⏩ BERTScore comparison skipped: {model or 'bert_score'} is not available locally "
+              f"(run the bertscore backend once with network access to cache it)")
+        return None
+    try:
+        bert = bertscore_backend(columns)
+    except Exception as e:
+        print(f"⚠️ BERTScore unavailable for comparison: {e}")
+        return None
+    pairs = sorted(set(scores) & set(bert))
+    x = np.concatenate([scores[p] for p in pairs])
+    y = np.concatenate([bert[p] for p in pairs])
+    return {"Pairs": len(pairs), "Rows": len(x),
+            "Pearson": float(pearsonr(x, y)[0]), "Spearman": float(spearmanr(x, y)[0])}
@@ -0,0 +1,136 @@
+# src/similarity_engine.py
+"""
+Embed-once BERTScore.
+
+bert_score.score re-encodes both sides of every call, so comparing 5 models
+pairwise encodes each model's evidence texts 8 times. Here every distinct text
+is encoded once, its contextual token embeddings are cached on disk as float32
+(keyed by a hash of model settings + text, so a cold and a warm cache give the
+same scores), and BERTScore P/R/F1 for any model pair is
+computed from the cached embeddings by greedy cosine matching — the same
+computation bert_score does (no idf, no baseline rescaling, [CLS]/[SEP]
+matched but given zero weight).
+
+Scores are symmetric up to swapping P and R, so each unordered pair is scored
+once and mirrored.
+"""
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+BERT_LANG = "en"
+BATCH_SIZE = 64
+CACHE_DIR = Path("outputs/cache/bert_embeddings")
+CACHE_FORMAT = 2  # part of the key: v1 entries were float16 and are not reused
+
+
+def load_encoder(model_type=None, num_layers=None, lang=BERT_LANG, device=None):
+    """Tokenizer + truncated model exactly as bert_score.score would build them."""
+    import torch
+    from bert_score.utils import get_model, get_tokenizer, lang2model, model2layers
+
+    model_type = model_type or lang2model[lang.lower()]
+    if num_layers is None:
+        num_layers = model2layers[model_type]
+    tokenizer = get_tokenizer(model_type, False)
+    model = get_model(model_type, num_layers, False)
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    return {"tokenizer": tokenizer, "model": model, "device": device,
+            "tag": f"{model_type}|L{num_layers}"}
+
+
+def text_key(text, tag):
+    return hashlib.sha1(f"{tag}|v{CACHE_FORMAT}\n{text.strip()}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(key):
+    return CACHE_DIR / key[:2] / f"{key}.npz"
+
+
+def _encode_batch(texts, encoder):
+    from bert_score.utils import get_bert_embedding
+
+    tok = encoder["tokenizer"]
+    idf_dict = defaultdict(lambda: 1.0)
+    idf_dict[tok.sep_token_id] = 0
+    idf_dict[tok.cls_token_id] = 0
+
+    embs, masks, idf = get_bert_embedding(texts, encoder["model"], tok, idf_dict, device=encoder["device"])
+    embs, masks, idf = embs.cpu().numpy(), masks.cpu().numpy(), idf.cpu().numpy()
+    out = []
+    for i in range(len(texts)):
+        n = int(masks[i].sum())
+        out.append((embs[i, :n].astype(np.float32), idf[i, :n].astype(np.float32)))
+    return out
+
+
+def encode_texts(texts, encoder, batch_size=BATCH_SIZE, use_cache=True):
+    """
+    Token embeddings for every distinct text, from the disk cache when present.
+    Returns {text: (unit-normalized embeddings (tokens x dim), token weights)}.
+    """
+    distinct = list(dict.fromkeys(t.strip() for t in texts))
+    stats = {}
+    missing = []
+    for t in distinct:
+        if not t:
+            # empty sentence: nothing to encode, greedy_match scores it 0 like bert_score
+            stats[t] = (np.zeros((0, 1), dtype=np.float32), np.zeros(0, dtype=np.float32))
+            continue
+        path = _cache_path(text_key(t, encoder["tag"]))
+        if use_cache and path.exists():
+            with np.load(path) as z:
+                stats[t] = (z["emb"], z["weights"])
+        else:
+            missing.append(t)
+
+    # longest first, like bert_score, to keep padding per batch small
+    missing.sort(key=lambda t: len(t.split(" ")), reverse=True)
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        for t, (emb, weights) in zip(batch, _encode_batch(batch, encoder)):
+            emb = emb / np.linalg.norm(emb, axis=-1, keepdims=True)
+            stats[t] = (emb, weights)
+            if use_cache:
+                path = _cache_path(text_key(t, encoder["tag"]))
+                path.parent.mkdir(parents=True, exist_ok=True)
+                np.savez(path, emb=emb, weights=weights)
+    return stats
+
+
+def greedy_match(cand, ref):
+    """BERTScore (P, R, F1) for one candidate/reference pair of cached stats."""
+    c_emb, c_w = cand
+    r_emb, r_w = ref
+    # only [CLS] and [SEP] -> empty sentence, bert_score sets the score to 0
+    if c_w.sum() == 0 or r_w.sum() == 0:
+        return 0.0, 0.0, 0.0
+    sim = c_emb @ r_emb.T
+    P = float((sim.max(axis=1) * c_w).sum() / c_w.sum())
+    R = float((sim.max(axis=0) * r_w).sum() / r_w.sum())
+    F = 2 * P * R / (P + R) if (P + R) else 0.0
+    return P, R, F
+
+
+def bertscore_all_pairs(columns, encoder=None):
+    """
+    columns: {model: list of texts}, all aligned on the same stories.
+    Encodes every distinct text once and returns
+    {(cand_model, ref_model): (P, R, F1) arrays} for all ordered pairs.
+    """
+    encoder = encoder or load_encoder()
+    models = list(columns)
+    stats = encode_texts([t for m in models for t in columns[m]], encoder)
+
+    out = {}
+    for i, m1 in enumerate(models):
+        for m2 in models[i + 1:]:
+            scores = np.array([greedy_match(stats[c.strip()], stats[r.strip()])
+                               for c, r in zip(columns[m2], columns[m1])])
+            P, R, F = scores[:, 0], scores[:, 1], scores[:, 2]
+            out[(m2, m1)] = (P, R, F)
+            out[(m1, m2)] = (R, P, F)  # swapping candidate and reference swaps P and R
+    return out
@@ -0,0 +1,122 @@
+# src/stratified_analysis.py
+"""
+Per-project (stratified) agreement and scoring analysis in one grouped pass.
+
+The master is pivoted once to (Project, Story) x Model for every score column.
+Each project is then a 0/1 weight row over those shared arrays, so alpha,
+ICC(2,1) and Spearman/Kendall for all 15 projects come out of the weighted
+estimators in reliability_engine.py in a single evaluation. Project rows
+can be spread across a process pool.
+"""
+import os
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from compute_agreement_metrics import CRITERIA, MASTER
+from evaluator import structural_columns
+from reliability_engine import (
+    alpha_unit_stats, alpha_weighted, icc_unit_stats, icc_weighted,
+    pair_cell_stats, spearman_weighted, kendall_weighted, evaluate_weights,
+)
+
+OUT_DIR = Path("outputs/analysis_stratified")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+ICC_METRICS = ["Total_Score", "Tier_1_Score", "Tier_2_Score"]
+WORKERS = os.cpu_count() or 1
+
+
+def project_indicator(index):
+    """(projects x stories) 0/1 matrix for a (Project, Original_Story) index."""
+    codes, projects = pd.factorize(index.get_level_values("Project"))
+    W = np.zeros((len(projects), len(index)))
+    W[codes, np.arange(len(index))] = 1.0
+    return list(projects), W
+
+
+def stratified_metrics(df, workers=WORKERS):
+    score_cols = [f"{c}_Score" for c in CRITERIA if f"{c}_Score" in df.columns] + ICC_METRICS
+    wide = df.pivot_table(index=["Project", "Original_Story"], columns="Model", values=score_cols, aggfunc="mean")
+
+    alpha_rows, icc_rows, rank_rows = [], [], []
+
+    for col in score_cols:
+        pivot = wide[col].dropna()  # require all models present for that story
+        if pivot.empty:
+            continue
+        projects, W = project_indicator(pivot.index)
+        used = W.sum(axis=1)
+        X = pivot.values
+        models = list(pivot.columns)
+
+        estimators = []
+        if col in ICC_METRICS:
+            estimators.append(partial(icc_weighted, icc_unit_stats(X)))
+            pairs = [(i, j) for i in range(len(models)) for j in range(i + 1, len(models))]
+            for i, j in pairs:
+                stats = pair_cell_stats(X[:, i], X[:, j])
+                estimators += [partial(spearman_weighted, stats), partial(kendall_weighted, stats)]
+        else:
+            estimators.append(partial(alpha_weighted, alpha_unit_stats(X, 0, 2)))
+
+        results = evaluate_weights(estimators, W, workers=workers)
+
+        if col in ICC_METRICS:
+            for p, project in enumerate(projects):
+                icc_rows.append({"Project": project, "Metric": col, "ICC_2_1": results[0][p],
+                                 "Stories_Used": int(used[p]), "Num_Models": len(models)})
+                for q, (i, j) in enumerate(pairs):
+                    rank_rows.append({"Project": project, "Metric": col,
+                                      "Model_A": models[i], "Model_B": models[j],
+                                      "Spearman": results[1 + 2 * q][p], "Kendall": results[2 + 2 * q][p],
+                                      "Stories_Used": int(used[p])})
+        else:
+            for p, project in enumerate(projects):
+                alpha_rows.append({"Project": project, "Criterion": col.replace("_Score", ""),
+                                   "Krippendorff_Alpha_Ordinal": results[0][p], "Stories_Used": int(used[p])})
+
+    return pd.DataFrame(alpha_rows), pd.DataFrame(icc_rows), pd.DataFrame(rank_rows)
+
+
+def detection_rates(df):
+    """Per (Project, Model, Criterion) average score and % of stories with score > 0."""
+    cols = [f"{c}_Score" for c in CRITERIA if f"{c}_Score" in df.columns]
+    scores = df[cols].fillna(0)
+    grouped = pd.concat([scores, (scores > 0).astype(float) * 100.0], axis=1, keys=["AvgScore", "DetectRatePct"])
+    grouped[["Project", "Model"]] = df[["Project", "Model"]]
+    agg = grouped.groupby(["Project", "Model"]).mean()
+    out = agg.stack(level=1, future_stack=True).reset_index().rename(columns={"level_2": "Criterion"})
+    out["Criterion"] = out["Criterion"].str.replace("_Score", "", regex=False)
+    return out[["Project", "Model", "Criterion", "AvgScore", "DetectRatePct"]]
+
+
+def main():
+    df = pd.read_excel(MASTER)
+    df = df[df["Model"].notna() & df["Project"].notna() & df["Original_Story"].notna()].copy()
+
+    for col in [f"{c}_Score" for c in CRITERIA] + ["Total_Score", "Tier_1_Score", "Tier_2_Score"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    tiers = structural_columns(df)
+    for col in ("Tier_1_Score", "Tier_2_Score"):
+        if col not in df.columns:
+            df[col] = tiers[col]
+
+    alpha_df, icc_df, rank_df = stratified_metrics(df)
+    det_df = detection_rates(df)
+
+    out_xlsx = OUT_DIR / "Stratified_Project_Report.xlsx"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        alpha_df.to_excel(xw, sheet_name="Alpha_ByProject", index=False)
+        icc_df.to_excel(xw, sheet_name="ICC_ByProject", index=False)
+        rank_df.to_excel(xw, sheet_name="RankCorr_ByProject", index=False)
+        det_df.to_excel(xw, sheet_name="Detection_ByProject", index=False)
+
+    print("✅ Saved:", out_xlsx)
+    print("Projects analysed:", df["Project"].nunique())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# src/synthetic_master.py
+"""
+Synthetic master generator for benchmarking the analytics stack at scale.
+
+Produces a master-format frame (same columns as Master_QURAL_Analysis.xlsx)
+for any number of stories and models:
+
+  - scores come from a latent quality per story and criterion (a shared story
+    factor plus a criterion effect, offsets calibrated to the real master's
+    per-criterion score mix) cut at two thresholds into 0 / 1 / 2;
+  - raters are correlated through that latent and differ by an overall bias,
+    per-criterion leniency and their own noise level (agreement lands between
+    the real master's, which is close to chance for most criteria, and that
+    of consistent raters);
+  - story texts are unique "As a ..., I want to ... so that ..." stories; the
+    evidence text for a criterion is the clause it refers to, sometimes
+    trimmed by the rater, or "N/A" when the score is 0;
+  - projects have ~STORIES_PER_PROJECT stories each;
+  - a small share of totals are mis-added, like real judge output.
+
+Text columns are generated only up to TEXT_MAX_ROWS rows (stories x models);
+larger frames carry scores only.
+
+Usage:
+    python src/synthetic_master.py 1000 5              # stories, models
+    python src/synthetic_master.py 100000 20 --no-text
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from evaluator import analyze_structural_quality_batch
+
+OUT_DIR = Path("outputs/benchmarks")
+
+# master column order
+CRITERIA = [
+    "Task Identification", "Task Nature", "Role Identification", "Acceptance Criteria",
+    "Dependency", "Business Need", "Priority", "Quality Requirement", "Estimable",
+    "Unambiguous", "Well Formed", "Problem Oriented", "Unique", "Testable",
+]
+SEED = 42
+STORIES_PER_PROJECT = 36
+TEXT_MAX_ROWS = 500_000
+MISADDED_TOTALS = 0.03
+CUTS = (-0.5, 0.7)  # latent -> 0 / 1 / 2
+OFFSET_SCALE = 1.3  # keeps the score mix close to the master's at this rater noise level
+
+# latent offsets: Role Identification is almost always 2, Priority / Dependency /
+# Quality Requirement are mostly 0, as in the real master
+CRITERION_OFFSET = {
+    "Task Identification": 2.0, "Task Nature": 1.0, "Role Identification": 3.5,
+    "Acceptance Criteria": -1.25, "Dependency": -1.5, "Business Need": 0.8,
+    "Priority": -1.55, "Quality Requirement": -1.5, "Estimable": -0.2,
+    "Unambiguous": 0.8, "Well Formed": 1.5, "Problem Oriented": 1.2,
+    "Unique": 1.7, "Testable": 0.1,
+}
+# which story clause each criterion quotes: 0 role, 1 action, 2 benefit, 3 acceptance, 4 whole story
+CRITERION_CLAUSE = {
+    "Task Identification": 1, "Task Nature": 1, "Role Identification": 0,
+    "Acceptance Criteria": 3, "Dependency": 1, "Business Need": 2, "Priority": 1,
+    "Quality Requirement": 3, "Estimable": 1, "Unambiguous": 4, "Well Formed": 4,
+    "Problem Oriented": 1, "Unique": 1, "Testable": 3,
+}
+
+ROLES = ["user", "administrator", "data analyst", "researcher", "camp administrator", "developer",
+         "project manager", "librarian", "customer", "site visitor", "moderator", "teacher",
+         "student", "support agent", "archivist", "editor", "reviewer", "publisher", "curator", "auditor"]
+VERBS = ["upload", "download", "compare", "export", "import", "search", "filter", "delete", "archive",
+         "share", "tag", "review", "approve", "reject", "edit", "merge", "validate", "schedule",
+         "publish", "subscribe to", "visualize", "annotate", "reset", "restore", "sort", "print",
+         "bookmark", "translate", "rate", "flag", "preview", "duplicate", "rename", "lock", "unlock",
+         "assign", "track", "summarize", "configure", "monitor"]
+NOUNS = ["dataset", "datapackage", "report", "user account", "password", "camp record", "schema",
+         "dashboard", "invoice", "profile", "comment", "document", "workflow", "calendar entry",
+         "notification", "search result", "map layer", "metadata record", "collection", "playlist",
+         "order", "ticket", "survey", "form", "catalogue entry", "image", "license", "budget",
+         "timetable", "inventory item", "contract", "feedback entry", "release note", "API key",
+         "backup", "audit log", "course", "grade", "reservation", "shipment", "payment", "policy",
+         "template", "label", "sensor reading", "transcript", "photo album", "recipe", "venue",
+         "membership", "newsletter", "question", "answer", "version", "branch", "task list",
+         "message", "attachment", "review queue", "tag cloud"]
+BENEFITS = ["I can save time", "I can keep the records organized", "I can see changes clearly",
+            "others can reuse my work", "I can meet the reporting deadline", "I avoid duplicate work",
+            "I can share results with my team", "I can trust the data", "I can respond to users faster",
+            "I can plan my week", "mistakes are caught early", "the data stays consistent",
+            "I can find what I need quickly", "I can prove compliance", "the team stays informed",
+            "I can work offline", "I can track progress", "costs stay under control",
+            "users get accurate information", "I can recover from errors"]
+
+
+def _story_texts(n, rng):
+    """n unique stories and their clauses (role, action, benefit, acceptance)."""
+    radix = [len(ROLES), len(VERBS), len(NOUNS), len(BENEFITS)]
+    space = int(np.prod(radix))
+    codes = rng.permutation(space)[:n] if n <= space else np.arange(n)
+    variant = codes // space
+    codes = codes % space
+    idx = []
+    for r in radix:
+        idx.append(codes % r)
+        codes = codes // r
+    role_i, verb_i, noun_i, ben_i = idx
+    has_ac = rng.random(n) < 0.35
+
+    role = np.array([f"As a {ROLES[i]}" for i in role_i], dtype=object)
+    action = np.array([f"I want to {VERBS[v]} the {NOUNS[k]}" + (f" (variant {x})" if x else "")
+                       for v, k, x in zip(verb_i, noun_i, variant)], dtype=object)
+    benefit = np.array([f"so that {BENEFITS[i]}" for i in ben_i], dtype=object)
+    accept = np.array([f"Acceptance criteria: given a valid {NOUNS[k]}, when I {VERBS[v]} it, then the result is shown within 2 seconds" if a else ""
+                       for v, k, a in zip(verb_i, noun_i, has_ac)], dtype=object)
+    story = np.array([f"{r}, {a}, {b}." + (f" {c}." if c else "")
+                      for r, a, b, c in zip(role, action, benefit, accept)], dtype=object)
+    return story, np.stack([role, action, benefit, accept, story], axis=1)
+
+
+def _trim(texts):
+    """Rater variation: quote the clause without its first word."""
+    return np.array([t.split(" ", 1)[1] if " " in t else t for t in texts], dtype=object)
+
+
+def generate_master(n_stories, n_models, with_text=None, seed=SEED):
+    """Master-format DataFrame with n_stories x n_models rows."""
+    rng = np.random.default_rng(seed)
+    if with_text is None:
+        with_text = n_stories * n_models <= TEXT_MAX_ROWS
+
+    n_projects = max(1, int(round(n_stories / STORIES_PER_PROJECT)))
+    project = np.sort(rng.integers(0, n_projects, n_stories))
+    project_names = np.array([f"P{p + 1:05d}" for p in range(n_projects)], dtype=object)[project]
+    story, clauses = _story_texts(n_stories, rng)
+    if with_text:
+        trimmed = np.stack([_trim(clauses[:, j]) for j in range(clauses.shape[1])], axis=1)
+
+    offset = OFFSET_SCALE * np.array([CRITERION_OFFSET[c] for c in CRITERIA])
+    latent = offset[None, :] + 0.8 * rng.normal(size=(n_stories, 1)) + 0.8 * rng.normal(size=(n_stories, len(CRITERIA)))
+
+    bias = rng.normal(0, 0.6, n_models)
+    leniency = rng.normal(0, 0.5, (n_models, len(CRITERIA)))
+    noise = rng.uniform(0.9, 1.5, n_models)
+    trim_rate = rng.uniform(0.0, 0.3, n_models)
+
+    frames = []
+    for m in range(n_models):
+        z = latent + bias[m] + leniency[m][None, :] + noise[m] * rng.normal(size=latent.shape)
+        scores = ((z > CUTS[0]).astype(np.int8) + (z > CUTS[1]).astype(np.int8))
+        tier1, tier2, sound = analyze_structural_quality_batch(scores, criteria=CRITERIA)
+        total = scores.sum(axis=1).astype(int)
+        misadd = rng.random(n_stories) < MISADDED_TOTALS
+        total[misadd] += rng.choice([-2, -1, 1, 2], misadd.sum())
+
+        cols = {
+            "Model": np.full(n_stories, f"Model-{m + 1:02d}", dtype=object),
+            "Project": project_names,
+            "Original_Story": story,
+            "Total_Score": np.clip(total, 0, 2 * len(CRITERIA)),
+            "Structurally_Sound": sound,
+            "Tier_1_Score": tier1.astype(int),
+            "Tier_2_Score": tier2.astype(int),
+            "Reasoning": "Synthetic judgement.",
+        }
+        trim = rng.random(n_stories) < trim_rate[m] if with_text else None
+        for j, c in enumerate(CRITERIA):
+            cols[f"{c}_Score"] = scores[:, j]
+            if with_text:
+                k = CRITERION_CLAUSE[c]
+                quoted = np.where(trim, trimmed[:, k], clauses[:, k])
+                cols[f"{c}_Text"] = np.where((scores[:, j] > 0) & (quoted != ""), quoted, "N/A")
+        frames.append(pd.DataFrame(cols))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n_stories = int(args[0]) if args else 1000
+    n_models = int(args[1]) if len(args) > 1 else 5
+    df = generate_master(n_stories, n_models, with_text=False if "--no-text" in sys.argv else None)
+    out = OUT_DIR / f"Synthetic_Master_{n_stories}x{n_models}.xlsx"
+    df.to_excel(out, index=False)
+    print(f"✅ Saved: {out} ({len(df)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# src/verify_evidence.py
+"""
+Evidence verification: is every <criterion>_Text cell an exact substring of
+its story, as SYSTEM_PROMPT requires?
+
+Each distinct story is normalized once (casefold, unified quotes/dashes,
+collapsed whitespace) together with a map from normalized positions back to
+original character offsets. Every evidence cell for that story is then looked
+up with str.find, first raw, then normalized. Cells that still do not match
+get a difflib fallback score (how densely the evidence characters align, in
+order, with one stretch of the story). Each distinct (story, text) pair is
+checked once, so exact/normalized lookups stay linear in the total length of
+stories + evidence; only the unmatched remainder pays for difflib.
+
+Status per cell:
+  exact        - raw substring of the story
+  normalized   - substring after normalization (case / whitespace / quotes)
+  fuzzy        - fallback score >= FUZZY_THRESHOLD (paraphrased or trimmed)
+  hallucinated - everything else
+  empty        - N/A, "N/A (AI Format Error)" or blank (not counted in rates)
+"""
+import difflib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from compute_agreement_metrics import CRITERIA, MASTER
+
+OUT_DIR = Path("outputs/analysis_evidence")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+FUZZY_THRESHOLD = 0.9
+EMPTY_TEXTS = {"", "n/a", "n/a (ai format error)"}  # main.build_row writes the latter for malformed cells
+
+_CHAR_MAP = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", " ": " ",
+})
+
+
+def normalize_with_offsets(text):
+    """Normalized text and, for each of its characters, the offset in the original."""
+    out, offsets = [], []
+    prev_space = True  # also strips leading whitespace
+    for i, ch in enumerate(text.translate(_CHAR_MAP)):
+        if ch.isspace():
+            if prev_space:
+                continue
+            out.append(" ")
+            offsets.append(i)
+            prev_space = True
+            continue
+        for c in ch.casefold():
+            out.append(c)
+            offsets.append(i)
+        prev_space = False
+    if out and out[-1] == " ":
+        out.pop()
+        offsets.pop()
+    return "".join(out), offsets
+
+
+def normalize(text):
+    return normalize_with_offsets(text)[0]
+
+
+def fuzzy_locate(needle, haystack):
+    """
+    (score, start, end) of the in-order character alignment of needle in haystack.
+    score = 2 * matched / (len(needle) + span length), so characters scattered
+    over a long stretch of the story do not count as a match.
+    """
+    sm = difflib.SequenceMatcher(None, needle, haystack, autojunk=False)
+    blocks = [b for b in sm.get_matching_blocks() if b.size]
+    if not blocks:
+        return 0.0, -1, -1
+    matched = sum(b.size for b in blocks)
+    start, end = blocks[0].b, blocks[-1].b + blocks[-1].size
+    return 2.0 * matched / (len(needle) + end - start), start, end
+
+
+class StoryIndex:
+    """One story, normalized once, answering evidence lookups with original offsets."""
+
+    def __init__(self, story):
+        self.story = story
+        self.norm, self.offsets = normalize_with_offsets(story)
+
+    def _span(self, start, end):
+        # normalized [start, end) -> original [start, end)
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+    def locate(self, text):
+        """Returns (status, start, end, score)."""
+        text = text.strip()
+        if text.lower() in EMPTY_TEXTS:
+            return "empty", -1, -1, np.nan
+
+        pos = self.story.find(text)
+        if pos >= 0:
+            return "exact", pos, pos + len(text), 1.0
+
+        needle = normalize(text)
+        pos = self.norm.find(needle)
+        if pos >= 0:
+            start, end = self._span(pos, pos + len(needle))
+            return "normalized", start, end, 1.0
+
+        score, s, e = fuzzy_locate(needle, self.norm)
+        if s < 0:
+            return "hallucinated", -1, -1, 0.0
+        start, end = self._span(s, e)
+        return ("fuzzy" if score >= FUZZY_THRESHOLD else "hallucinated"), start, end, score
+
+
+def evidence_cells(df):
+    """Long (Model, Project, Original_Story, Criterion, Text) table of evidence cells."""
+    df = df[df["Model"].notna() & df["Original_Story"].notna()]
+    text_cols = [f"{c}_Text" for c in CRITERIA if f"{c}_Text" in df.columns]
+    cells = df.melt(id_vars=["Model", "Project", "Original_Story"], value_vars=text_cols,
+                    var_name="Criterion", value_name="Text")
+    cells["Criterion"] = cells["Criterion"].str.replace("_Text", "", regex=False)
+    cells["Text"] = cells["Text"].fillna("").astype(str)
+    cells["Original_Story"] = cells["Original_Story"].astype(str)
+    return cells.reset_index(drop=True)
+
+
+def verify_cells(cells):
+    """Adds Status, Start, End, Match_Score; every distinct (story, text) is checked once."""
+    results = {}
+    for story, texts in cells.groupby("Original_Story", sort=False)["Text"]:
+        index = StoryIndex(story)
+        for t in texts.unique():
+            results[(story, t)] = index.locate(t)
+
+    located = [results[(s, t)] for s, t in zip(cells["Original_Story"], cells["Text"])]
+    out = cells.copy()
+    out[["Status", "Start", "End", "Match_Score"]] = pd.DataFrame(located, index=cells.index)
+    return out
+
+
+def hallucination_rates(verified, by=("Model",)):
+    """Status counts and hallucination rate over non-empty cells."""
+    by = list(by)
+    counts = verified[verified["Status"] != "empty"].pivot_table(
+        index=by, columns="Status", values="Text", aggfunc="size", fill_value=0)
+    for s in ["exact", "normalized", "fuzzy", "hallucinated"]:
+        if s not in counts.columns:
+            counts[s] = 0
+    counts = counts[["exact", "normalized", "fuzzy", "hallucinated"]]
+    counts["Evidence_Cells"] = counts.sum(axis=1)
+    counts["Hallucination_Rate"] = counts["hallucinated"] / counts["Evidence_Cells"]
+    counts["Exact_Rate"] = counts["exact"] / counts["Evidence_Cells"]
+    return counts.reset_index()
+
+
+def main():
+    df = pd.read_excel(MASTER)
+    cells = evidence_cells(df)
+    print(f"🔎 Verifying {len(cells)} evidence cells over {cells['Original_Story'].nunique()} stories...")
+    verified = verify_cells(cells)
+
+    by_model = hallucination_rates(verified).sort_values("Hallucination_Rate")
+    by_criterion = hallucination_rates(verified, by=("Model", "Criterion"))
+
+    out_xlsx = OUT_DIR / "Evidence_Verification.xlsx"
+    out_csv = OUT_DIR / "Evidence_Spans.csv"
+    with pd.ExcelWriter(out_xlsx) as xw:
+        by_model.to_excel(xw, sheet_name="Model_Rates", index=False)
+        by_criterion.to_excel(xw, sheet_name="Model_Criterion_Rates", index=False)
+        verified[verified["Status"].isin(["fuzzy", "hallucinated"])].to_excel(xw, sheet_name="Unverified_Cells", index=False)
+    verified.to_csv(out_csv, index=False)
+
+    print(by_model[["Model", "Evidence_Cells", "Hallucination_Rate", "Exact_Rate"]].to_string(index=False))
+    print("✅ Saved:")
+    print(" -", out_xlsx)
+    print(" -", out_csv)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+
+def pytest_configure(config):
+    # the analysis scripts create their outputs/ folders on import: keep them out of the tree
+    os.chdir(tempfile.mkdtemp(prefix="qural-tests-"))
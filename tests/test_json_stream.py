@@ -0,0 +1,190 @@
+# tests/test_json_stream.py
+import json
+
+import pytest
+
+from json_stream import QURAL_SCHEMA, CRITERIA, IncrementalJSONValidator, SchemaViolation
+
+
+def response(**overrides):
+    body = {
+        "evaluations": {c: {"score": 2, "text": "As a user"} for c in CRITERIA},
+        "total_score": 28,
+        "reasoning": "Clear story.",
+    }
+    body.update(overrides)
+    return json.dumps(body)
+
+
+def feed(text, schema=QURAL_SCHEMA, chunk=1):
+    v = IncrementalJSONValidator(schema)
+    for i in range(0, len(text), chunk):
+        v.feed(text[i:i + chunk])
+    return v
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 10_000])
+def test_valid_response_passes_in_any_chunking(chunk):
+    assert feed(response(), chunk=chunk).done
+
+
+def test_fences_and_trailing_text_are_ignored():
+    assert feed("```json\n" + response() + "\n```\nDone.").done
+
+
+def test_every_truncation_of_a_valid_response_is_pending_not_violating():
+    text = response()
+    for cut in range(len(text)):
+        v = feed(text[:cut])
+        assert not v.done
+
+
+def test_truncated_response_is_left_to_the_final_parse():
+    text = response()[:-40]
+    assert not feed(text).done
+    with pytest.raises(ValueError):
+        json.loads(text)
+
+
+@pytest.mark.parametrize("text", [
+    '{"total_score": null}',
+    '{"reasoning": null}',
+    '{"evaluations": {"Testable": {"score": null}}}',
+    '{"evaluations": null}',
+])
+def test_null_where_the_schema_wants_a_value(text):
+    with pytest.raises(SchemaViolation):
+        feed(text)
+
+
+def test_null_and_literals_accepted_where_there_is_no_rule():
+    assert feed('{"a": null, "b": [true, false, null]}', schema={}).done
+
+
+@pytest.mark.parametrize("token", ["nul", "nulll", "nan", "-inf", "01", "1.", "+1", "1e", "--1", "1_0"])
+def test_invalid_scalar_tokens(token):
+    with pytest.raises(SchemaViolation):
+        feed('{"a": %s}' % token, schema={})
+
+
+@pytest.mark.parametrize("number", ["0", "-1", "1.5", "2e0", "1E+1", "-0.25e-3"])
+def test_json_numbers(number):
+    assert feed('{"a": %s}' % number, schema={}).done
+
+
+def test_escaped_quotes_and_backslashes_stay_inside_the_string():
+    text = response(reasoning='She said "no" \\ then {"total_score": 99}')
+    assert feed(text).done
+
+
+def test_unicode_escapes_are_decoded_before_key_checks():
+    text = response().replace('"Testable"', '"Test\\u0061ble"')
+    assert feed(text).done
+    with pytest.raises(SchemaViolation):
+        feed(response().replace('"Testable"', '"Test\\u0062ble"'))
+
+
+@pytest.mark.parametrize("escape", ["\\x41", "\\u12", "\\uzzzz"])
+def test_invalid_escapes(escape):
+    with pytest.raises(SchemaViolation):
+        feed('{"reasoning": "a%sb"}' % escape)
+
+
+def test_string_score_in_range_checked():
+    assert feed(response(total_score="28")).done
+    with pytest.raises(SchemaViolation):
+        feed(response(total_score="29"))
+
+
+@pytest.mark.parametrize("text, reason", [
+    (response(extra=1), "unexpected key"),
+    (response(total_score=30), "outside"),
+    (response().replace('"score": 2', '"score": 3', 1), "outside"),
+    (response().replace('"text": "As a user"', '"text": 5', 1), "expected string"),
+    (response(reasoning=["a"]), "expected string"),
+    (response(evaluations=[1, 2]), "expected object"),
+])
+def test_schema_violations(text, reason):
+    with pytest.raises(SchemaViolation, match=reason):
+        feed(text)
+
+
+def test_violation_is_raised_at_the_offending_character():
+    text = response(total_score=30)
+    cut = text.index("30") + 3  # the value ends at the next ',' or '}'
+    with pytest.raises(SchemaViolation):
+        feed(text[:cut])
+    assert not feed(text[:cut - 1]).done
+
+
+def test_bare_scores_accepted_like_build_row():
+    evals = {c: 1 for c in CRITERIA}
+    assert feed(response(evaluations=evals)).done
+
+
+NESTED = {
+    (): {"type": "object"},
+    ("a",): {"type": "array"},
+    ("a", "*"): {"type": "object", "keys": ["b"]},
+    ("a", "*", "b"): {"type": "array"},
+    ("a", "*", "b", "*"): {"type": "number", "range": (0, 9)},
+}
+
+
+def test_nested_arrays_and_objects():
+    assert feed('{"a": [{"b": [1, 2]}, {"b": []}], "c": {"d": {"e": [{}, [[]], {"f": [null]}]}}}', NESTED).done
+    with pytest.raises(SchemaViolation):
+        feed('{"a": [{"b": [1, 10]}]}', NESTED)
+    with pytest.raises(SchemaViolation):
+        feed('{"a": [{"b": [1]}, {"x": 1}]}', NESTED)
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": [1, 2}',
+    '{"a": {"b": 1]}',
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{a: 1}',
+    '{"a": 1,}',
+    '{"a": [1,]}',
+    '{"a": [,1]}',
+    '{,}',
+])
+def test_syntax_errors(text):
+    with pytest.raises(SchemaViolation):
+        feed(text, schema={})
+
+
+def test_empty_containers():
+    assert feed('{"a": {}, "b": []}', schema={}).done
+    assert feed("{}", schema={}).done
+
+
+def test_agrees_with_json_on_mutated_responses():
+    import random
+    base = json.dumps({"evaluations": {"Testable": {"score": 2, "text": 'a "b" \\ é'}},
+                       "total_score": 2, "n": [1, -2.5e3, None, True, [], {}]}, ensure_ascii=False)
+    rng = random.Random(0)
+    alphabet = list('{}[]",:\\ 0123456789-+.eEtrufalsn')
+    decoder = json.JSONDecoder(strict=False)
+    for _ in range(5000):
+        t = list(base)
+        for _ in range(rng.randint(1, 3)):
+            i, op = rng.randrange(1, len(t)), rng.random()
+            if op < 0.4:
+                t[i] = rng.choice(alphabet)
+            elif op < 0.7:
+                t.insert(i, rng.choice(alphabet))
+            else:
+                del t[i]
+        text = "".join(t)
+        try:
+            valid = feed(text, schema={}, chunk=5).done
+        except SchemaViolation:
+            valid = False
+        try:
+            decoder.raw_decode(text)  # the first complete object; trailing text is ignored by both
+            parses = True
+        except ValueError:
+            parses = False
+        assert valid == parses, text
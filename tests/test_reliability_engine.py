@@ -0,0 +1,134 @@
+# tests/test_reliability_engine.py
+"""
+The weighted-matrix estimators in reliability_engine must reproduce the scalar
+baseline on the real master: compute_agreement_metrics' alpha / ICC and
+scipy's Spearman / Kendall, for the point estimate (W = ones) and for any
+weight row (bootstrap counts, 0/1 subsets) read as a resampled data set.
+"""
+import warnings
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import kendalltau, spearmanr
+
+from conftest import ROOT
+from compute_agreement_metrics import CRITERIA, build_pivot, icc_2_1, krippendorff_alpha_ordinal
+from evaluator import structural_columns
+from rank_correlation import rank_correlation_cube
+from reliability_engine import (
+    alpha_unit_stats, alpha_weighted, bootstrap_replicates, bootstrap_weights, icc_unit_stats,
+    icc_weighted, kendall_weighted, pair_cell_stats, spearman_weighted,
+)
+
+TOL = 1e-12
+SCORE_COLS = [f"{c}_Score" for c in CRITERIA]
+TOTAL_COLS = ["Total_Score", "Tier_1_Score", "Tier_2_Score"]
+
+
+@pytest.fixture(scope="module")
+def pivots():
+    df = pd.read_excel(ROOT / "Master_QURAL_Analysis.xlsx")
+    df["Total_Score"] = pd.to_numeric(df["Total_Score"], errors="coerce")
+    tiers = structural_columns(df)
+    for col in ("Tier_1_Score", "Tier_2_Score"):
+        if col not in df.columns:
+            df[col] = tiers[col]
+    for col in SCORE_COLS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return {col: build_pivot(df, col) for col in TOTAL_COLS + SCORE_COLS}
+
+
+def resample_rows(n_units, n_rows=4, seed=0):
+    """Bootstrap count rows and 0/1 subset rows over n_units."""
+    rng = np.random.default_rng(seed)
+    counts = bootstrap_weights(n_units, n_rows, rng)
+    subsets = (rng.random((n_rows, n_units)) < 0.5).astype(int)
+    return np.vstack([counts, subsets])
+
+
+def scipy_rank(x, y):
+    """(Spearman rho, Kendall tau-b) from scipy, NaN for constant columns."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return spearmanr(x, y)[0], kendalltau(x, y)[0]
+
+
+def model_pairs(pivot):
+    models = list(pivot.columns)
+    return [(a, b) for i, a in enumerate(models) for b in models[i + 1:]]
+
+
+@pytest.mark.parametrize("col", SCORE_COLS)
+def test_alpha_point_estimate_matches_scalar(pivots, col):
+    X = pivots[col].values
+    got = alpha_weighted(alpha_unit_stats(X, 0, 2), np.ones((1, len(X))), 0, 2)[0]
+    assert got == pytest.approx(krippendorff_alpha_ordinal(X, 0, 2), abs=TOL, nan_ok=True)
+
+
+@pytest.mark.parametrize("col", TOTAL_COLS + SCORE_COLS)
+def test_icc_point_estimate_matches_scalar(pivots, col):
+    X = pivots[col].values
+    got = icc_weighted(icc_unit_stats(X), np.ones((1, len(X))))[0]
+    assert got == pytest.approx(icc_2_1(X), abs=TOL, nan_ok=True)
+
+
+@pytest.mark.parametrize("col", TOTAL_COLS + SCORE_COLS)
+def test_rank_correlations_match_scipy(pivots, col):
+    pivot = pivots[col]
+    ones = np.ones((1, len(pivot)))
+    for a, b in model_pairs(pivot):
+        stats = pair_cell_stats(pivot[a].values, pivot[b].values)
+        rho, tau = scipy_rank(pivot[a], pivot[b])
+        assert spearman_weighted(stats, ones)[0] == pytest.approx(rho, abs=TOL, nan_ok=True)
+        assert kendall_weighted(stats, ones)[0] == pytest.approx(tau, abs=TOL, nan_ok=True)
+
+
+def test_rank_correlation_cube_matches_scipy(pivots):
+    models = list(pivots["Total_Score"].columns)
+    columns, spearman, kendall = rank_correlation_cube(pivots, models)
+    for c, col in enumerate(columns):
+        pivot = pivots[col]
+        for a, b in model_pairs(pivot):
+            i, j = models.index(a), models.index(b)
+            rho, tau = scipy_rank(pivot[a], pivot[b])
+            assert spearman[c, i, j] == pytest.approx(rho, abs=TOL, nan_ok=True)
+            assert kendall[c, i, j] == pytest.approx(tau, abs=TOL, nan_ok=True)
+
+
+@pytest.mark.parametrize("col", ["Acceptance Criteria_Score", "Priority_Score", "Testable_Score"])
+def test_alpha_weight_rows_equal_resampled_data(pivots, col):
+    X = pivots[col].values
+    W = resample_rows(len(X))
+    got = alpha_weighted(alpha_unit_stats(X, 0, 2), W, 0, 2)
+    want = [krippendorff_alpha_ordinal(np.repeat(X, w, axis=0), 0, 2) for w in W]
+    np.testing.assert_allclose(got, want, rtol=0, atol=TOL)
+
+
+@pytest.mark.parametrize("col", TOTAL_COLS)
+def test_icc_weight_rows_equal_resampled_data(pivots, col):
+    X = pivots[col].values
+    W = resample_rows(len(X))
+    got = icc_weighted(icc_unit_stats(X), W)
+    want = [icc_2_1(np.repeat(X, w, axis=0)) for w in W]
+    np.testing.assert_allclose(got, want, rtol=0, atol=TOL)
+
+
+def test_rank_weight_rows_equal_resampled_data(pivots):
+    pivot = pivots["Total_Score"]
+    W = resample_rows(len(pivot))
+    for a, b in model_pairs(pivot):
+        x, y = pivot[a].values, pivot[b].values
+        stats = pair_cell_stats(x, y)
+        rho, tau = zip(*(scipy_rank(np.repeat(x, w), np.repeat(y, w)) for w in W))
+        np.testing.assert_allclose(spearman_weighted(stats, W), rho, rtol=0, atol=TOL)
+        np.testing.assert_allclose(kendall_weighted(stats, W), tau, rtol=0, atol=TOL)
+
+
+def test_bootstrap_replicates_do_not_depend_on_workers(pivots):
+    X = pivots["Total_Score"].values
+    estimators = [partial(icc_weighted, icc_unit_stats(X))]
+    one, = bootstrap_replicates(estimators, len(X), n_boot=600, workers=1)
+    two, = bootstrap_replicates(estimators, len(X), n_boot=600, workers=2)
+    np.testing.assert_array_equal(one, two)